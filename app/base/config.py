@@ -1,13 +1,9 @@
 import logging
 import os
-from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Any
 
-from fastapi import FastAPI
-from mongodb_odm import connect, disconnect
-
-from app.base.config_utils import comma_separated_str_to_list
+from app.base.config_utils import comma_separated_str_to_list, str_to_bool
 
 logger = logging.getLogger(__name__)
 
@@ -25,15 +21,81 @@ SITE_URL = os.environ.get("SITE_URL")
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+MEDIA_URL = "/media/"
+MEDIA_MAX_UPLOAD_SIZE = int(os.environ.get("MEDIA_MAX_UPLOAD_SIZE", 5 * 1024 * 1024))
+# Browser cache lifetime of media files, content-addressed files never change.
+MEDIA_MAX_AGE = int(os.environ.get("MEDIA_MAX_AGE", 60 * 60))
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# Where media files are kept, "local" (MEDIA_ROOT) or "s3" for any S3 compatible
+# store. With s3 the media route redirects to presigned URLs.
+MEDIA_STORAGE = os.environ.get("MEDIA_STORAGE", "local")
+S3_BUCKET = os.environ.get("S3_BUCKET", "media")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
+S3_REGION = os.environ.get("S3_REGION")
+S3_ACCESS_KEY_ID = os.environ.get("S3_ACCESS_KEY_ID")
+S3_SECRET_ACCESS_KEY = os.environ.get("S3_SECRET_ACCESS_KEY")
+S3_PRESIGNED_URL_TTL = int(os.environ.get("S3_PRESIGNED_URL_TTL", 60 * 60))
+# Parts can not be smaller than 5MB, except the last one.
+S3_MULTIPART_THRESHOLD = int(os.environ.get("S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024))
+S3_MULTIPART_CHUNK_SIZE = int(
+    os.environ.get("S3_MULTIPART_CHUNK_SIZE", 8 * 1024 * 1024)
+)
+# Resized variants of uploaded images
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+IMAGE_MAX_PENDING = int(os.environ.get("IMAGE_MAX_PENDING", 32))
+MEDIA_DERIVATIVE_CACHE_SIZE = int(
+    os.environ.get("MEDIA_DERIVATIVE_CACHE_SIZE", 1024 * 1024 * 1024)
+)
+# Store uploads under a path derived from their sha256, same content is kept once.
+MEDIA_CONTENT_ADDRESSED = str_to_bool(os.environ.get("MEDIA_CONTENT_ADDRESSED", "true"))
 
-LOG_LEVEL = "INFO" if DEBUG is True else "INFO"
+# Worker processes for bcrypt hashing, 0 runs the hashing in the thread pool.
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 64))
+
+# Authenticated user cache. Other workers only notice a user write once their
+# entry expires, so keep the TTL short.
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 60))
+USER_CACHE_MAX_SIZE = int(os.environ.get("USER_CACHE_MAX_SIZE", 10000))
+
+# Post counters are written in batches, 0 writes every increment immediately.
+COUNTER_FLUSH_INTERVAL = float(os.environ.get("COUNTER_FLUSH_INTERVAL", 1))
+COUNTER_FLUSH_MAX_SIZE = int(os.environ.get("COUNTER_FLUSH_MAX_SIZE", 1000))
+
+# Cached public responses. Without RESPONSE_CACHE_URL (redis://...) every worker
+# keeps its own copy in memory.
+RESPONSE_CACHE_URL = os.environ.get("RESPONSE_CACHE_URL")
+RESPONSE_CACHE_MAX_SIZE = int(os.environ.get("RESPONSE_CACHE_MAX_SIZE", 1000))
+POST_FEED_CACHE_TTL = float(os.environ.get("POST_FEED_CACHE_TTL", 10))
+# Post details are served stale for STALE_TTL more seconds while refreshing.
+POST_DETAILS_CACHE_TTL = float(os.environ.get("POST_DETAILS_CACHE_TTL", 30))
+POST_DETAILS_CACHE_STALE_TTL = float(
+    os.environ.get("POST_DETAILS_CACHE_STALE_TTL", 300)
+)
 
+# Topics are served from memory. Without change streams (standalone mongod) the
+# catalog is refreshed every TOPIC_CATALOG_REFRESH_INTERVAL seconds, 0 disables it.
+TOPIC_CATALOG_REFRESH_INTERVAL = float(
+    os.environ.get("TOPIC_CATALOG_REFRESH_INTERVAL", 30)
+)
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):  # type: ignore
-    connect(MONGO_URL)
-    yield
-    disconnect()
+# Prometheus metrics are served on this port, keep it out of the public
+# ingress. 0 disables them.
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9100))
+
+# Requests sending more MongoDB commands are logged, 0 disables the check.
+MONGO_QUERY_BUDGET = int(os.environ.get("MONGO_QUERY_BUDGET", 10))
+
+# Request profiles are saved in PROFILING_DIR. A share of PROFILING_SAMPLE_RATE
+# requests is profiled and kept when slower than PROFILING_LATENCY_THRESHOLD
+# seconds. The X-Profile header profiles a request in DEBUG, or anywhere when
+# its value is PROFILING_TOKEN.
+PROFILING_DIR = os.environ.get("PROFILING_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+PROFILING_LATENCY_THRESHOLD = float(os.environ.get("PROFILING_LATENCY_THRESHOLD", 1))
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN")
+
+LOG_LEVEL = "INFO" if DEBUG is True else "INFO"
 
 
 log_config: dict[str, Any] = {
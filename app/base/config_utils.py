@@ -1,2 +1,6 @@
 def comma_separated_str_to_list(comma_separated_str: str) -> list[str]:
     return comma_separated_str.split(",")
+
+
+def str_to_bool(value: str) -> bool:
+    return value.strip().lower() in {"1", "true", "yes", "on"}
@@ -13,11 +13,16 @@ class CustomException(FastapiHTTPException):
     field: str | None = None
 
     def __init__(
-        self, status_code: int, code: str, detail: str, field: str | None = None
+        self,
+        status_code: int,
+        code: str,
+        detail: str,
+        field: str | None = None,
+        headers: dict[str, str] | None = None,
     ):
         self.code = code
         self.field = field
-        super().__init__(status_code=status_code, detail=detail)
+        super().__init__(status_code=status_code, detail=detail, headers=headers)
 
 
 class ObjectNotFoundException(CustomException):
@@ -32,6 +37,7 @@ class ObjectNotFoundException(CustomException):
 class ExType(str, Enum):
     INTERNAL_SERVER_ERROR = "INTERNAL_SERVER_ERROR"
     UNHANDLED_ERROR = "UNHANDLED_ERROR"
+    SERVICE_UNAVAILABLE = "SERVICE_UNAVAILABLE"
 
     OBJECT_NOT_FOUND = "OBJECT_NOT_FOUND"
     VALIDATION_ERROR = "VALIDATION_ERROR"
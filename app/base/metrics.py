@@ -0,0 +1,190 @@
+"""
+Prometheus metrics, served on METRICS_PORT apart from the public API.
+
+Under gunicorn export PROMETHEUS_MULTIPROC_DIR, the workers then write their
+samples to that folder and the master serves the sum of them, see
+app/gunicorn_config.py. Because of that everything is recorded when it
+happens, nothing is read from the state of a single process at scrape time.
+"""
+
+import logging
+import os
+from threading import Lock
+from typing import Any
+from wsgiref.simple_server import WSGIServer
+
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+
+def _gauge(name: str, documentation: str, labels: list[str]) -> Gauge:
+    # Sum of the live workers, the samples of dead ones are dropped
+    return Gauge(name, documentation, labels, multiprocess_mode="livesum")
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Latency of the HTTP requests by route template",
+    ["method", "route", "status"],
+)
+http_requests_in_progress = _gauge(
+    "http_requests_in_progress",
+    "HTTP requests being served",
+    ["method"],
+)
+mongo_command_duration = Histogram(
+    "mongodb_command_duration_seconds",
+    "Latency of the MongoDB commands",
+    ["command", "collection"],
+)
+mongo_command_failures = Counter(
+    "mongodb_command_failures_total",
+    "MongoDB commands that failed",
+    ["command", "collection"],
+)
+process_pool_workers = _gauge(
+    "process_pool_workers",
+    "Worker processes of the started process pools",
+    ["pool"],
+)
+# Queue depth is process_pool_pending - process_pool_workers
+process_pool_pending = _gauge(
+    "process_pool_pending",
+    "Calls submitted to a process pool and not finished yet",
+    ["pool"],
+)
+process_pool_rejected = Counter(
+    "process_pool_rejected_total",
+    "Calls rejected because the process pool was full",
+    ["pool"],
+)
+function_duration = Histogram(
+    "function_duration_seconds",
+    "Latency of the functions timed with @profiled",
+    ["function"],
+)
+cache_requests = Counter(
+    "cache_requests_total",
+    "Cache lookups by result, hit ratio is rate(hit) / rate(all)",
+    ["cache", "result"],
+)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    Time every command sent by pymongo. Started and finished events of one
+    command are matched by request and connection, both sync and async clients
+    report here.
+    """
+
+    def __init__(self) -> None:
+        self._collections: dict[tuple[int, Any], str] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def _get_collection(event: monitoring.CommandStartedEvent) -> str:
+        collection = event.command.get(event.command_name)
+        if isinstance(collection, str):
+            return collection
+        # getMore holds the cursor id, the collection is in its own field
+        return str(event.command.get("collection", ""))
+
+    def _pop_collection(self, event: Any) -> str:
+        with self._lock:
+            return self._collections.pop((event.request_id, event.connection_id), "")
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        with self._lock:
+            self._collections[(event.request_id, event.connection_id)] = (
+                self._get_collection(event)
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        collection = self._pop_collection(event)
+        mongo_command_duration.labels(event.command_name, collection).observe(
+            event.duration_micros / 1_000_000
+        )
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        collection = self._pop_collection(event)
+        mongo_command_duration.labels(event.command_name, collection).observe(
+            event.duration_micros / 1_000_000
+        )
+        mongo_command_failures.labels(event.command_name, collection).inc()
+
+
+def register_mongo_listener() -> None:
+    """Only clients created after the registration are monitored"""
+    monitoring.register(MongoCommandListener())
+
+
+def is_multiprocess() -> bool:
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def get_registry() -> CollectorRegistry:
+    if is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+
+    return REGISTRY
+
+
+def generate_metrics() -> bytes:
+    return bytes(generate_latest(get_registry()))
+
+
+def serve_metrics(port: int) -> WSGIServer:
+    """Serve the metrics on `port` from a daemon thread"""
+    server, _ = start_http_server(port, registry=get_registry())
+    logger.info(f"Metrics are served on port {port}")
+    return server
+
+
+class MetricsServer:
+    """
+    The metrics endpoint of a single process app. Under gunicorn the master
+    serves the metrics of every worker, the workers do not start it.
+    """
+
+    def __init__(self, port: int) -> None:
+        self.name = "metrics_server"
+        self.port = port
+        self._server: WSGIServer | None = None
+
+    async def start(self) -> None:
+        if self._server is not None or self.port <= 0 or is_multiprocess():
+            return
+
+        try:
+            self._server = serve_metrics(self.port)
+        except OSError as e:
+            logger.error(f"Metrics can not be served on {self.port}. Error: {e}")
+
+    async def shutdown(self) -> None:
+        if self._server is None:
+            return
+
+        # Waits for serve_forever to notice, up to half a second
+        await run_in_threadpool(self._server.shutdown)
+        self._server.server_close()
+        self._server = None
+
+
+def mark_process_dead(pid: int) -> None:
+    """Called by gunicorn when a worker exits"""
+    if is_multiprocess():
+        multiprocess.mark_process_dead(pid)
@@ -1,25 +1,213 @@
 import logging
-from typing import Any
+from time import perf_counter
 
 from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from app.base.config import DEBUG
+from app.base import metrics
+from app.base.config import DEBUG, MEDIA_MAX_UPLOAD_SIZE, MONGO_QUERY_BUDGET
+from app.base.exception_handler import handle_custom_exception
 from app.base.exceptions import CustomException, ExType
+from app.base.query_recorder import QueryRecorder, record_queries
+from app.base.utils.file import upload_too_large
+from app.base.utils.profiling import PROFILING_HEADER, RequestProfile, should_profile
 
 logger = logging.getLogger(__name__)
 
 
-async def catch_exceptions_middleware(request: Request, call_next: Any) -> Any:
-    try:
-        return await call_next(request)
-    except Exception as e:
-        logger.critical(f"""Unhandled Error:{e}""")
-        if DEBUG:
-            raise e
-        else:
-            # return Response("Internal server error", status_code=500)
-            raise CustomException(
+class CatchExceptionsMiddleware:
+    """
+    Answer unhandled errors with the internal server error of CustomException.
+
+    A plain ASGI middleware, unlike BaseHTTPMiddleware the response is not
+    copied through a memory stream by an extra task, streaming and file
+    responses are sent as they are.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            logger.critical(f"""Unhandled Error:{e}""")
+            # Part of the response is already sent, nothing can be fixed
+            if DEBUG or response_started:
+                raise e
+
+            exc = CustomException(
                 status_code=500,
                 code=ExType.INTERNAL_SERVER_ERROR,
                 detail="Internal server error. Try later.",
-            ) from e
+            )
+            response = await handle_custom_exception(Request(scope), exc)
+            await response(scope, receive, send)
+
+
+# Room for the multipart boundaries, part headers and the other form fields
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject multipart requests whose Content-Length is over the upload limit.
+
+    The form is parsed and spooled to disk before the route and its
+    dependencies run, so `write_upload` only sees the upload once the whole
+    body was received. Chunked requests have no Content-Length, they are
+    still limited by `write_upload` after the body is spooled.
+    """
+
+    def __init__(self, app: ASGIApp, max_size: int = MEDIA_MAX_UPLOAD_SIZE) -> None:
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        content_length = headers.get("content-length", "")
+        if (
+            headers.get("content-type", "").startswith("multipart/form-data")
+            and content_length.isdigit()
+            and int(content_length) > self.max_size + MULTIPART_OVERHEAD
+        ):
+            exc = upload_too_large(self.max_size)
+            response = await handle_custom_exception(Request(scope), exc)
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+
+class MetricsMiddleware:
+    """
+    Record the latency of every HTTP request by route template, the path
+    itself would give a label per post.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = metrics.http_requests_in_progress.labels(method)
+        in_progress.inc()
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            # The router puts the matched route in the scope
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            metrics.http_request_duration.labels(
+                method, route_path, status_code
+            ).observe(perf_counter() - start)
+
+
+def get_server_timing(recorder: QueryRecorder) -> str:
+    timing = f'db;dur={recorder.total_time * 1000:.1f};desc="{recorder.count} queries"'
+    if recorder.slowest:
+        slowest = recorder.slowest
+        timing += (
+            f", db-slowest;dur={slowest.duration * 1000:.1f};"
+            f'desc="{slowest.command} {slowest.collection}"'
+        )
+    return timing
+
+
+class QueryBudgetMiddleware:
+    """
+    Record the MongoDB commands of every request. Requests sending more than
+    MONGO_QUERY_BUDGET commands are logged, an accidental query per row shows
+    up there. In DEBUG the numbers are also sent in the Server-Timing header.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with record_queries() as recorder:
+
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start" and DEBUG:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", get_server_timing(recorder))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                if MONGO_QUERY_BUDGET and recorder.count > MONGO_QUERY_BUDGET:
+                    logger.warning(
+                        f"{scope['method']} {scope['path']} is over the query "
+                        f"budget of {MONGO_QUERY_BUDGET}: {recorder.summary()}"
+                    )
+
+
+class ProfilingMiddleware:
+    """Profile the requests picked by `should_profile`, see app.base.utils.profiling"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header_value = Headers(scope=scope).get(PROFILING_HEADER)
+        is_profiled, forced = should_profile(header_value)
+        profile = RequestProfile.start(forced) if is_profiled else None
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            duration = perf_counter() - start
+            profile.stop()
+
+            if profile.should_keep(duration):
+                location = await run_in_threadpool(
+                    profile.dump, scope["method"], scope["path"], duration
+                )
+                logger.info(f"Profile of {scope['method']} {scope['path']}: {location}")
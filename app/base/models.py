@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from mongodb_odm import ASCENDING, Document, Field, IndexModel
+
+
+class MediaFile(Document):
+    """
+    A content-addressed file under MEDIA_ROOT. `ref_count` is the number of
+    Post.cover_image and User.image values that point to `path`.
+    """
+
+    sha256: str = Field(...)
+    path: str = Field(...)
+    size: int = Field(...)
+    content_type: str = Field(...)
+    ref_count: int = Field(default=0)
+
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+    class ODMConfig(Document.ODMConfig):
+        collection_name = "media_file"
+        indexes = [
+            IndexModel([("sha256", ASCENDING)], unique=True),
+            IndexModel([("path", ASCENDING)]),
+            IndexModel([("ref_count", ASCENDING), ("updated_at", ASCENDING)]),
+        ]
+
+
+class CounterWriter(Document):
+    """
+    A started CounterBuffer, it may hold increments that are not written yet.
+    `beat_at` is refreshed while it runs and the document is removed when it
+    shuts down, the ones left by crashed workers expire.
+    """
+
+    name: str = Field(...)
+    host: str = Field(...)
+    pid: int = Field(...)
+    beat_at: datetime = Field(default_factory=datetime.now)
+
+    class ODMConfig(Document.ODMConfig):
+        collection_name = "counter_writer"
+        indexes = [
+            IndexModel([("beat_at", ASCENDING)], expireAfterSeconds=24 * 3600),
+        ]
@@ -0,0 +1,110 @@
+"""
+Count the MongoDB commands sent while serving a request.
+
+`record_queries` collects every command of the current task (and of the
+threads it starts with run_in_threadpool) into a QueryRecorder. Recorders
+nest, the middleware records each request and a test can still wrap the
+whole client call to assert on it.
+"""
+
+import logging
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Any, NamedTuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+
+class QueryInfo(NamedTuple):
+    command: str
+    collection: str
+    duration: float
+
+
+class QueryRecorder:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest: QueryInfo | None = None
+        self.queries: list[QueryInfo] = []
+
+    def add(self, query: QueryInfo) -> None:
+        self.count += 1
+        self.total_time += query.duration
+        self.queries.append(query)
+        if self.slowest is None or query.duration > self.slowest.duration:
+            self.slowest = query
+
+    def summary(self) -> str:
+        """One line description, meant for logs and assertion messages"""
+        text = f"{self.count} queries in {self.total_time * 1000:.1f}ms"
+        if self.slowest:
+            text += (
+                f", slowest {self.slowest.command} {self.slowest.collection} "
+                f"{self.slowest.duration * 1000:.1f}ms"
+            )
+        return text
+
+
+_recorders: ContextVar[tuple[QueryRecorder, ...]] = ContextVar(
+    "query_recorders", default=()
+)
+
+
+@contextmanager
+def record_queries() -> Iterator[QueryRecorder]:
+    recorder = QueryRecorder()
+    token = _recorders.set((*_recorders.get(), recorder))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
+
+
+class QueryRecorderListener(monitoring.CommandListener):
+    """
+    pymongo publishes the events from the task or thread that sends the
+    command, so the context of the request is the current one here.
+    """
+
+    def __init__(self) -> None:
+        self._started: dict[tuple[int, Any], str] = {}
+        self._lock = Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if not _recorders.get():
+            return
+
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = str(event.command.get("collection", ""))
+        with self._lock:
+            self._started[(event.request_id, event.connection_id)] = collection
+
+    def _finished(self, event: Any) -> None:
+        recorders = _recorders.get()
+        if not recorders:
+            return
+
+        with self._lock:
+            collection = self._started.pop((event.request_id, event.connection_id), "")
+        query = QueryInfo(
+            event.command_name, collection, event.duration_micros / 1_000_000
+        )
+        for recorder in recorders:
+            recorder.add(query)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event)
+
+
+def register_query_listener() -> None:
+    """Only clients created after the registration are recorded"""
+    monitoring.register(QueryRecorderListener())
@@ -2,23 +2,36 @@ import logging
 import os
 from typing import Any
 
-from fastapi import APIRouter, Depends, File, UploadFile, status
-from fastapi.responses import FileResponse
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    File,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, RedirectResponse
 from mongodb_odm.connection import get_client
 
-from app.base.config import MEDIA_ROOT
+from app.base.config import MEDIA_IMMUTABLE_MAX_AGE, MEDIA_MAX_AGE
 from app.base.exceptions import CustomException, ExType
-from app.base.utils.file import save_file
-from app.user.dependencies import get_authenticated_user, get_authenticated_user_or_none
+from app.base.services import image as image_service
+from app.base.services.media import save_media
+from app.base.utils.storage import get_storage
+from app.user.dependencies import get_authenticated_user
 from app.user.models import User
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
-def is_database_stable() -> bool:
+async def is_database_stable() -> bool:
     try:
-        get_client().admin.command("ping")
+        await get_client().admin.command("ping")  # type: ignore
 
         return True
     except Exception as e:
@@ -32,39 +45,110 @@ def is_database_stable() -> bool:
 
 @router.get("/")
 async def home_page() -> Any:
-    is_database_stable()
+    await is_database_stable()
 
     return {"message": "Server alive"}
 
 
 @router.get("/health")
-def health_check() -> Any:
-    is_database_stable()
+async def health_check() -> Any:
+    await is_database_stable()
 
     return {"status": "ok"}
 
 
 @router.post("/api/v1/upload-image", status_code=status.HTTP_201_CREATED)
 async def create_upload_image(
+    background_tasks: BackgroundTasks,
     image: UploadFile = File(...),
     _: User = Depends(get_authenticated_user),
 ) -> Any:
-    image_path = save_file(image, root_folder="image")
+    image_path = await save_media(image, root_folder="image")
+    if image_path:
+        background_tasks.add_task(image_service.render_upload_derivatives, image_path)
+
     return {"image_path": image_path}
 
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+
+    # If-None-Match uses the weak comparison
+    etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in etags
+
+
+def _get_cache_control(file_path: str) -> str:
+    if image_service.get_content_etag(file_path):
+        # The content of a content-addressed path never changes
+        return f"public, max-age={MEDIA_IMMUTABLE_MAX_AGE}, immutable"
+
+    return f"public, max-age={MEDIA_MAX_AGE}"
+
+
+def _not_modified(etag: str, file_path: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": _get_cache_control(file_path)}
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
 @router.get("/media/{file_path:path}")
 async def get_image(
+    request: Request,
     file_path: str,
-    _: User | None = Depends(get_authenticated_user_or_none),
+    w: int | None = Query(default=None, gt=0, le=4096),
+    fmt: str | None = Query(default=None, pattern="^(webp|jpg|png)$"),
 ) -> Any:
-    file_path = f"{MEDIA_ROOT}/{file_path}"
-
-    if os.path.isfile(file_path):
-        return FileResponse(file_path)
-    else:
+    """
+    Media is public, there is no user lookup. Range requests are handled by
+    FileResponse.
+    """
+    # Files in an object store are downloaded from it, resizing is local only
+    url = await run_in_threadpool(get_storage().get_url, file_path)
+    if url is not None:
+        return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+
+    served_path = file_path
+    if w or fmt:
+        served_path = image_service.get_derivative_path(file_path, w, fmt) or file_path
+
+    # Content-addressed files are revalidated without touching the disk
+    if_none_match = request.headers.get("if-none-match")
+    etag = image_service.get_content_etag(served_path)
+    if etag and if_none_match and _etag_matches(if_none_match, etag):
+        return _not_modified(etag, served_path)
+
+    file_location = image_service.get_media_location(file_path)
+    if not file_location or not await run_in_threadpool(os.path.isfile, file_location):
         raise CustomException(
             status_code=status.HTTP_400_BAD_REQUEST,
             code=ExType.OBJECT_NOT_FOUND,
             detail="file not found",
         )
+    # Aliases of a file would be rendered and cached once per spelling
+    if not image_service.is_canonical_path(file_path, file_location):
+        raise CustomException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            code=ExType.OBJECT_NOT_FOUND,
+            detail="file not found",
+        )
+
+    if served_path != file_path:
+        derivative = await image_service.get_derivative(file_path, w, fmt)
+        if derivative:
+            file_location = derivative
+        else:
+            served_path = file_path
+            etag = image_service.get_content_etag(file_path)
+
+    stat_result = await run_in_threadpool(os.stat, file_location)
+    if etag is None:
+        etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return _not_modified(etag, served_path)
+
+    return FileResponse(
+        file_location,
+        stat_result=stat_result,
+        headers={"ETag": etag, "Cache-Control": _get_cache_control(served_path)},
+    )
@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.base.config import (
+    IMAGE_MAX_PENDING,
+    IMAGE_WORKERS,
+    MEDIA_DERIVATIVE_CACHE_SIZE,
+    MEDIA_ROOT,
+    MEDIA_URL,
+)
+from app.base.services.media import CONTENT_PATH_RE
+from app.base.utils.image import render_derivative, render_derivatives
+from app.base.utils.process_pool import BoundedProcessPool
+from app.base.utils.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_FOLDER = "derivatives"
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+DEFAULT_DERIVATIVE_EXT = "webp"
+# Resolved, the derivative locations are compared to it and cached by it
+DERIVATIVE_ROOT = os.path.realpath(f"{MEDIA_ROOT}/{DERIVATIVE_FOLDER}")
+
+image_pool = BoundedProcessPool(
+    name="image", max_workers=IMAGE_WORKERS, max_pending=IMAGE_MAX_PENDING
+)
+
+
+class DerivativeCache:
+    """
+    Bounded on-disk cache of rendered derivatives, the least recently served
+    files are removed once they take more than `max_size` bytes.
+
+    The index is per process and built from the folder on first use, files
+    written by other workers are picked up when they are served. Every disk
+    access runs in the thread pool.
+    """
+
+    def __init__(self, root: str, max_size: int) -> None:
+        self.root = root
+        self.max_size = max_size
+
+        self.size = 0
+        self.evicted = 0
+
+        self._files: OrderedDict[str, int] | None = None
+
+    def _scan(self) -> OrderedDict[str, int]:
+        files: OrderedDict[str, int] = OrderedDict()
+        for root, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                location = os.path.join(root, file_name)
+                try:
+                    files[location] = os.path.getsize(location)
+                except FileNotFoundError:
+                    # Evicted by another worker during the walk
+                    pass
+
+        return files
+
+    async def _get_files(self) -> OrderedDict[str, int]:
+        if self._files is None:
+            files = await run_in_threadpool(self._scan)
+            # Another request may have loaded it while this one was scanning
+            if self._files is None:
+                self._files = files
+                self.size = sum(files.values())
+
+        return self._files
+
+    @staticmethod
+    def _remove_files(locations: list[str]) -> None:
+        for location in locations:
+            try:
+                os.remove(location)
+            except FileNotFoundError:
+                pass
+
+    async def add(self, location: str, size: int) -> None:
+        files = await self._get_files()
+
+        self.size += size - files.get(location, 0)
+        files[location] = size
+        files.move_to_end(location)
+
+        evicted = []
+        while self.size > self.max_size and len(files) > 1:
+            old_location, old_size = files.popitem(last=False)
+            self.size -= old_size
+            evicted.append(old_location)
+
+        if evicted:
+            self.evicted += len(evicted)
+            await run_in_threadpool(self._remove_files, evicted)
+
+    async def touch(self, location: str) -> None:
+        files = await self._get_files()
+
+        if location in files:
+            files.move_to_end(location)
+        else:
+            await self.add(location, await run_in_threadpool(os.path.getsize, location))
+
+
+derivative_cache = DerivativeCache(
+    root=DERIVATIVE_ROOT, max_size=MEDIA_DERIVATIVE_CACHE_SIZE
+)
+
+_rendering: dict[str, "asyncio.Future[int]"] = {}
+
+
+def get_media_location(file_path: str) -> str | None:
+    """
+    Absolute location of `file_path`, None if it is outside of MEDIA_ROOT or
+    the files are not kept on this disk.
+    """
+    return get_storage().get_location(file_path)
+
+
+def is_canonical_path(file_path: str, location: str) -> bool:
+    """
+    `file_path` is the normalized path of `location` relative to MEDIA_ROOT.
+    Other spellings of the path ("a/../b", "./b", links) are aliases, each
+    would get its own derivatives.
+    """
+    return os.path.relpath(location, os.path.realpath(MEDIA_ROOT)) == file_path
+
+
+def get_variant_width(width: int | None) -> int:
+    """The smallest pre-rendered width that covers `width`"""
+    for variant_width in DERIVATIVE_WIDTHS:
+        if width is not None and variant_width >= width:
+            return variant_width
+
+    return DERIVATIVE_WIDTHS[-1]
+
+
+def get_derivative_location(file_path: str, width: int, ext: str) -> str | None:
+    """None when the location would be outside of the derivative folder"""
+    location = os.path.realpath(f"{DERIVATIVE_ROOT}/{file_path}/w{width}.{ext}")
+
+    if os.path.commonpath([DERIVATIVE_ROOT, location]) != DERIVATIVE_ROOT:
+        return None
+    return location
+
+
+def _is_derivative(file_path: str) -> bool:
+    return file_path.startswith(f"{DERIVATIVE_FOLDER}/")
+
+
+async def render_upload_derivatives(image_path: str) -> None:
+    """Pre-render every width as webp, meant to run after the upload response"""
+    file_path = image_path.removeprefix(MEDIA_URL)
+    source = get_media_location(file_path)
+    if source is None or not is_canonical_path(file_path, source):
+        return
+
+    variants = []
+    for width in DERIVATIVE_WIDTHS:
+        dest = get_derivative_location(file_path, width, DEFAULT_DERIVATIVE_EXT)
+        if dest and not await run_in_threadpool(os.path.isfile, dest):
+            variants.append((dest, width))
+    if not variants:
+        return
+
+    try:
+        sizes = await image_pool.run(
+            render_derivatives,
+            source,
+            [(dest, width, DEFAULT_DERIVATIVE_EXT) for dest, width in variants],
+        )
+    except Exception as e:
+        # They are rendered on the first request instead
+        logger.warning(f"Failed to render derivatives of {file_path}. Error: {e}")
+        return
+
+    for (destination, _), size in zip(variants, sizes, strict=True):
+        await derivative_cache.add(destination, size)
+
+
+def get_derivative_path(
+    file_path: str, width: int | None, ext: str | None
+) -> str | None:
+    """
+    Path relative to MEDIA_ROOT of the variant nearest to `width` in `ext`,
+    None when the original has to be served.
+    """
+    if _is_derivative(file_path):
+        return None
+
+    width = get_variant_width(width)
+    ext = ext or DEFAULT_DERIVATIVE_EXT
+
+    return f"{DERIVATIVE_FOLDER}/{file_path}/w{width}.{ext}"
+
+
+async def get_derivative(
+    file_path: str, width: int | None, ext: str | None
+) -> str | None:
+    """
+    Location of the variant nearest to `width` in `ext`, rendered now when it
+    is missing. None means the original has to be served.
+    """
+    source = get_media_location(file_path)
+    if (
+        source is None
+        or _is_derivative(file_path)
+        or not is_canonical_path(file_path, source)
+    ):
+        return None
+
+    width = get_variant_width(width)
+    ext = ext or DEFAULT_DERIVATIVE_EXT
+
+    destination = get_derivative_location(file_path, width, ext)
+    if destination is None:
+        return None
+
+    if await run_in_threadpool(os.path.isfile, destination):
+        try:
+            await derivative_cache.touch(destination)
+            return destination
+        except FileNotFoundError:
+            # Evicted by another worker, rendered again
+            pass
+
+    # Concurrent requests of the same variant wait for a single render
+    future = _rendering.get(destination)
+    if future is None:
+        future = asyncio.ensure_future(
+            image_pool.run(render_derivative, source, destination, width, ext)
+        )
+        _rendering[destination] = future
+        future.add_done_callback(lambda _: _rendering.pop(destination, None))
+
+    try:
+        size = await asyncio.shield(future)
+    except Exception as e:
+        logger.warning(f"Failed to render {destination}. Error: {e}")
+        return None
+
+    await derivative_cache.add(destination, size)
+    return destination
+
+
+def get_content_etag(file_path: str) -> str | None:
+    """
+    Strong ETag of content-addressed files and of their derivatives, derived
+    from the path alone. None for files saved under a random name.
+    """
+    source_path, variant = file_path, ""
+    if _is_derivative(file_path):
+        source_path, _, variant = file_path.removeprefix(
+            f"{DERIVATIVE_FOLDER}/"
+        ).rpartition("/")
+
+    match = CONTENT_PATH_RE.match(source_path)
+    if match is None:
+        return None
+
+    return f'"{match.group(1)}-{variant}"' if variant else f'"{match.group(1)}"'
@@ -0,0 +1,104 @@
+import logging
+import os
+import re
+from datetime import datetime
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from pymongo import ReturnDocument
+
+from app.base.config import (
+    MEDIA_CONTENT_ADDRESSED,
+    MEDIA_MAX_UPLOAD_SIZE,
+    MEDIA_ROOT,
+    MEDIA_URL,
+)
+from app.base.models import MediaFile
+from app.base.utils.file import (
+    IMAGE_TYPES,
+    TEMP_FOLDER,
+    get_unique_file_name,
+    remove_file,
+    save_file,
+    store_file,
+    write_upload,
+)
+from app.base.utils.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+CONTENT_PATH_RE = re.compile(r"^[\w-]+/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.\w+$")
+
+
+def get_content_path(root_folder: str, sha256: str, ext: str) -> str:
+    return f"{root_folder}/{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext}"
+
+
+def is_content_addressed(file_path: str) -> bool:
+    """`file_path` is relative to MEDIA_ROOT"""
+    return CONTENT_PATH_RE.match(file_path) is not None
+
+
+async def save_media(
+    uploaded_file: UploadFile,
+    root_folder: str = "image",
+    max_size: int = MEDIA_MAX_UPLOAD_SIZE,
+) -> str:
+    """
+    Save the upload under a path derived from its sha256. When the content is
+    already stored the upload is dropped and only `updated_at` is touched,
+    which also keeps the file away from the garbage collector for a while.
+    """
+    if not MEDIA_CONTENT_ADDRESSED:
+        return await save_file(uploaded_file, root_folder, max_size)
+
+    temp_folder = f"{MEDIA_ROOT}/{TEMP_FOLDER}"
+    await run_in_threadpool(os.makedirs, temp_folder, exist_ok=True)
+
+    temp_location = f"{temp_folder}/{get_unique_file_name('part')}"
+    try:
+        stored_file = await write_upload(uploaded_file, temp_location, max_size)
+    except OSError as e:
+        logger.error(f"Failed to save {uploaded_file.filename}. Error: {e}")
+        return ""
+
+    ext, _ = IMAGE_TYPES[stored_file.content_type]
+    new_media = MediaFile(
+        sha256=stored_file.sha256,
+        path=MEDIA_URL + get_content_path(root_folder, stored_file.sha256, ext),
+        size=stored_file.size,
+        content_type=stored_file.content_type,
+    )
+    on_insert = new_media.to_mongo()
+    on_insert.pop("updated_at")
+
+    media = await MediaFile._async_get_collection().find_one_and_update(
+        {"sha256": stored_file.sha256},
+        {"$setOnInsert": on_insert, "$set": {"updated_at": datetime.now()}},
+        projection={"path": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+
+    file_path = media["path"].removeprefix(MEDIA_URL)
+    if await run_in_threadpool(get_storage().exists, file_path):
+        await run_in_threadpool(remove_file, temp_location)
+        logger.info(f"Deduplicated upload of {media['path']}")
+    elif not await store_file(file_path, stored_file):
+        return ""
+
+    return str(media["path"])
+
+
+async def update_media_references(old_path: str | None, new_path: str | None) -> None:
+    """Move one reference from `old_path` to `new_path`, either may be None"""
+    if old_path == new_path:
+        return
+
+    if old_path:
+        await MediaFile.aupdate_one({"path": old_path}, {"$inc": {"ref_count": -1}})
+    if new_path:
+        await MediaFile.aupdate_one(
+            {"path": new_path},
+            {"$inc": {"ref_count": 1}, "$set": {"updated_at": datetime.now()}},
+        )
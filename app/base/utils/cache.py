@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from time import monotonic
+from typing import Any, Generic, TypeVar
+
+from app.base import metrics
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    In-process LRU cache where every entry also expires after `ttl` seconds.
+
+    It is not thread safe, it is meant to be used from the event loop.
+    A `maxsize` or `ttl` of 0 disables the cache. Without `record_metrics`
+    the lookups are left out of cache_requests, for caches used by something
+    that records them itself.
+    """
+
+    def __init__(
+        self, name: str, maxsize: int, ttl: float, record_metrics: bool = True
+    ) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.record_metrics = record_metrics
+
+        self.hits = 0
+        self.misses = 0
+        self._hit_metric = metrics.cache_requests.labels(name, "hit")
+        self._miss_metric = metrics.cache_requests.labels(name, "miss")
+
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> V | None:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            if self.record_metrics:
+                self._miss_metric.inc()
+            return None
+
+        expire_at, value = item
+        if expire_at <= monotonic():
+            del self._data[key]
+            self.misses += 1
+            if self.record_metrics:
+                self._miss_metric.inc()
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        if self.record_metrics:
+            self._hit_metric.inc()
+        return value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        if not self.is_enabled:
+            return
+
+        self._data[key] = (monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: K) -> None:
+        self._data.pop(key, None)
+
+    def delete_matching(self, predicate: Callable[[K], bool]) -> int:
+        keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            del self._data[key]
+
+        return len(keys)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
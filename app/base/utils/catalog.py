@@ -0,0 +1,193 @@
+import asyncio
+import logging
+from collections.abc import Callable, Mapping
+from typing import Any, Generic, Protocol, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
+from mongodb_odm import Document
+from pymongo.errors import OperationFailure
+
+from app.base import metrics
+
+logger = logging.getLogger(__name__)
+
+# Raised by $changeStream on a standalone server
+CHANGE_STREAM_NOT_SUPPORTED = 40573
+
+
+class CatalogIndex(Protocol):
+    def put(self, document: dict[str, Any]) -> None:
+        """Add `document` or replace the one with the same `_id`"""
+        ...
+
+    def remove(self, document_id: Any) -> None: ...
+
+    def on_load(self) -> None:
+        """Called once every document of a load is put"""
+        ...
+
+
+IndexT = TypeVar("IndexT", bound=CatalogIndex)
+
+
+class CollectionCatalog(Generic[IndexT]):
+    """
+    In-memory copy of a small collection that is read far more than written.
+
+    The documents are loaded on start, then kept in sync by a change stream.
+    Without change streams (standalone mongod) the collection is polled every
+    `refresh_interval` seconds and reloaded when its fingerprint changed: the
+    count, the last `_id` and the sum of `version_field`, a counter that changes
+    with the updates worth seeing. Other updates in place are then only picked
+    up with the next reload. A catalog that is not started, or with
+    `refresh_interval` 0, stays empty and callers fall back to the database on
+    a miss.
+
+    The documents are kept in `index`, built by `index_factory`. A load builds
+    a new index in a thread and swaps it in, readers never see a half built one
+    and a large collection does not block the event loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: type[Document],
+        index_factory: Callable[[], IndexT],
+        refresh_interval: float,
+        projection: Mapping[str, Any] | None = None,
+        version_field: str | None = None,
+    ) -> None:
+        self.name = name
+        self.model = model
+        self.index_factory = index_factory
+        self.refresh_interval = refresh_interval
+        self.projection = dict(projection) if projection else None
+        self.version_field = version_field
+
+        self.index = index_factory()
+        self.is_loaded = False
+        self._fingerprint: tuple[Any, ...] | None = None
+        # Cluster time taken before the last load, a change stream opened
+        # from it sees every change the load missed
+        self._loaded_at: Any = None
+        self._task: asyncio.Task[None] | None = None
+
+    def record_lookup(self, hit: bool) -> None:
+        metrics.cache_requests.labels(self.name, "hit" if hit else "miss").inc()
+
+    async def _get_fingerprint(self) -> tuple[Any, ...]:
+        group: dict[str, Any] = {
+            "_id": None,
+            "count": {"$sum": 1},
+            "last_id": {"$max": "$_id"},
+        }
+        if self.version_field:
+            group["version"] = {"$sum": f"${self.version_field}"}
+
+        async for obj in self.model.aaggregate([{"$group": group}], get_raw=True):
+            return obj["count"], obj["last_id"], obj.get("version")
+        return 0, None, None
+
+    async def load(self) -> None:
+        # Only replica sets answer with an operationTime
+        ping = await self.model._async_get_collection().database.command("ping")
+        loaded_at = ping.get("operationTime")
+        fingerprint = await self._get_fingerprint()
+        documents = [
+            document
+            async for document in self.model.afind_raw({}, projection=self.projection)
+        ]
+
+        self.index = await run_in_threadpool(self._build_index, documents)
+        self._fingerprint = fingerprint
+        self._loaded_at = loaded_at
+        self.is_loaded = True
+
+        logger.info(f"Catalog '{self.name}' loaded {len(documents)} documents")
+
+    def _build_index(self, documents: list[dict[str, Any]]) -> IndexT:
+        index = self.index_factory()
+        for document in documents:
+            index.put(document)
+        index.on_load()
+
+        return index
+
+    def _apply_change(self, change: dict[str, Any]) -> bool:
+        """False when the whole collection has to be loaded again"""
+        operation = change["operationType"]
+
+        if operation in ("insert", "update", "replace"):
+            document = change.get("fullDocument")
+            if document is None:
+                # Deleted again before the update was looked up
+                self.index.remove(change["documentKey"]["_id"])
+            else:
+                self.index.put(document)
+            return True
+        if operation == "delete":
+            self.index.remove(change["documentKey"]["_id"])
+            return True
+
+        # drop, rename, invalidate...
+        return False
+
+    async def _watch(self) -> None:
+        collection = self.model._async_get_collection()
+        # Taken once, the time may be out of the oplog when a failed stream is
+        # opened again, the catalog is then loaded again
+        start_at, self._loaded_at = self._loaded_at, None
+        async with await collection.watch(
+            full_document="updateLookup", start_at_operation_time=start_at
+        ) as stream:
+            if start_at is None:
+                # Changes made between the load and the stream are not lost
+                await self.load()
+            async for change in stream:
+                if not self._apply_change(change):
+                    await self.load()
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                if await self._get_fingerprint() != self._fingerprint:
+                    await self.load()
+            except Exception as e:
+                logger.error(f"Catalog '{self.name}' refresh failed. Error: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._watch()
+            except OperationFailure as e:
+                if e.code != CHANGE_STREAM_NOT_SUPPORTED:
+                    logger.error(f"Catalog '{self.name}' change stream failed: {e}")
+                    await asyncio.sleep(self.refresh_interval)
+                    continue
+
+                logger.info(
+                    f"Catalog '{self.name}' polls every {self.refresh_interval}s, "
+                    "change streams need a replica set"
+                )
+                await self._poll()
+            except Exception as e:
+                logger.error(f"Catalog '{self.name}' change stream failed: {e}")
+                await asyncio.sleep(self.refresh_interval)
+
+    async def start(self) -> None:
+        if self._task is not None or self.refresh_interval <= 0:
+            return
+
+        await self.load()
+        self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        self._task = None
+        self.index = self.index_factory()
+        self.is_loaded = False
+        self._loaded_at = None
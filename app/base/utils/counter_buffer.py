@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import os
+import socket
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+from time import monotonic
+from typing import Any
+
+from mongodb_odm import Document, ODMObjectId, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.base.models import CounterWriter
+
+logger = logging.getLogger(__name__)
+
+# A started buffer refreshes its CounterWriter this often, the writers
+# refreshed within WRITER_TIMEOUT seconds are alive
+HEARTBEAT_INTERVAL = 10
+WRITER_TIMEOUT = 3 * HEARTBEAT_INTERVAL
+
+
+class CounterBuffer:
+    """
+    Write-behind buffer for `$inc` counters of a model.
+
+    Increments are summed per document in memory and written with a single
+    unordered bulk_write every `flush_interval` seconds, or as soon as
+    `max_size` documents are pending. Failed writes are put back and retried
+    on the next flush. When the buffer is not started or `flush_interval` is 0,
+    every increment is written immediately.
+
+    `on_write` is awaited with the ids of the documents whose counters were
+    just written, to drop whatever is derived from the old values.
+
+    The pending increments are not journaled, a crash loses the ones that are
+    not written yet and the counters are only exact again once
+    `reconcile-counters` ran. A shutdown waits for the flush in progress and
+    writes the rest. `reconcile-counters` recomputes the counters from their
+    source, it has to run with the app stopped: the pending increments of a
+    running buffer would be added again on top of the recomputed values. A
+    started buffer keeps a CounterWriter fresh so the command can refuse to run.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: type[Document],
+        flush_interval: float,
+        max_size: int,
+        on_write: Callable[[list[Any]], Awaitable[None]] | None = None,
+    ) -> None:
+        self.name = name
+        self.model = model
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.on_write = on_write
+
+        self.flushed = 0
+        self.failed = 0
+
+        self._deltas: dict[Any, dict[str, int]] = {}
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task[None] | None = None
+        self._stopping = asyncio.Event()
+        self._flush_tasks: set[asyncio.Task[int]] = set()
+        self._writer_id: ODMObjectId | None = None
+        self._last_beat = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None
+
+    @property
+    def pending(self) -> int:
+        return len(self._deltas)
+
+    def _merge(self, deltas: dict[Any, dict[str, int]]) -> None:
+        for doc_id, fields in deltas.items():
+            pending_fields = self._deltas.setdefault(doc_id, {})
+            for field, val in fields.items():
+                pending_fields[field] = pending_fields.get(field, 0) + val
+
+    async def _notify(self, doc_ids: list[Any]) -> None:
+        if self.on_write is None or not doc_ids:
+            return
+
+        try:
+            await self.on_write(doc_ids)
+        except Exception as e:
+            logger.error(f"Counter '{self.name}' on_write failed. Error: {e}")
+
+    async def incr(self, doc_id: Any, field: str, val: int) -> None:
+        if not self.is_running:
+            await self.model.aupdate_one({"_id": doc_id}, {"$inc": {field: val}})
+            await self._notify([doc_id])
+            return
+
+        self._merge({doc_id: {field: val}})
+
+        if len(self._deltas) >= self.max_size:
+            task = asyncio.create_task(self.flush())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def flush(self) -> int:
+        async with self._lock:
+            deltas, self._deltas = self._deltas, {}
+
+            doc_ids: list[Any] = []
+            requests: list[Any] = []
+            for doc_id, fields in deltas.items():
+                inc = {field: val for field, val in fields.items() if val}
+                if inc:
+                    doc_ids.append(doc_id)
+                    requests.append(UpdateOne({"_id": doc_id}, {"$inc": inc}))
+
+            if not requests:
+                return 0
+
+            try:
+                await self.model.abulk_write(requests, ordered=False)
+            except BulkWriteError as e:
+                # Only the failed operations are retried, the rest are applied
+                failed_ids = {doc_ids[err["index"]] for err in e.details["writeErrors"]}
+                self._merge({doc_id: deltas[doc_id] for doc_id in failed_ids})
+                self.failed += len(failed_ids)
+                logger.error(f"Counter '{self.name}' failed for {len(failed_ids)} doc")
+                await self._notify([i for i in doc_ids if i not in failed_ids])
+                return len(requests) - len(failed_ids)
+            except Exception as e:
+                self._merge(deltas)
+                self.failed += len(requests)
+                logger.error(f"Counter '{self.name}' flush failed. Error: {e}")
+                return 0
+
+            self.flushed += len(requests)
+            await self._notify(doc_ids)
+            return len(requests)
+
+    async def _beat(self) -> None:
+        if monotonic() - self._last_beat < HEARTBEAT_INTERVAL:
+            return
+
+        await CounterWriter.aupdate_one(
+            {"_id": self._writer_id}, {"$set": {"beat_at": datetime.now()}}
+        )
+        self._last_beat = monotonic()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+                # shutdown() writes the rest
+                return
+            except TimeoutError:
+                pass
+
+            try:
+                await self.flush()
+                await self._beat()
+            except Exception as e:
+                logger.error(f"Counter '{self.name}' flush loop error: {e}")
+
+    async def start(self) -> None:
+        if self._task is not None or self.flush_interval <= 0:
+            return
+
+        writer = await CounterWriter(
+            name=self.name, host=socket.gethostname(), pid=os.getpid()
+        ).acreate()
+        self._writer_id = writer.id
+        self._last_beat = monotonic()
+        self._stopping.clear()
+
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Counter '{self.name}' flushes every {self.flush_interval}s")
+
+    async def shutdown(self) -> None:
+        if self._task is None:
+            return
+
+        # Cancelling the loop during a flush would drop the batch it swapped out
+        self._stopping.set()
+        await self._task
+        self._task = None
+        await asyncio.gather(*self._flush_tasks)
+
+        await self.flush()
+        if self._deltas:
+            logger.error(
+                f"Counter '{self.name}' lost updates of {len(self._deltas)} doc. "
+                "Run 'reconcile-counters' to recompute them."
+            )
+
+        await CounterWriter.adelete_one({"_id": self._writer_id})
+        self._writer_id = None
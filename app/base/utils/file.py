@@ -1,15 +1,39 @@
+import hashlib
 import logging
 import os
 from datetime import datetime
+from typing import NamedTuple
 from uuid import uuid4
 
-from fastapi import UploadFile
+from fastapi import UploadFile, status
+from fastapi.concurrency import run_in_threadpool
 
-from app.base.config import BASE_DIR, MEDIA_ROOT
+from app.base.config import MEDIA_MAX_UPLOAD_SIZE, MEDIA_ROOT, MEDIA_URL
+from app.base.exceptions import CustomException, ExType
+from app.base.utils.storage import get_storage
 from app.base.utils.string import base64, rand_str
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Uploads are written here before they are moved to the storage
+TEMP_FOLDER = "tmp"
+
+# Extension of the accepted content types and the leading bytes they start with
+IMAGE_TYPES: dict[str, tuple[str, tuple[bytes, ...]]] = {
+    "image/jpeg": ("jpg", (b"\xff\xd8\xff",)),
+    "image/png": ("png", (b"\x89PNG\r\n\x1a\n",)),
+    "image/gif": ("gif", (b"GIF87a", b"GIF89a")),
+    "image/webp": ("webp", (b"RIFF",)),
+}
+
+
+class StoredFile(NamedTuple):
+    path: str
+    size: int
+    sha256: str
+    content_type: str
+
 
 def get_name_and_extension(filename: str | None) -> tuple[str, str]:
     if filename is None:
@@ -30,20 +54,122 @@ def get_unique_file_name(ext: str) -> str:
     return f"{uuid4().hex}{rand_str(6)}.{ext}"
 
 
-def save_file(uploaded_file: UploadFile, root_folder: str = "image") -> str:
+def _unsupported_media_type() -> CustomException:
+    return CustomException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        code=ExType.VALIDATION_ERROR,
+        field="image",
+        detail=f"Only {', '.join(IMAGE_TYPES)} files are allowed.",
+    )
+
+
+def upload_too_large(max_size: int) -> CustomException:
+    return CustomException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        code=ExType.VALIDATION_ERROR,
+        field="image",
+        detail=f"File should be less than {max_size} bytes.",
+    )
+
+
+def get_image_content_type(header: bytes) -> str | None:
+    for content_type, (_, signatures) in IMAGE_TYPES.items():
+        if header.startswith(signatures):
+            if content_type == "image/webp" and header[8:12] != b"WEBP":
+                continue
+            return content_type
+
+    return None
+
+
+def remove_file(file_location: str) -> None:
+    if os.path.exists(file_location):
+        os.remove(file_location)
+
+
+async def write_upload(
+    uploaded_file: UploadFile, file_location: str, max_size: int
+) -> StoredFile:
+    """
+    Copy the upload to `file_location` in chunks, disk IO runs in the thread
+    pool. The type is checked from the first bytes and the size while copying,
+    on any error the partial file is removed.
+    """
+    if uploaded_file.content_type not in IMAGE_TYPES:
+        raise _unsupported_media_type()
+    if uploaded_file.size is not None and uploaded_file.size > max_size:
+        raise upload_too_large(max_size)
+
+    digest = hashlib.sha256()
+    size = 0
+    content_type = None
+
+    file_object = await run_in_threadpool(open, file_location, "wb")
+    try:
+        while chunk := await uploaded_file.read(UPLOAD_CHUNK_SIZE):
+            if content_type is None:
+                content_type = get_image_content_type(chunk)
+                if content_type is None:
+                    raise _unsupported_media_type()
+
+            size += len(chunk)
+            if size > max_size:
+                raise upload_too_large(max_size)
+
+            digest.update(chunk)
+            await run_in_threadpool(file_object.write, chunk)
+    except BaseException:
+        await run_in_threadpool(file_object.close)
+        await run_in_threadpool(remove_file, file_location)
+        raise
+
+    await run_in_threadpool(file_object.close)
+
+    if content_type is None:
+        await run_in_threadpool(remove_file, file_location)
+        raise _unsupported_media_type()
+
+    return StoredFile(file_location, size, digest.hexdigest(), content_type)
+
+
+async def store_file(file_path: str, stored_file: StoredFile) -> bool:
+    """Move a written upload to `file_path` of the media storage"""
+    try:
+        await run_in_threadpool(
+            get_storage().save, file_path, stored_file.path, stored_file.content_type
+        )
+    except Exception as e:
+        logger.error(f"Failed to store {file_path}. Error: {e}")
+        await run_in_threadpool(remove_file, stored_file.path)
+        return False
+
+    return True
+
+
+async def save_file(
+    uploaded_file: UploadFile,
+    root_folder: str = "image",
+    max_size: int = MEDIA_MAX_UPLOAD_SIZE,
+) -> str:
     if not uploaded_file:
         return ""
-    _, ext = get_name_and_extension(uploaded_file.filename)
-    folder_location = f"{MEDIA_ROOT}/{get_folder_path(root_folder)}"
-
-    if not os.path.exists(folder_location):
-        os.makedirs(folder_location)
+    temp_folder = f"{MEDIA_ROOT}/{TEMP_FOLDER}"
+    await run_in_threadpool(os.makedirs, temp_folder, exist_ok=True)
 
-    file_location = f"{folder_location}/{get_unique_file_name(ext)}"
+    # The real extension is only known from the content
+    temp_location = f"{temp_folder}/{get_unique_file_name('part')}"
     try:
-        with open(file_location, "wb+") as file_object:
-            file_object.write(uploaded_file.file.read())
-        file_path = file_location.split(f"{BASE_DIR}")[-1]
-        return file_path
-    except Exception:
+        stored_file = await write_upload(uploaded_file, temp_location, max_size)
+    except OSError as e:
+        logger.error(f"Failed to save {uploaded_file.filename}. Error: {e}")
         return ""
+
+    ext, _ = IMAGE_TYPES[stored_file.content_type]
+    file_path = f"{get_folder_path(root_folder)}/{get_unique_file_name(ext)}"
+    if not await store_file(file_path, stored_file):
+        return ""
+
+    logger.info(
+        f"Saved {file_path} size={stored_file.size} sha256={stored_file.sha256}"
+    )
+    return MEDIA_URL + file_path
@@ -0,0 +1,41 @@
+"""Image resizing that runs in the "image" process pool."""
+
+import os
+from uuid import uuid4
+
+from PIL import Image, ImageOps
+
+# Pillow format name of the extensions a derivative can be rendered to
+DERIVATIVE_FORMATS = {"webp": "WEBP", "jpg": "JPEG", "png": "PNG"}
+
+
+def render_derivative(source: str, destination: str, width: int, ext: str) -> int:
+    """
+    Resize `source` to `width` (never upscaled) and save it as `ext`.
+    Return the size of the written file.
+    """
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    temp_destination = f"{destination}.{uuid4().hex}.part"
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            height = max(round(image.height * width / image.width), 1)
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+
+        image_format = DERIVATIVE_FORMATS[ext]
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        image.save(temp_destination, format=image_format, quality=80, optimize=True)
+
+    os.replace(temp_destination, destination)
+    return os.path.getsize(destination)
+
+
+def render_derivatives(source: str, variants: list[tuple[str, int, str]]) -> list[int]:
+    """Render every (destination, width, ext) of `source` in one pool call"""
+    return [
+        render_derivative(source, destination, width, ext)
+        for destination, width, ext in variants
+    ]
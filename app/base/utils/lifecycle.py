@@ -0,0 +1,40 @@
+"""
+Background parts of the app: process pools, counter buffers and catalogs.
+
+They are created when their module is imported and only started by the
+lifespan of the app, which lists them. The CLI and the unittests use them
+without starting them, each class documents how it behaves then.
+"""
+
+import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Protocol
+
+logger = logging.getLogger(__name__)
+
+
+class Component(Protocol):
+    name: str
+
+    async def start(self) -> None: ...
+
+    async def shutdown(self) -> None: ...
+
+
+@asynccontextmanager
+async def run_components(*components: Component) -> AsyncIterator[None]:
+    """Start `components` in order, shut the started ones down in reverse"""
+    started: list[Component] = []
+    try:
+        for component in components:
+            await component.start()
+            started.append(component)
+
+        yield
+    finally:
+        for component in reversed(started):
+            try:
+                await component.shutdown()
+            except Exception as e:
+                logger.error(f"Failed to shut '{component.name}' down. Error: {e}")
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import multiprocessing
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, TypeVar
+
+from fastapi import status
+from fastapi.concurrency import run_in_threadpool
+
+from app.base import metrics
+from app.base.exceptions import CustomException, ExType
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class BoundedProcessPool:
+    """
+    Run CPU bound functions in worker processes without blocking the event loop.
+
+    The number of submitted but unfinished calls is capped by `max_pending`,
+    once the cap is reached new calls are rejected with 503 instead of piling up.
+    With `max_workers` 0 the pool is disabled and the calls run in the thread
+    pool. A pool that is not started runs the function inline.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+        self._is_started = False
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls that are waiting for a free worker."""
+        return max(self.pending - self.max_workers, 0)
+
+    async def start(self) -> None:
+        if self._is_started:
+            return
+
+        self._is_started = True
+        if self.max_workers <= 0:
+            logger.info(f"Process pool '{self.name}' is disabled, using threads")
+            return
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        metrics.process_pool_workers.labels(self.name).inc(self.max_workers)
+        logger.info(
+            f"Process pool '{self.name}' started with {self.max_workers} workers"
+        )
+
+    async def shutdown(self) -> None:
+        self._is_started = False
+        if self._executor is None:
+            return
+
+        executor, self._executor = self._executor, None
+        # Waits for the worker processes to exit
+        await run_in_threadpool(executor.shutdown, wait=True, cancel_futures=True)
+        metrics.process_pool_workers.labels(self.name).dec(self.max_workers)
+        logger.info(f"Process pool '{self.name}' stopped")
+
+    async def _submit(self, func: Callable[..., T], *args: Any) -> T:
+        if self._executor is None:
+            return await run_in_threadpool(func, *args)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        if not self._is_started:
+            return func(*args)
+
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            metrics.process_pool_rejected.labels(self.name).inc()
+            logger.warning(
+                f"Process pool '{self.name}' is full. pending={self.pending}"
+            )
+            raise CustomException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                code=ExType.SERVICE_UNAVAILABLE,
+                detail="Server is busy. Try later.",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        pending_metric = metrics.process_pool_pending.labels(self.name)
+        pending_metric.inc()
+        try:
+            result = await self._submit(func, *args)
+        except BaseException:
+            self.failed += 1
+            raise
+        else:
+            self.completed += 1
+            return result
+        finally:
+            self.pending -= 1
+            pending_metric.dec()
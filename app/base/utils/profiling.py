@@ -0,0 +1,180 @@
+"""
+Timing of functions and profiles of whole requests.
+
+`profiled` times a function or a block into the `function_duration_seconds`
+histogram. Requests are profiled when they carry the profiling header or are
+picked by PROFILING_SAMPLE_RATE, sampled profiles are only kept when the
+request took longer than PROFILING_LATENCY_THRESHOLD. With pyinstrument
+installed the profile follows the request across awaits and is saved as a
+speedscope file, otherwise cProfile sees the whole thread and a .prof file
+is saved (snakeviz, flameprof).
+"""
+
+import asyncio
+import cProfile
+import logging
+import os
+import random
+import re
+from collections.abc import Callable
+from datetime import datetime
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+from types import TracebackType
+from typing import Any, TypeVar
+
+from app.base import metrics
+from app.base.config import (
+    DEBUG,
+    PROFILING_DIR,
+    PROFILING_LATENCY_THRESHOLD,
+    PROFILING_SAMPLE_RATE,
+    PROFILING_TOKEN,
+)
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # pragma: no cover
+    Profiler = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+PROFILING_HEADER = "x-profile"
+
+
+class profiled:  # noqa: N801
+    """
+    Record the wall time of a function, sync or async, or of a block.
+
+        @profiled()
+        async def get_posts(...): ...
+
+        with profiled("posts.render"):
+            ...
+
+    `log` also logs every call, meant for the CLI.
+    """
+
+    def __init__(self, name: str | None = None, log: bool = False) -> None:
+        self.name = name
+        self.log = log
+        self._start = 0.0
+
+    def record(self, name: str, duration: float) -> None:
+        metrics.function_duration.labels(name).observe(duration)
+        if self.log:
+            logger.info(f"{name} took {duration:.3f} sec")
+
+    def __enter__(self) -> "profiled":
+        self._start = perf_counter()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.record(self.name or "block", perf_counter() - self._start)
+
+    def __call__(self, func: F) -> F:
+        name = self.name or f"{func.__module__}.{func.__qualname__}"
+
+        if asyncio.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                start = perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.record(name, perf_counter() - start)
+
+            return async_wrapper  # type: ignore
+
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, perf_counter() - start)
+
+        return wrapper  # type: ignore
+
+
+class RequestProfile:
+    """A running profile, one at a time per process"""
+
+    _lock = Lock()
+
+    def __init__(self, forced: bool) -> None:
+        self.forced = forced
+
+        if Profiler is not None:
+            self.profiler: Any = Profiler(async_mode="enabled")
+            self.profiler.start()
+        else:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    @classmethod
+    def start(cls, forced: bool) -> "RequestProfile | None":
+        # Profilers hook the interpreter, they can not be stacked
+        if not cls._lock.acquire(blocking=False):
+            return None
+
+        try:
+            return cls(forced)
+        except Exception as e:
+            cls._lock.release()
+            logger.warning(f"Failed to start the profiler: {e}")
+            return None
+
+    def stop(self) -> None:
+        try:
+            if Profiler is not None:
+                self.profiler.stop()
+            else:
+                self.profiler.disable()
+        finally:
+            RequestProfile._lock.release()
+
+    def should_keep(self, duration: float) -> bool:
+        return self.forced or duration >= PROFILING_LATENCY_THRESHOLD
+
+    def dump(self, method: str, path: str, duration: float) -> str:
+        """Write the profile to PROFILING_DIR and return its location"""
+        os.makedirs(PROFILING_DIR, exist_ok=True)
+
+        now = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        slug = re.sub(r"[^\w-]+", "-", path).strip("-")[:64] or "root"
+        file_name = f"{now}-{method}-{slug}-{duration * 1000:.0f}ms"
+
+        if Profiler is not None:
+            location = f"{PROFILING_DIR}/{file_name}.speedscope.json"
+            with open(location, "w") as file_object:
+                file_object.write(self.profiler.output(renderer=SpeedscopeRenderer()))
+        else:
+            location = f"{PROFILING_DIR}/{file_name}.prof"
+            self.profiler.dump_stats(location)
+
+        return location
+
+
+def should_profile(header_value: str | None) -> tuple[bool, bool]:
+    """
+    Return (profile, forced). The header is honoured in DEBUG, or when its value
+    is PROFILING_TOKEN, anyone else could load the server with profiles.
+    """
+    if header_value is not None and (DEBUG or header_value == PROFILING_TOKEN):
+        return True, True
+
+    if PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE:
+        return True, False
+
+    return False, False
@@ -1,23 +1,66 @@
 import logging
-from typing import Any
+from collections.abc import Iterable, Mapping
+from typing import Any, get_args
 
 from mongodb_odm.exceptions import ObjectDoesNotExist
+from pydantic import BaseModel
 
 from app.base.exceptions import ObjectNotFoundException
 
 logger = logging.getLogger(__name__)
 
 
-def get_object_or_404(
+async def get_object_or_404(
     model: Any,
     filter: dict[str, Any],
     detail: str = "Object Not Found",
     **kwargs: dict[str, Any],
 ) -> Any:
     try:
-        return model.get(filter, **kwargs)
+        return await model.aget(filter, **kwargs)
     except ObjectDoesNotExist as e:
         logger.warning(f"404 on:{model.__name__} filter:{kwargs}")
         raise ObjectNotFoundException(
             detail=detail,
         ) from e
+
+
+def _get_nested_schema(annotation: Any) -> type[BaseModel] | None:
+    """The schema inside `Schema`, `Schema | None` or `list[Schema]`"""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for arg in get_args(annotation):
+        schema = _get_nested_schema(arg)
+        if schema is not None:
+            return schema
+    return None
+
+
+def get_projection(
+    schema: type[BaseModel],
+    joined: Mapping[str, Iterable[str]] | None = None,
+    prefix: str = "",
+) -> dict[str, int]:
+    """
+    Projection of the stored fields an output schema renders, nested schemas
+    field by field. `joined` maps the fields the service fills in, like the
+    `author` of a post, by dotted path to the stored fields they are built from.
+    The top level `id` is read from `_id`.
+    """
+    joined = joined or {}
+    projection: dict[str, int] = {}
+
+    for name, field in schema.model_fields.items():
+        path = f"{prefix}{name}"
+        nested_schema = _get_nested_schema(field.annotation)
+
+        if path in joined:
+            projection.update(dict.fromkeys(joined[path], 1))
+        elif path == "id":
+            projection["_id"] = 1
+        elif nested_schema is not None:
+            projection.update(get_projection(nested_schema, joined, f"{path}."))
+        else:
+            projection[path] = 1
+
+    return projection
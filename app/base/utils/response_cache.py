@@ -0,0 +1,281 @@
+import asyncio
+import hashlib
+import json
+import logging
+import struct
+from collections.abc import Awaitable, Callable, Mapping
+from time import time
+from typing import Any, NamedTuple, Protocol
+
+from app.base import metrics
+from app.base.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> bytes | None: ...
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    async def delete(self, key: str) -> None: ...
+
+    async def get_version(self, namespace: str) -> int: ...
+
+    async def incr_version(self, namespace: str) -> int: ...
+
+
+class MemoryCacheBackend:
+    """Per process backend, every worker keeps its own copy of the responses."""
+
+    def __init__(self, maxsize: int) -> None:
+        # ResponseCache records the lookups by namespace
+        self.cache: TTLCache[str, bytes] = TTLCache(
+            name="response", maxsize=maxsize, ttl=float("inf"), record_metrics=False
+        )
+        self._versions: dict[str, int] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.cache.set(key, value, ttl=ttl)
+
+    async def delete(self, key: str) -> None:
+        self.cache.delete(key)
+
+    async def get_version(self, namespace: str) -> int:
+        return self._versions.get(namespace, 0)
+
+    async def incr_version(self, namespace: str) -> int:
+        self._versions[namespace] = self._versions.get(namespace, 0) + 1
+        # Entries of the old version can never be read again
+        self.cache.delete_matching(lambda key: key.startswith(f"{namespace}:"))
+
+        return self._versions[namespace]
+
+
+class RedisCacheBackend:
+    """
+    Backend shared by every worker. `client` is a `redis.asyncio.Redis` or
+    anything with the same get/set/incr coroutines, a fake in unittest.
+    """
+
+    def __init__(self, client: Any) -> None:
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCacheBackend":
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise ImportError(
+                "RESPONSE_CACHE_URL requires the redis package, run 'uv add redis'"
+            ) from e
+
+        return cls(Redis.from_url(url))
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.client.set(key, value, px=int(ttl * 1000))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(key)
+
+    async def get_version(self, namespace: str) -> int:
+        version = await self.client.get(f"{namespace}:version")
+        return int(version) if version else 0
+
+    async def incr_version(self, namespace: str) -> int:
+        # Old keys are left to expire by their TTL
+        return int(await self.client.incr(f"{namespace}:version"))
+
+
+def get_cache_backend(url: str | None, maxsize: int) -> CacheBackend:
+    if url:
+        return RedisCacheBackend.from_url(url)
+
+    return MemoryCacheBackend(maxsize=maxsize)
+
+
+def normalize_params(params: Mapping[str, Any]) -> str:
+    """
+    Same query in any form gives the same key. Empty values are dropped and
+    list values are sorted and deduplicated since their order has no meaning.
+    """
+    normalized: dict[str, Any] = {}
+
+    for name, value in params.items():
+        if value is None or value == "" or value == []:
+            continue
+        if isinstance(value, list | tuple | set):
+            value = sorted({str(val) for val in value})
+        else:
+            value = str(value)
+        normalized[name] = value
+
+    return json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+
+
+# Every stored value starts with the time it stops being fresh
+FRESH_UNTIL = struct.Struct("!d")
+
+
+class CacheLookup(NamedTuple):
+    key: str | None
+    value: bytes | None
+    is_stale: bool = False
+
+
+class ResponseCache:
+    """
+    Serialized responses of a namespace keyed by the normalized query params.
+
+    A response is fresh for `ttl` seconds and then served stale for another
+    `stale_ttl` seconds while `revalidate` rebuilds it in the background.
+    `invalidate` bumps the namespace version so every cached response of the
+    namespace is dropped at once, `delete` bumps the generation of a single
+    response the same way. A counter is kept for every deleted response.
+    Backend errors are logged and treated as a miss so the cache is never the
+    reason a request fails.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        backend: CacheBackend,
+        ttl: float,
+        stale_ttl: float = 0,
+    ) -> None:
+        self.namespace = namespace
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.errors = 0
+
+        self._revalidate_tasks: dict[str, asyncio.Task[None]] = {}
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _get_digest(self, params: Mapping[str, Any]) -> str:
+        return hashlib.sha1(normalize_params(params).encode()).hexdigest()
+
+    def _get_generation_name(self, digest: str) -> str:
+        # The prefix of the response keys, the memory backend drops them by it
+        return f"{self.namespace}:{digest}"
+
+    async def _get_key(self, params: Mapping[str, Any]) -> str:
+        digest = self._get_digest(params)
+        version = await self.backend.get_version(self.namespace)
+        generation = await self.backend.get_version(self._get_generation_name(digest))
+
+        return f"{self.namespace}:{digest}:{generation}:{version}"
+
+    async def get(self, params: Mapping[str, Any]) -> CacheLookup:
+        """
+        Return the cached response and the key to `set` the response with.
+        The key holds the version and generation seen before the response was
+        built, a response built from data that is invalidated or deleted
+        meanwhile is never read.
+        """
+        if not self.is_enabled:
+            return CacheLookup(None, None)
+
+        try:
+            key = await self._get_key(params)
+            value = await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            metrics.cache_requests.labels(self.namespace, "error").inc()
+            logger.warning(f"Response cache '{self.namespace}' get failed: {e}")
+            return CacheLookup(None, None)
+
+        if value is None:
+            self.misses += 1
+            metrics.cache_requests.labels(self.namespace, "miss").inc()
+            return CacheLookup(key, None)
+
+        (fresh_until,) = FRESH_UNTIL.unpack_from(value)
+        is_stale = fresh_until <= time()
+        if is_stale:
+            self.stale_hits += 1
+            metrics.cache_requests.labels(self.namespace, "stale_hit").inc()
+        else:
+            self.hits += 1
+            metrics.cache_requests.labels(self.namespace, "hit").inc()
+
+        return CacheLookup(key, value[FRESH_UNTIL.size :], is_stale)
+
+    async def set(self, key: str | None, value: bytes) -> None:
+        if key is None:
+            return
+
+        value = FRESH_UNTIL.pack(time() + self.ttl) + value
+        try:
+            await self.backend.set(key, value, self.ttl + self.stale_ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache '{self.namespace}' set failed: {e}")
+
+    async def delete(self, params: Mapping[str, Any]) -> None:
+        """
+        Drop the response of `params`. A response being built from the data
+        read before is set under the old generation and never read.
+        """
+        try:
+            digest = self._get_digest(params)
+            await self.backend.incr_version(self._get_generation_name(digest))
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Response cache '{self.namespace}' delete failed: {e}")
+
+    async def invalidate(self) -> None:
+        try:
+            await self.backend.incr_version(self.namespace)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Response cache '{self.namespace}' invalidate failed: {e}")
+
+    async def _revalidate(
+        self, key: str, build: Callable[[], Awaitable[bytes | None]]
+    ) -> None:
+        try:
+            value = await build()
+            if value is None:
+                await self.backend.delete(key)
+            else:
+                await self.set(key, value)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Response cache '{self.namespace}' revalidate failed: {e}")
+        finally:
+            self._revalidate_tasks.pop(key, None)
+
+    def revalidate(
+        self, key: str | None, build: Callable[[], Awaitable[bytes | None]]
+    ) -> None:
+        """
+        Rebuild a stale response in the background, once per key at a time.
+        `build` returns None when the response must not be cached anymore.
+        """
+        if key is None or key in self._revalidate_tasks:
+            return
+
+        self._revalidate_tasks[key] = asyncio.create_task(self._revalidate(key, build))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "name": self.namespace,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+        }
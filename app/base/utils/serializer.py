@@ -0,0 +1,29 @@
+from typing import Any, Generic, TypeVar
+
+from pydantic import BaseModel, TypeAdapter
+
+T = TypeVar("T")
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+class Page(BaseModel, Generic[T]):
+    after: str | None = None
+    results: list[T] = []
+
+
+class PageSerializer(Generic[T]):
+    """
+    Encode a cursor page of raw documents straight to JSON bytes.
+
+    The documents are validated into `item_type` and dumped by pydantic-core,
+    there are no intermediate models or dicts built in python and FastAPI does
+    not encode the result again when it is returned as a Response.
+    """
+
+    def __init__(self, item_type: type[T]) -> None:
+        self.adapter: TypeAdapter[Page[T]] = TypeAdapter(Page[item_type])  # type: ignore
+
+    def dump_json(self, after: str | None, results: list[Any]) -> bytes:
+        page = self.adapter.validate_python({"after": after, "results": results})
+        return self.adapter.dump_json(page)
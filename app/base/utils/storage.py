@@ -0,0 +1,219 @@
+"""
+Where the media files are kept. The methods are blocking, call them with
+`run_in_threadpool`. Paths are relative to the storage root, like
+"image/ab/cd/<sha256>.jpg".
+"""
+
+import logging
+import os
+import shutil
+from typing import Any, Protocol
+
+from app.base.config import (
+    MEDIA_ROOT,
+    MEDIA_STORAGE,
+    S3_ACCESS_KEY_ID,
+    S3_BUCKET,
+    S3_ENDPOINT_URL,
+    S3_MULTIPART_CHUNK_SIZE,
+    S3_MULTIPART_THRESHOLD,
+    S3_PRESIGNED_URL_TTL,
+    S3_REGION,
+    S3_SECRET_ACCESS_KEY,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Storage(Protocol):
+    def exists(self, path: str) -> bool: ...
+
+    def save(self, path: str, source_location: str, content_type: str) -> None:
+        """Move the local file `source_location` to `path`"""
+        ...
+
+    def delete(self, path: str) -> None: ...
+
+    def get_location(self, path: str) -> str | None:
+        """Local location of `path`, None when the files are not on this disk"""
+        ...
+
+    def get_url(self, path: str) -> str | None:
+        """URL the client downloads `path` from, None when it is served by the app"""
+        ...
+
+
+class LocalStorage:
+    """Files under `root`, served by the media route."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def get_location(self, path: str) -> str | None:
+        root = os.path.realpath(self.root)
+        location = os.path.realpath(os.path.join(root, path))
+
+        if os.path.commonpath([root, location]) != root:
+            return None
+        return location
+
+    def exists(self, path: str) -> bool:
+        location = self.get_location(path)
+        return location is not None and os.path.isfile(location)
+
+    def save(self, path: str, source_location: str, content_type: str) -> None:
+        location = self.get_location(path)
+        if location is None:
+            raise ValueError(f"{path} is outside of the storage root")
+
+        os.makedirs(os.path.dirname(location), exist_ok=True)
+        try:
+            os.replace(source_location, location)
+        except OSError:
+            # Another file system, the temp folder may be on a different volume
+            shutil.move(source_location, location)
+
+    def delete(self, path: str) -> None:
+        location = self.get_location(path)
+        if location and os.path.exists(location):
+            os.remove(location)
+
+    def get_url(self, path: str) -> str | None:
+        return None
+
+
+class S3Storage:
+    """
+    Any S3 compatible object store (AWS, MinIO, R2...). The clients download
+    the files from presigned URLs, the app only redirects to them.
+
+    `client` is a boto3 S3 client or anything with the same methods, a fake in
+    unittest. Files larger than `multipart_threshold` are sent in parts of
+    `multipart_chunk_size` bytes.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        bucket: str,
+        presigned_url_ttl: int = S3_PRESIGNED_URL_TTL,
+        multipart_threshold: int = S3_MULTIPART_THRESHOLD,
+        multipart_chunk_size: int = S3_MULTIPART_CHUNK_SIZE,
+    ) -> None:
+        self.client = client
+        self.bucket = bucket
+        self.presigned_url_ttl = presigned_url_ttl
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunk_size = multipart_chunk_size
+
+    @classmethod
+    def from_config(cls) -> "S3Storage":
+        try:
+            import boto3
+        except ImportError as e:
+            raise ImportError(
+                "MEDIA_STORAGE=s3 requires the boto3 package, run 'uv add boto3'"
+            ) from e
+
+        client = boto3.client(
+            "s3",
+            endpoint_url=S3_ENDPOINT_URL,
+            region_name=S3_REGION,
+            aws_access_key_id=S3_ACCESS_KEY_ID,
+            aws_secret_access_key=S3_SECRET_ACCESS_KEY,
+        )
+        return cls(client, S3_BUCKET)
+
+    def get_location(self, path: str) -> str | None:
+        return None
+
+    def exists(self, path: str) -> bool:
+        # Unlike head_object a missing key is not an error
+        response = self.client.list_objects_v2(
+            Bucket=self.bucket, Prefix=path, MaxKeys=1
+        )
+        return any(obj["Key"] == path for obj in response.get("Contents", []))
+
+    def _upload_parts(self, path: str, file_object: Any, content_type: str) -> None:
+        upload = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=path, ContentType=content_type
+        )
+        upload_id = upload["UploadId"]
+
+        parts = []
+        try:
+            while chunk := file_object.read(self.multipart_chunk_size):
+                part_number = len(parts) + 1
+                response = self.client.upload_part(
+                    Bucket=self.bucket,
+                    Key=path,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=chunk,
+                )
+                parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=path,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except Exception:
+            # Uploaded parts are billed until the upload is aborted
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=path, UploadId=upload_id
+            )
+            raise
+
+    def save(self, path: str, source_location: str, content_type: str) -> None:
+        size = os.path.getsize(source_location)
+
+        with open(source_location, "rb") as file_object:
+            if size > self.multipart_threshold:
+                self._upload_parts(path, file_object, content_type)
+            else:
+                self.client.put_object(
+                    Bucket=self.bucket,
+                    Key=path,
+                    Body=file_object,
+                    ContentType=content_type,
+                )
+
+        os.remove(source_location)
+
+    def delete(self, path: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=path)
+
+    def get_url(self, path: str) -> str | None:
+        return str(
+            self.client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": path},
+                ExpiresIn=self.presigned_url_ttl,
+            )
+        )
+
+
+_storage: Storage | None = None
+
+
+def get_storage() -> Storage:
+    """The configured storage, created on first use"""
+    global _storage
+
+    if _storage is None:
+        if MEDIA_STORAGE == "s3":
+            _storage = S3Storage.from_config()
+        else:
+            _storage = LocalStorage(MEDIA_ROOT)
+        logger.info(f"Media storage: {type(_storage).__name__}")
+
+    return _storage
+
+
+def set_storage(storage: Storage | None) -> None:
+    """Replace the configured storage, None goes back to the configuration"""
+    global _storage
+
+    _storage = storage
@@ -1,6 +1,8 @@
+import glob
 import os
 
 PORT = int(os.environ.get("PORT", "8000"))
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
 GUNICORN_WORKERS = int(os.environ.get("GUNICORN_WORKERS", "4"))
 GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", "2"))
 
@@ -9,6 +11,30 @@ workers = GUNICORN_WORKERS
 threads = GUNICORN_THREADS
 worker_class = "uvicorn.workers.UvicornWorker"
 
+
+def on_starting(server):  # type: ignore
+    """Samples left by a previous run would be summed with the new ones"""
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for file_location in glob.glob(os.path.join(multiproc_dir, "*.db")):
+            os.remove(file_location)
+
+
+def when_ready(server):  # type: ignore
+    """The master serves the samples of every worker, apart from the API port"""
+    if METRICS_PORT and os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from app.base.metrics import serve_metrics
+
+        serve_metrics(METRICS_PORT)
+
+
+def child_exit(server, worker):  # type: ignore
+    from app.base.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+
+
 """
 Equivalent command
 gunicorn --bind=:8000 --workers=2 --threads=4 \
@@ -1,10 +1,10 @@
+from contextlib import asynccontextmanager
 from logging.config import dictConfig
 from typing import Any
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from mongodb_odm import connect, disconnect
-from starlette.middleware.base import BaseHTTPMiddleware
+from mongodb_odm import adisconnect, connect, disconnect
 
 from app.base import config
 from app.base import routers as base_routers
@@ -13,12 +13,46 @@ from app.base.exception_handler import (
     unicorn_exception_handler,
 )
 from app.base.exceptions import CustomException, UnicornException
-from app.base.middleware import catch_exceptions_middleware
+from app.base.metrics import MetricsServer, register_mongo_listener
+from app.base.middleware import (
+    CatchExceptionsMiddleware,
+    MetricsMiddleware,
+    ProfilingMiddleware,
+    QueryBudgetMiddleware,
+    UploadSizeLimitMiddleware,
+)
+from app.base.query_recorder import register_query_listener
+from app.base.services.image import image_pool
+from app.base.utils.lifecycle import run_components
 from app.post import routers as post_routers
+from app.post.services.counter import post_counter, topic_counter
+from app.post.services.topic_catalog import topic_catalog
 from app.user import routers as user_routers
+from app.user.services.auth import password_hash_pool
 
 dictConfig(config.log_config)
-app: Any = FastAPI(debug=config.DEBUG, lifespan=config.lifespan)
+# Before the clients are created by connect
+register_mongo_listener()
+register_query_listener()
+metrics_server = MetricsServer(port=config.METRICS_PORT)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):  # type: ignore
+    connect(config.MONGO_URL, async_is_enabled=True)
+    async with run_components(
+        metrics_server,
+        password_hash_pool,
+        image_pool,
+        post_counter,
+        topic_counter,
+        topic_catalog,
+    ):
+        yield
+    await adisconnect()
+
+
+app: Any = FastAPI(debug=config.DEBUG, lifespan=lifespan)
 
 app.include_router(base_routers.router, tags=["base"])
 app.include_router(post_routers.router, tags=["post"])
@@ -36,7 +70,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-app.add_middleware(BaseHTTPMiddleware, dispatch=catch_exceptions_middleware)
+app.add_middleware(CatchExceptionsMiddleware)
+app.add_middleware(QueryBudgetMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(UploadSizeLimitMiddleware)
+# Outermost, it sees the errors answered by CatchExceptionsMiddleware too
+app.add_middleware(MetricsMiddleware)
 
 
 if __name__ == "__main__":
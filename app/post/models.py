@@ -3,6 +3,7 @@ from typing import Any
 
 from mongodb_odm import (
     ASCENDING,
+    DESCENDING,
     BaseModel,
     Document,
     Field,
@@ -12,24 +13,42 @@ from mongodb_odm import (
 )
 from pymongo import TEXT
 
-from app.user.models import User
+from app.user.models import AuthorSnapshot, User
+
+# Max number of users that a single reaction bucket holds
+REACTION_BUCKET_SIZE = 100
+
+# Every query that wants the "published_feed" index has to include this filter.
+PUBLISHED_POST_FILTER: dict[str, Any] = {"publish_at": {"$type": "date"}}
 
 
 class Topic(Document):
     user_id: ODMObjectId | None = None
     name: str = Field(max_length=127)
+    # normalize_topic_name(name), None on topics not migrated yet
+    normalized_name: str | None = Field(default=None)
     slug: str = Field(...)
     description: str | None = Field(default=None)
+    # Posts tagged with the topic, drafts included
+    total_post: int = Field(default=0)
 
     class ODMConfig(Document.ODMConfig):
         indexes = [
+            IndexModel(
+                [("normalized_name", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"normalized_name": {"$type": "string"}},
+            ),
             IndexModel([("slug", ASCENDING)], unique=True),
+            # Covers the slug to id lookup of the topic feed
+            IndexModel([("slug", ASCENDING), ("_id", ASCENDING)]),
             IndexModel([("name", TEXT)]),
         ]
 
 
 class Post(Document):
     author_id: ODMObjectId = Field(...)
+    author_snapshot: AuthorSnapshot | None = None
 
     title: str = Field(max_length=255)
     slug: str = Field(max_length=300)
@@ -51,8 +70,16 @@ class Post(Document):
     class ODMConfig(Document.ODMConfig):
         indexes = [
             IndexModel([("slug", ASCENDING)], unique=True),
-            IndexModel([("author", ASCENDING)]),
-            IndexModel([("topics", ASCENDING)]),
+            # Author's posts, newest first
+            IndexModel([("author_id", ASCENDING), ("_id", DESCENDING)]),
+            # Topic feed, newest first
+            IndexModel([("topic_ids", ASCENDING), ("_id", DESCENDING)]),
+            # Public feed, newest first. Drafts are not part of the index.
+            IndexModel(
+                [("_id", DESCENDING), ("publish_at", ASCENDING)],
+                name="published_feed",
+                partialFilterExpression=PUBLISHED_POST_FILTER,
+            ),
             IndexModel([("title", TEXT), ("short_description", TEXT)]),
         ]
 
@@ -60,6 +87,7 @@ class Post(Document):
 class EmbeddedReply(BaseModel):
     id: ODMObjectId = Field(default_factory=ODMObjectId)
     user_id: ODMObjectId = Field(...)
+    user_snapshot: AuthorSnapshot | None = None
     description: str = Field(...)
 
     created_at: datetime = Field(default_factory=datetime.now)
@@ -68,6 +96,7 @@ class EmbeddedReply(BaseModel):
 
 class Comment(Document):
     user_id: ODMObjectId = Field(...)
+    user_snapshot: AuthorSnapshot | None = None
     post_id: ODMObjectId = Field(...)
 
     replies: list[EmbeddedReply] = []
@@ -82,18 +111,45 @@ class Comment(Document):
     class ODMConfig(Document.ODMConfig):
         collection_name = "comment"
         indexes = [
-            IndexModel([("post_id", ASCENDING)]),
+            # Comments of a post, newest first
+            IndexModel([("post_id", ASCENDING), ("_id", DESCENDING)]),
+            # Author snapshot fan-out
+            IndexModel([("user_id", ASCENDING)]),
+            IndexModel([("replies.user_id", ASCENDING)]),
         ]
 
 
 class Reaction(Document):
+    """Bucket of users that reacted on a post, `count` is the size of `user_ids`."""
+
     post_id: ODMObjectId = Field(...)
     user_ids: list[ODMObjectId] = []
+    count: int = Field(default=0)
 
     post: Post | None = Relationship(local_field="post_id")
 
     class ODMConfig(Document.ODMConfig):
         collection_name = "reaction"
         indexes = [
-            IndexModel([("post_id", ASCENDING)]),
+            # Find a bucket of a post that still has room
+            IndexModel([("post_id", ASCENDING), ("count", ASCENDING)]),
+        ]
+
+
+class UserReaction(Document):
+    """
+    One document per reaction. The unique index makes reacting idempotent and
+    answers "has this user reacted" without scanning the buckets.
+    """
+
+    post_id: ODMObjectId = Field(...)
+    user_id: ODMObjectId = Field(...)
+    bucket_id: ODMObjectId | None = None
+
+    created_at: datetime = Field(default_factory=datetime.now)
+
+    class ODMConfig(Document.ODMConfig):
+        collection_name = "user_reaction"
+        indexes = [
+            IndexModel([("post_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
         ]
@@ -1,11 +1,13 @@
 import logging
+from datetime import datetime
 from typing import Any
 
-from fastapi import APIRouter, Depends, Query, status
+from fastapi import APIRouter, Depends, Query, Response, status
 from mongodb_odm import ObjectIdStr
+from pydantic import TypeAdapter
 
-from app.base.exceptions import CustomException, ExType
-from app.post.models import Post, Topic
+from app.base.exceptions import CustomException, ExType, ObjectNotFoundException
+from app.base.utils.serializer import JSON_MEDIA_TYPE, PageSerializer
 from app.post.schemas.posts import (
     PostCreate,
     PostDetailsOut,
@@ -16,19 +18,24 @@ from app.post.schemas.posts import (
     TopicOut,
 )
 from app.post.services import post as post_service
+from app.post.services.cache import post_details_cache, post_feed_cache
 from app.user.dependencies import get_authenticated_user, get_authenticated_user_or_none
 from app.user.models import User
 
 router = APIRouter(prefix="/api/v1")
 logger = logging.getLogger(__name__)
 
+topic_page_serializer = PageSerializer(TopicOut)
+post_page_serializer = PageSerializer(PostListOut)
+post_details_adapter = TypeAdapter(PostDetailsOut)
+
 
 @router.post("/topics", status_code=status.HTTP_201_CREATED, response_model=TopicOut)
 async def create_topics(
     topic_data: TopicIn,
     user: User = Depends(get_authenticated_user),
 ) -> Any:
-    topic, _ = post_service.get_or_create_topic(
+    topic = await post_service.get_or_create_topic(
         topic_name=topic_data.name, user_id=user.id
     )
     if not topic:
@@ -48,23 +55,34 @@ async def get_topics(
     after: ObjectIdStr | None = Query(default=None),
     q: str | None = Query(default=None),
     _: User | None = Depends(get_authenticated_user_or_none),
-) -> dict[str, Any]:
+) -> Any:
     topic_qs = post_service.get_topics(
         limit=limit,
         after=after,
         q=q,
     )
 
-    results: list[dict[str, Any]] = []
-    next_cursor = None
+    results = [topic async for topic in topic_qs]
+    next_cursor = results[-1]["_id"] if len(results) == limit else None
 
-    for topic in topic_qs:
-        next_cursor = topic.id
-        results.append(TopicOut(**topic.model_dump()).model_dump())
+    return Response(
+        content=topic_page_serializer.dump_json(ObjectIdStr(next_cursor), results),
+        media_type=JSON_MEDIA_TYPE,
+    )
 
-    next_cursor = next_cursor if len(results) == limit else None
 
-    return {"after": ObjectIdStr(next_cursor), "results": results}
+@router.get("/topics/suggest", status_code=status.HTTP_200_OK)
+async def suggest_topics(
+    # One letter matches a large part of the topics
+    q: str = Query(min_length=2, max_length=100),
+    limit: int = Query(default=10, le=50),
+) -> Any:
+    results = await post_service.suggest_topics(q=q, limit=limit)
+
+    return Response(
+        content=topic_page_serializer.dump_json(None, results),
+        media_type=JSON_MEDIA_TYPE,
+    )
 
 
 @router.post(
@@ -75,7 +93,7 @@ async def get_topics(
 async def create_posts(
     post_data: PostCreate, user: User = Depends(get_authenticated_user)
 ) -> Any:
-    post = post_service.create_post(
+    post = await post_service.create_post(
         user,
         title=post_data.title,
         topics=post_data.topics,
@@ -96,8 +114,17 @@ async def get_posts(
     topics: list[str] = Query(default=[]),
     username: str | None = Query(default=None),
     user: User | None = Depends(get_authenticated_user_or_none),
-) -> dict[str, Any]:
-    post_qs = post_service.get_posts(
+) -> Any:
+    # Without username the result is the same for every user
+    cache_key = None
+    if username is None:
+        cache_params = {"limit": limit, "after": after, "q": q, "topics": topics}
+        cached = await post_feed_cache.get(cache_params)
+        if cached.value is not None:
+            return Response(content=cached.value, media_type=JSON_MEDIA_TYPE)
+        cache_key = cached.key
+
+    post_qs = await post_service.get_posts(
         limit=limit,
         after=after,
         topics=topics,
@@ -105,17 +132,31 @@ async def get_posts(
         username=username,
         user=user,
     )
+    results = await post_service.load_posts_with_author(post_qs)
+    next_cursor = results[-1]["_id"] if len(results) == limit else None
 
-    results: list[dict[str, Any]] = []
-    next_cursor = None
+    content = post_page_serializer.dump_json(ObjectIdStr(next_cursor), results)
+    await post_feed_cache.set(cache_key, content)
 
-    for post in Post.load_related(post_qs):
-        next_cursor = post.id
-        results.append(PostListOut(**post.model_dump()).model_dump())
+    return Response(content=content, media_type=JSON_MEDIA_TYPE)
 
-    next_cursor = next_cursor if len(results) == limit else None
 
-    return {"after": ObjectIdStr(next_cursor), "results": results}
+def _render_post_details(post: dict[str, Any]) -> bytes:
+    return post_details_adapter.dump_json(post_details_adapter.validate_python(post))
+
+
+def _is_public(post: dict[str, Any]) -> bool:
+    publish_at = post.get("publish_at")
+    return publish_at is not None and publish_at <= datetime.now()
+
+
+async def _rebuild_post_details(slug: str) -> bytes | None:
+    try:
+        post = await post_service.get_post_details_document_or_404(slug)
+    except ObjectNotFoundException:
+        return None
+
+    return _render_post_details(post)
 
 
 @router.get("/posts/{slug}", status_code=status.HTTP_200_OK)
@@ -123,16 +164,23 @@ async def get_post_details(
     slug: str,
     user: User | None = Depends(get_authenticated_user_or_none),
 ) -> Any:
+    cached = await post_details_cache.get({"slug": slug})
+    if cached.value is not None:
+        if cached.is_stale:
+            post_details_cache.revalidate(
+                cached.key, lambda: _rebuild_post_details(slug)
+            )
+        return Response(content=cached.value, media_type=JSON_MEDIA_TYPE)
+
     user_id = user.id if user else None
-    post = post_service.get_post_details_or_404(slug, user_id)
+    post = await post_service.get_post_details_document_or_404(slug, user_id)
 
-    post.author = User.find_one({"_id": post.author_id})
-    post.topics = [
-        TopicOut(**topic.model_dump())
-        for topic in Topic.find({"_id": {"$in": post.topic_ids}})
-    ]
+    content = _render_post_details(post)
+    # Drafts are only visible to their author
+    if _is_public(post):
+        await post_details_cache.set(cached.key, content)
 
-    return PostDetailsOut(**post.model_dump()).model_dump()
+    return Response(content=content, media_type=JSON_MEDIA_TYPE)
 
 
 @router.patch("/posts/{slug}", status_code=status.HTTP_200_OK)
@@ -141,7 +189,7 @@ async def update_posts(
     post_data: PostUpdate,
     user: User = Depends(get_authenticated_user),
 ) -> Any:
-    post = post_service.get_post_details_or_404(slug, user.id)
+    post = await post_service.get_post_details_or_404(slug, user.id)
 
     if post.author_id != user.id:
         raise CustomException(
@@ -150,7 +198,7 @@ async def update_posts(
             detail="You don't have access to update this post.",
         )
 
-    post = post_service.update_post(user, post, post_data)
+    post = await post_service.update_post(user, post, post_data)
 
     return {"message": "Post Updated"}
 
@@ -160,7 +208,7 @@ async def delete_post(
     slug: str,
     user: User = Depends(get_authenticated_user),
 ) -> Any:
-    post = post_service.get_post_details_or_404(slug, user.id)
+    post = await post_service.get_post_details_or_404(slug, user.id)
 
     if post.author_id != user.id:
         raise CustomException(
@@ -169,6 +217,6 @@ async def delete_post(
             detail="You don't have access to delete this post.",
         )
 
-    post_service.delete_post(post)
+    await post_service.delete_post(post)
 
     return {"message": "Deleted"}
@@ -1,8 +1,9 @@
 from datetime import datetime
 
 from mongodb_odm import ObjectIdStr
-from pydantic import BaseModel
+from pydantic import AliasChoices, BaseModel, Field
 
+from app.base.utils.query import get_projection
 from app.user.schemas import PublicUserListOut
 
 
@@ -24,7 +25,8 @@ class ReplyOut(BaseModel):
 
 
 class CommentOut(BaseModel):
-    id: ObjectIdStr
+    # Raw documents have "_id"
+    id: ObjectIdStr = Field(validation_alias=AliasChoices("id", "_id"))
     user: PublicUserListOut | None = None
 
     description: str
@@ -32,3 +34,13 @@ class CommentOut(BaseModel):
 
     created_at: datetime
     updated_at: datetime
+
+
+# Fields read by the service layer, `user` of comments and replies is joined
+COMMENT_PROJECTION = get_projection(
+    CommentOut,
+    joined={
+        "user": ["user_id", "user_snapshot"],
+        "replies.user": ["replies.user_id", "replies.user_snapshot"],
+    },
+)
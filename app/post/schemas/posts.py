@@ -3,6 +3,7 @@ from typing import Any
 
 from pydantic import BaseModel, Field
 
+from app.base.utils.query import get_projection
 from app.user.schemas import PublicUserListOut
 
 
@@ -70,3 +71,10 @@ class PostDetailsOut(BaseModel):
 
     description: dict[Any, Any] | None = None
     topics: list[TopicOut] = []
+
+
+# Fields read by the service layer for each list, `author` is joined
+TOPIC_PROJECTION = get_projection(TopicOut)
+POST_LIST_PROJECTION = get_projection(
+    PostListOut, joined={"author": ["author_id", "author_snapshot"]}
+)
@@ -0,0 +1,138 @@
+"""
+Copies of the author public fields embedded in posts, comments and replies.
+
+Lists are rendered from the snapshots without a query on the users. A profile
+update bumps `User.profile_version` and fans the new snapshot out in the
+background. The updates only replace older versions, so fan-outs finishing
+out of order never bring back an old name.
+
+Writes read the snapshot from the users collection, never from the cached
+user, which may be older than the last fan-out in another worker. A write
+racing the fan-out can still keep the old version; `sync-author-snapshots`
+rewrites those and backfills documents created before the snapshots existed.
+"""
+
+import logging
+from typing import Any, NamedTuple
+
+from mongodb_odm import Document, ODMObjectId
+
+from app.post.models import Comment, Post
+from app.post.services.cache import post_details_cache, post_feed_cache
+from app.user.models import AuthorSnapshot, User
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FIELDS = ("username", "full_name", "image")
+SNAPSHOT_USER_PROJECTION = dict.fromkeys((*SNAPSHOT_FIELDS, "profile_version"), 1)
+
+
+class SnapshotUpdate(NamedTuple):
+    model: type[Document]
+    filter: dict[str, Any]
+    update: dict[str, Any]
+    array_filters: list[dict[str, Any]] | None = None
+
+
+def has_snapshot_changed(old: User, new: User) -> bool:
+    return any(getattr(old, field) != getattr(new, field) for field in SNAPSHOT_FIELDS)
+
+
+def get_snapshot_from_raw(user: dict[str, Any]) -> AuthorSnapshot:
+    return AuthorSnapshot(
+        username=user["username"],
+        full_name=user["full_name"],
+        image=user.get("image"),
+        version=user.get("profile_version", 0),
+    )
+
+
+def _older_than(field: str, version: int) -> dict[str, Any]:
+    # Documents without a snapshot match as well
+    return {field: {"$not": {"$gte": version}}}
+
+
+def get_snapshot_updates(
+    user_id: ODMObjectId, snapshot: AuthorSnapshot
+) -> list[SnapshotUpdate]:
+    """The writes replacing the older snapshots of a user, for sync and async"""
+    data = snapshot.model_dump()
+
+    return [
+        SnapshotUpdate(
+            Post,
+            {
+                "author_id": user_id,
+                **_older_than("author_snapshot.version", data["version"]),
+            },
+            {"$set": {"author_snapshot": data}},
+        ),
+        SnapshotUpdate(
+            Comment,
+            {
+                "user_id": user_id,
+                **_older_than("user_snapshot.version", data["version"]),
+            },
+            {"$set": {"user_snapshot": data}},
+        ),
+        SnapshotUpdate(
+            Comment,
+            {"replies.user_id": user_id},
+            {"$set": {"replies.$[reply].user_snapshot": data}},
+            [
+                {
+                    "reply.user_id": user_id,
+                    **_older_than("reply.user_snapshot.version", data["version"]),
+                }
+            ],
+        ),
+    ]
+
+
+async def get_author_snapshot(user_id: ODMObjectId) -> AuthorSnapshot | None:
+    """Current snapshot of the user, None if the user is gone"""
+    user_qs = User.afind_raw(
+        {"_id": user_id}, projection=SNAPSHOT_USER_PROJECTION, limit=1
+    )
+    user = await anext(user_qs, None)
+
+    return get_snapshot_from_raw(user) if user else None
+
+
+async def _invalidate_author_posts(user_id: ODMObjectId) -> None:
+    """Cached responses embedding the author"""
+    await post_feed_cache.invalidate()
+
+    if not post_details_cache.is_enabled:
+        return
+
+    # The details join the author, they are stale whatever was modified
+    post_qs = Post.afind_raw(
+        {"author_id": user_id, "publish_at": {"$ne": None}}, projection={"slug": 1}
+    )
+    async for post in post_qs:
+        await post_details_cache.delete({"slug": post["slug"]})
+
+
+async def fan_out_author_snapshot(user_id: ODMObjectId) -> None:
+    """Background task of the profile update"""
+    # Latest profile, an earlier task may run after a later update
+    snapshot = await get_author_snapshot(user_id)
+    if snapshot is None:
+        return
+
+    modified: dict[str, int] = {}
+    for snapshot_update in get_snapshot_updates(user_id, snapshot):
+        kwargs = {}
+        if snapshot_update.array_filters:
+            kwargs["array_filters"] = snapshot_update.array_filters
+
+        result = await snapshot_update.model.aupdate_many(
+            snapshot_update.filter, snapshot_update.update, **kwargs
+        )
+        name = snapshot_update.model._get_collection_name()
+        modified[name] = modified.get(name, 0) + result.modified_count
+
+    logger.info(f"Author snapshot of user={user_id} updated: {modified}")
+
+    await _invalidate_author_posts(user_id)
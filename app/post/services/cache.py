@@ -0,0 +1,47 @@
+import logging
+from typing import Any
+
+from app.base.config import (
+    POST_DETAILS_CACHE_STALE_TTL,
+    POST_DETAILS_CACHE_TTL,
+    POST_FEED_CACHE_TTL,
+    RESPONSE_CACHE_MAX_SIZE,
+    RESPONSE_CACHE_URL,
+)
+from app.base.utils.response_cache import ResponseCache, get_cache_backend
+from app.post.models import Post
+
+logger = logging.getLogger(__name__)
+
+response_cache_backend = get_cache_backend(RESPONSE_CACHE_URL, RESPONSE_CACHE_MAX_SIZE)
+
+"""
+Public post feed, the posts list without `username`.
+It is dropped whenever a published post is created, changed or deleted.
+Counters and author details of the listed posts may lag by up to the TTL.
+"""
+post_feed_cache = ResponseCache(
+    namespace="post-feed", backend=response_cache_backend, ttl=POST_FEED_CACHE_TTL
+)
+
+"""
+Details of published posts keyed by slug. An entry is dropped when the post
+is changed or deleted and when its counters are written.
+"""
+post_details_cache = ResponseCache(
+    namespace="post-details",
+    backend=response_cache_backend,
+    ttl=POST_DETAILS_CACHE_TTL,
+    stale_ttl=POST_DETAILS_CACHE_STALE_TTL,
+)
+
+
+async def invalidate_post_details(post_ids: list[Any]) -> None:
+    if not post_details_cache.is_enabled:
+        return
+
+    posts = Post.afind_raw({"_id": {"$in": post_ids}}, projection={"slug": 1})
+    async for post in posts:
+        await post_details_cache.delete({"slug": post["slug"]})
+
+    logger.debug(f"Removed cached details of {len(post_ids)} posts")
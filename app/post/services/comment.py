@@ -1,83 +1,94 @@
 import logging
-from collections.abc import Iterator
+from collections.abc import AsyncIterator
 from typing import Any
 
 from fastapi import status
 from mongodb_odm import ODMObjectId
 
 from app.base.exceptions import CustomException, ExType
+from app.base.utils.profiling import profiled
 from app.base.utils.query import get_object_or_404
-from app.post.models import Comment, EmbeddedReply, Post
-from app.post.schemas.comments import CommentOut
+from app.post.models import Comment, EmbeddedReply
+from app.post.schemas.comments import COMMENT_PROJECTION
+from app.post.services.author import get_author_snapshot
+from app.post.services.counter import post_counter
 from app.user.models import User
+from app.user.schemas import PUBLIC_USER_PROJECTION
 
 logger = logging.getLogger(__name__)
 
 
-def update_total_comment(post_id: Any, val: int) -> None:
-    Post.update_one({"_id": ODMObjectId(post_id)}, {"$inc": {"total_comment": val}})
+async def update_total_comment(post_id: Any, val: int) -> None:
+    await post_counter.incr(ODMObjectId(post_id), "total_comment", val)
 
 
 def get_comments(
     post_id: ODMObjectId,
     limit: int,
     after: str | ODMObjectId | None = None,
-) -> Iterator[Comment]:
+) -> AsyncIterator[dict[str, Any]]:
     filter: dict[str, Any] = {"post_id": post_id}
 
     if after:
         filter["_id"] = {"$lt": ODMObjectId(after)}
 
-    comment_qs = Comment.find(filter, sort=(("_id", -1),), limit=limit)
+    comment_qs = Comment.afind_raw(
+        filter, projection=COMMENT_PROJECTION, sort=[("_id", -1)], limit=limit
+    )
 
     return comment_qs
 
 
-def load_comments_with_details(
-    comment_qs: Iterator[Comment],
+@profiled()
+async def load_comments_with_details(
+    comment_qs: AsyncIterator[dict[str, Any]],
 ) -> tuple[ODMObjectId | None, list[dict[str, Any]]]:
-    comments = Comment.load_related(comment_qs, fields=["user"])
-
-    user_ids = list(
-        {replies.user_id for comment in comments for replies in comment.replies}
-    )
-    users_dict = {
-        user.id: user.model_dump() for user in User.find({"_id": {"$in": user_ids}})
+    """Raw comments with the `user` of every comment and reply, ready for CommentOut"""
+    comments = [comment async for comment in comment_qs]
+
+    # Only comments and replies written before the user snapshot need the users
+    user_ids = {
+        obj["user_id"]
+        for comment in comments
+        for obj in [comment, *comment.get("replies", [])]
+        if not obj.get("user_snapshot")
     }
-
-    results: list[dict[str, Any]] = []
-    next_cursor = None
+    users = {}
+    if user_ids:
+        users = {
+            user["_id"]: user
+            async for user in User.afind_raw(
+                {"_id": {"$in": list(user_ids)}}, projection=PUBLIC_USER_PROJECTION
+            )
+        }
 
     for comment in comments:
-        next_cursor = comment.id
-        comment_dict = comment.model_dump()
-
-        for reply in comment_dict["replies"]:
-            # Assign child replies
-            reply["user"] = users_dict.get(reply["user_id"])
+        for obj in [comment, *comment.get("replies", [])]:
+            obj["user"] = obj.get("user_snapshot") or users.get(obj["user_id"])
 
-        results.append(CommentOut(**comment_dict).model_dump())
+    next_cursor = comments[-1]["_id"] if comments else None
 
-    return next_cursor, results
+    return next_cursor, comments
 
 
-def create_comment(
+async def create_comment(
     user_id: ODMObjectId,
     post_id: ODMObjectId,
     description: str,
 ) -> Comment:
-    comment = Comment(
+    comment = await Comment(
         user_id=user_id,
+        user_snapshot=await get_author_snapshot(user_id),
         post_id=post_id,
         description=description,
-    ).create()
+    ).acreate()
 
-    update_total_comment(post_id, 1)
+    await update_total_comment(post_id, 1)
 
     return comment
 
 
-def get_comment_details_or_404(
+async def get_comment_details_or_404(
     comment_id: ODMObjectId,
     post_id: ODMObjectId | None = None,
 ) -> Comment:
@@ -85,18 +96,18 @@ def get_comment_details_or_404(
     if post_id:
         filter["post_id"] = post_id
 
-    comment: Comment = get_object_or_404(Comment, filter)
+    comment: Comment = await get_object_or_404(Comment, filter)
 
     return comment
 
 
-def update_comment(
+async def update_comment(
     comment_id: ODMObjectId | str,
     user_id: ODMObjectId,
     post_id: ODMObjectId | None,
     description: str,
 ) -> Comment:
-    comment = get_comment_details_or_404(ODMObjectId(comment_id), post_id)
+    comment = await get_comment_details_or_404(ODMObjectId(comment_id), post_id)
 
     if comment.user_id != user_id:
         raise CustomException(
@@ -106,15 +117,15 @@ def update_comment(
         )
 
     comment.description = description
-    comment.update()
+    await comment.aupdate()
 
     return comment
 
 
-def delete_comment(
+async def delete_comment(
     comment_id: ODMObjectId | str, user_id: ODMObjectId, post_id: ODMObjectId
 ) -> None:
-    comment = get_comment_details_or_404(ODMObjectId(comment_id), post_id)
+    comment = await get_comment_details_or_404(ODMObjectId(comment_id), post_id)
 
     if comment.user_id != user_id:
         raise CustomException(
@@ -123,14 +134,16 @@ def delete_comment(
             detail="You don't have access to delete this comment.",
         )
 
-    comment.delete()
-    update_total_comment(post_id, -1)
+    await comment.adelete()
+    await update_total_comment(post_id, -1)
 
 
-def create_reply(
-    comment_id: ODMObjectId | str, user_id: ODMObjectId, description: str
+async def create_reply(
+    comment_id: ODMObjectId | str,
+    user_id: ODMObjectId,
+    description: str,
 ) -> EmbeddedReply:
-    comment = get_comment_details_or_404(ODMObjectId(comment_id))
+    comment = await get_comment_details_or_404(ODMObjectId(comment_id))
 
     if len(comment.replies) >= 100:
         # Limit the number of replies to 100 for a single comment
@@ -140,13 +153,18 @@ def create_reply(
             detail="Comment should have less then 100 replies.",
         )
 
-    reply = EmbeddedReply(id=ODMObjectId(), user_id=user_id, description=description)
-    comment.update(raw={"$push": {"replies": reply.model_dump()}})
+    reply = EmbeddedReply(
+        id=ODMObjectId(),
+        user_id=user_id,
+        user_snapshot=await get_author_snapshot(user_id),
+        description=description,
+    )
+    await comment.aupdate(raw={"$push": {"replies": reply.model_dump()}})
 
     return reply
 
 
-def update_reply(
+async def update_reply(
     comment_id: ODMObjectId | str,
     reply_id: ODMObjectId | str,
     user_id: ODMObjectId,
@@ -154,7 +172,7 @@ def update_reply(
 ) -> bool:
     reply_id = ODMObjectId(reply_id)
 
-    update_comment = Comment.update_one(
+    update_comment = await Comment.aupdate_one(
         {
             "_id": ODMObjectId(comment_id),
             "replies.id": reply_id,
@@ -174,14 +192,14 @@ def update_reply(
     return True
 
 
-def delete_reply(
+async def delete_reply(
     comment_id: ODMObjectId | str,
     reply_id: ODMObjectId | str,
     user_id: ODMObjectId,
 ) -> bool:
     reply_id = ODMObjectId(reply_id)
 
-    update_comment = Comment.update_one(
+    update_comment = await Comment.aupdate_one(
         {
             "_id": ODMObjectId(comment_id),
             "replies": {
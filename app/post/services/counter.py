@@ -0,0 +1,21 @@
+from app.base.config import COUNTER_FLUSH_INTERVAL, COUNTER_FLUSH_MAX_SIZE
+from app.base.utils.counter_buffer import CounterBuffer
+from app.post.models import Post, Topic
+from app.post.services.cache import invalidate_post_details
+
+"""total_comment and total_reaction of Post"""
+post_counter = CounterBuffer(
+    name="post",
+    model=Post,
+    flush_interval=COUNTER_FLUSH_INTERVAL,
+    max_size=COUNTER_FLUSH_MAX_SIZE,
+    on_write=invalidate_post_details,
+)
+
+"""total_post of Topic"""
+topic_counter = CounterBuffer(
+    name="topic",
+    model=Topic,
+    flush_interval=COUNTER_FLUSH_INTERVAL,
+    max_size=COUNTER_FLUSH_MAX_SIZE,
+)
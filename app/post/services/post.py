@@ -1,65 +1,144 @@
+import hashlib
 import logging
-from collections.abc import Iterator
+import re
+from collections.abc import AsyncIterator
 from datetime import datetime
 from typing import Any
 
 from fastapi import status
-from mongodb_odm import ODMObjectId
+from mongodb_odm import InsertOne, ODMObjectId
+from pymongo.errors import BulkWriteError
 from slugify import slugify
 
 from app.base.exceptions import CustomException, ExType, ObjectNotFoundException
+from app.base.services.media import update_media_references
 from app.base.utils import update_partially
+from app.base.utils.profiling import profiled
 from app.base.utils.query import get_object_or_404
 from app.base.utils.string import rand_slug_str
-from app.post.models import Comment, Post, Reaction, Topic
-from app.post.schemas.posts import PostUpdate
+from app.post.models import Comment, Post, Reaction, Topic, UserReaction
+from app.post.schemas.posts import POST_LIST_PROJECTION, TOPIC_PROJECTION, PostUpdate
+from app.post.services.author import get_author_snapshot
+from app.post.services.cache import post_details_cache, post_feed_cache
+from app.post.services.counter import topic_counter
+from app.post.services.topic_catalog import topic_catalog
+from app.post.utils import normalize_topic_name
 from app.user.models import User
+from app.user.schemas import PUBLIC_USER_PROJECTION
 
 logger = logging.getLogger(__name__)
 
+DUPLICATE_KEY_ERROR = 11000
 
-def get_or_create_topic(
-    topic_name: str, user_id: ODMObjectId | None = None
-) -> tuple[Topic, bool]:
-    topic = Topic.find_one({"name": topic_name})
-    if topic:
-        return topic, False
 
-    slug = slugify(topic_name)
+def get_topic_slug(name: str, normalized_name: str) -> str:
+    # One name always gets the same slug, racing inserts collide on the indexes
+    digest = hashlib.sha256(normalized_name.encode()).hexdigest()[:8]
+    return f"{slugify(name)}-{digest}"
 
-    for i in range(1, 20):
-        try:
-            topic = Topic(
-                name=topic_name,
-                slug=f"{slug}-{rand_slug_str(i)}",
-                user_id=user_id,
-            ).create()
 
-            return topic, False
-        except Exception:
-            logger.info(
-                f"Failed to create topic with name '{topic_name}'. Attempt {i}."
-            )
+async def _find_topics(normalized_names: list[str]) -> dict[str, Topic]:
+    topics: dict[str, Topic] = {}
+    for normalized_name in normalized_names:
+        topic = topic_catalog.get_by_normalized_name(normalized_name)
+        if topic:
+            topics[normalized_name] = topic
 
-    raise Exception("Unable to create the Topic")
+    # Not in the catalog yet when created by another process a moment ago
+    missing = [name for name in normalized_names if name not in topics]
+    if missing:
+        async for topic in Topic.afind({"normalized_name": {"$in": missing}}):
+            topics[topic.normalized_name] = topic  # type: ignore
 
+    return topics
 
-def get_or_create_post_topics(topics_name: list[str], user: User) -> list[Topic]:
-    topics: list[Topic] = []
 
+async def _insert_topics(topics: list[Topic]) -> set[int]:
+    """Insert in one round-trip, return the indexes that already existed"""
+    requests = [InsertOne({"_id": topic.id, **topic.to_mongo()}) for topic in topics]
+    try:
+        await Topic.abulk_write(requests=requests, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details["writeErrors"]
+        if any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        return {error["index"] for error in errors}
+
+    return set()
+
+
+async def get_or_create_topics(
+    topics_name: list[str], user_id: ODMObjectId | None = None
+) -> list[Topic]:
+    """
+    Topics in the order of the names, the missing ones are created. Names that
+    only differ by case or spaces are the same topic.
+    """
+    names: dict[str, str] = {}
     for topic_name in topics_name:
-        topic, _ = get_or_create_topic(topic_name=topic_name, user_id=user.id)
-        if topic:
-            topics.append(topic)
+        name = " ".join(topic_name.split())
+        if name:
+            names.setdefault(normalize_topic_name(name), name)
+    if not names:
+        return []
+
+    topics = await _find_topics(list(names))
+
+    new_topics = [
+        Topic(
+            name=name,
+            normalized_name=normalized_name,
+            slug=get_topic_slug(name, normalized_name),
+            user_id=user_id,
+        )
+        for normalized_name, name in names.items()
+        if normalized_name not in topics
+    ]
+    if new_topics:
+        duplicates = await _insert_topics(new_topics)
+        for index, topic in enumerate(new_topics):
+            if index not in duplicates:
+                topics[topic.normalized_name] = topic  # type: ignore
+                topic_catalog.add(topic)
+
+        if duplicates:
+            # Created by a concurrent request since the first query
+            raced_names = [new_topics[index].normalized_name for index in duplicates]
+            topics.update(await _find_topics(raced_names))  # type: ignore
+
+    missing = [
+        name for normalized_name, name in names.items() if normalized_name not in topics
+    ]
+    if missing:
+        logger.error(f"Unable to create the topics {missing}")
+        raise Exception("Unable to create the Topic")
+
+    return [topics[normalized_name] for normalized_name in names]
+
+
+async def update_total_post(topic_ids: list[ODMObjectId], val: int) -> None:
+    for topic_id in topic_ids:
+        await topic_counter.incr(topic_id, "total_post", val)
+
+
+async def get_or_create_topic(
+    topic_name: str, user_id: ODMObjectId | None = None
+) -> Topic | None:
+    """None for a blank name"""
+    topics = await get_or_create_topics([topic_name], user_id)
 
-    return topics
+    return topics[0] if topics else None
+
+
+async def get_or_create_post_topics(topics_name: list[str], user: User) -> list[Topic]:
+    return await get_or_create_topics(topics_name, user.id)
 
 
 def get_topics(
     limit: int,
     after: str | ODMObjectId | None = None,
     q: str | None = None,
-) -> Iterator[Topic]:
+) -> AsyncIterator[dict[str, Any]]:
     filter: dict[str, Any] = {}
 
     if q:
@@ -69,15 +148,35 @@ def get_topics(
 
     sort = [("_id", -1)]
 
-    return Topic.find(filter=filter, sort=sort, limit=limit)
+    return Topic.afind_raw(filter, projection=TOPIC_PROJECTION, sort=sort, limit=limit)
 
 
-def set_post_slug(post: Post) -> Post:
+async def suggest_topics(q: str, limit: int) -> list[dict[str, Any]]:
+    """Topics with a word starting with `q`, the most used first"""
+    if topic_catalog.is_loaded:
+        topics = topic_catalog.suggest(q, limit)
+        return [topic.model_dump(include=set(TOPIC_PROJECTION)) for topic in topics]
+
+    prefix = normalize_topic_name(q)
+    if not prefix:
+        return []
+
+    # Catalog not started (CLI, unittest), scans the topics
+    filter = {"normalized_name": {"$regex": f"(^| ){re.escape(prefix)}"}}
+    sort = [("total_post", -1), ("name", 1)]
+    topic_qs = Topic.afind_raw(
+        filter, projection=TOPIC_PROJECTION, sort=sort, limit=limit
+    )
+
+    return [topic async for topic in topic_qs]
+
+
+async def set_post_slug(post: Post) -> Post:
     slug = slugify(post.title)
     for i in range(1, 10):
         try:
             new_slug = f"{slug}-{rand_slug_str(i)}" if i > 1 else slug
-            post.update(raw={"$set": {"slug": new_slug}})
+            await post.aupdate(raw={"$set": {"slug": new_slug}})
             post.slug = new_slug
 
             return post
@@ -87,7 +186,7 @@ def set_post_slug(post: Post) -> Post:
                       Attempt {i}."
             )
 
-    post.delete()
+    await post.adelete()
 
     raise CustomException(
         status_code=status.HTTP_400_BAD_REQUEST,
@@ -97,7 +196,8 @@ def set_post_slug(post: Post) -> Post:
     )
 
 
-def create_post(
+@profiled()
+async def create_post(
     user: User,
     title: str,
     topics: list[str],
@@ -106,12 +206,13 @@ def create_post(
     description: dict[str, Any] | None = None,
     cover_image: str | None = None,
 ) -> Post:
-    topic_objects = get_or_create_post_topics(topics, user)
+    topic_objects = await get_or_create_post_topics(topics, user)
 
     publish_at = datetime.now() if publish_now else None
 
-    post = Post(
+    post = await Post(
         author_id=user.id,
+        author_snapshot=await get_author_snapshot(user.id),
         slug=str(ODMObjectId()),
         title=title,
         short_description=short_description,
@@ -119,24 +220,76 @@ def create_post(
         cover_image=cover_image,
         publish_at=publish_at,
         topic_ids=[topic.id for topic in topic_objects],
-    ).create()
+    ).acreate()
 
-    post = set_post_slug(post)
+    post = await set_post_slug(post)
     post.topics = topic_objects
+    await update_total_post(post.topic_ids, 1)
+    await update_media_references(None, post.cover_image)
+
+    if post.publish_at:
+        await post_feed_cache.invalidate()
 
     return post
 
 
-def get_posts(
+async def get_topics_by_ids(topic_ids: list[ODMObjectId]) -> list[dict[str, Any]]:
+    """Raw topics in the order of `topic_ids`, ready for TopicOut"""
+    topics: dict[ODMObjectId, dict[str, Any]] = {}
+    for topic_id in topic_ids:
+        topic = topic_catalog.get(topic_id)
+        if topic:
+            topics[topic_id] = topic.model_dump(include=set(TOPIC_PROJECTION))
+
+    missing = [topic_id for topic_id in topic_ids if topic_id not in topics]
+    if missing:
+        topic_qs = Topic.afind_raw(
+            {"_id": {"$in": missing}}, projection=TOPIC_PROJECTION
+        )
+        topics.update({obj["_id"]: obj async for obj in topic_qs})
+
+    return [topics[topic_id] for topic_id in topic_ids if topic_id in topics]
+
+
+async def get_topic_ids_by_slug(slugs: list[str]) -> list[ODMObjectId]:
+    topic_ids: list[ODMObjectId] = []
+    missing: list[str] = []
+    for slug in slugs:
+        topic = topic_catalog.get_by_slug(slug)
+        if topic:
+            topic_ids.append(topic.id)
+        else:
+            missing.append(slug)
+
+    if missing:
+        # Covered by the ("slug", "_id") index
+        topic_qs = Topic.afind_raw({"slug": {"$in": missing}}, projection={"_id": 1})
+        topic_ids.extend([ODMObjectId(obj["_id"]) async for obj in topic_qs])
+
+    return topic_ids
+
+
+async def get_user_id_or_404(username: str) -> ODMObjectId:
+    # Covered by the ("username", "_id") index
+    user_qs = User.afind_raw({"username": username}, projection={"_id": 1}, limit=1)
+    user = await anext(user_qs, None)
+    if user is None:
+        raise ObjectNotFoundException(detail="User not found")
+
+    return ODMObjectId(user["_id"])
+
+
+async def get_posts(
     limit: int,
     after: str | ODMObjectId | None = None,
     q: str | None = None,
     topics: list[str] | None = None,
     username: str | None = None,
     user: User | None = None,
-) -> Iterator[Post]:
+) -> AsyncIterator[dict[str, Any]]:
     filter: dict[str, Any] = {
-        "publish_at": {"$ne": None, "$lt": datetime.now()},
+        # "$type" matches the partial filter of the "published_feed" index
+        "publish_at": {"$type": "date", "$lt": datetime.now()},
     }
 
     if username:
@@ -144,15 +297,10 @@ def get_posts(
             filter["author_id"] = user.id
             filter.pop("publish_at")
         else:
-            user = User.get({"username": username})
-            filter["author_id"] = user.id
+            filter["author_id"] = await get_user_id_or_404(username)
 
     if topics:
-        topic_ids = [
-            ODMObjectId(obj["_id"])
-            for obj in Topic.find_raw({"slug": {"$in": topics}}, projection={"slug": 1})
-        ]
-        filter["topic_ids"] = {"$in": topic_ids}
+        filter["topic_ids"] = {"$in": await get_topic_ids_by_slug(topics)}
     if q:
         filter["$text"] = {"$search": q}
     if after:
@@ -160,35 +308,124 @@ def get_posts(
 
     sort = [("_id", -1)]
 
-    post_qs = Post.find(
-        filter=filter,
+    post_qs = Post.afind_raw(
+        filter,
         sort=sort,
         limit=limit,
-        projection={"description": 0},
+        projection=POST_LIST_PROJECTION,
     )
 
     return post_qs
 
 
-def get_post_details_or_404(slug: str, user_id: ODMObjectId | None = None) -> Post:
+@profiled()
+async def load_posts_with_author(
+    post_qs: AsyncIterator[dict[str, Any]],
+) -> list[dict[str, Any]]:
+    posts = [post async for post in post_qs]
+
+    # Only posts written before the author snapshot need the users
+    author_ids = list(
+        {post["author_id"] for post in posts if not post.get("author_snapshot")}
+    )
+    authors = {}
+    if author_ids:
+        authors = {
+            author["_id"]: author
+            async for author in User.afind_raw(
+                {"_id": {"$in": author_ids}}, projection=PUBLIC_USER_PROJECTION
+            )
+        }
+
+    for post in posts:
+        post["author"] = post.get("author_snapshot") or authors.get(post["author_id"])
+
+    return posts
+
+
+def _check_post_access(
+    post_id: Any,
+    author_id: Any,
+    publish_at: datetime | None,
+    user_id: ODMObjectId | None = None,
+) -> None:
+    if publish_at is None or publish_at > datetime.now():
+        if user_id is None or user_id != author_id:
+            logger.warning(
+                f"User={user_id} trying to access unauthorized post={post_id}"
+            )
+            raise ObjectNotFoundException()
+
+
+async def get_post_details_or_404(
+    slug: str, user_id: ODMObjectId | None = None
+) -> Post:
     filter: dict[str, Any] = {
         "slug": slug,
         # "publish_at": {"$ne": None, "$lt": datetime.now()},
     }
 
-    post: Post = get_object_or_404(Post, filter=filter)
+    post: Post = await get_object_or_404(Post, filter=filter)
 
-    if post.publish_at is None or post.publish_at > datetime.now():
-        if user_id is None or user_id != post.author_id:
-            logger.warning(
-                f"User={user_id} trying to access unauthorized post={post.id}"
-            )
-            raise ObjectNotFoundException()
+    _check_post_access(post.id, post.author_id, post.publish_at, user_id)
 
     return post
 
 
-def update_post(user: User, post: Post, post_data: PostUpdate) -> Post:
+@profiled()
+async def get_post_details_document_or_404(
+    slug: str, user_id: ODMObjectId | None = None
+) -> dict[str, Any]:
+    """
+    Raw post with its `author` joined in a single aggregation and its `topics`
+    from the topic catalog, ready for PostDetailsOut.
+    """
+    pipeline: list[dict[str, Any]] = [
+        {"$match": {"slug": slug}},
+        {"$limit": 1},
+        {
+            "$lookup": {
+                "from": User._get_collection_name(),
+                "localField": "author_id",
+                "foreignField": "_id",
+                "pipeline": [{"$project": PUBLIC_USER_PROJECTION}],
+                "as": "author",
+            }
+        },
+        {"$set": {"author": {"$first": "$author"}}},
+    ]
+    if not topic_catalog.is_loaded:
+        pipeline.append(
+            {
+                "$lookup": {
+                    "from": Topic._get_collection_name(),
+                    "localField": "topic_ids",
+                    "foreignField": "_id",
+                    "pipeline": [{"$project": TOPIC_PROJECTION}],
+                    "as": "topics",
+                }
+            }
+        )
+
+    post: dict[str, Any] | None = None
+    async for obj in Post.aaggregate(pipeline, get_raw=True):
+        post = obj
+    if post is None:
+        raise ObjectNotFoundException()
+
+    _check_post_access(post["_id"], post["author_id"], post.get("publish_at"), user_id)
+
+    if topic_catalog.is_loaded:
+        post["topics"] = await get_topics_by_ids(post.get("topic_ids", []))
+
+    return post
+
+
+async def update_post(user: User, post: Post, post_data: PostUpdate) -> Post:
+    was_published = post.publish_at is not None
+    old_cover_image = post.cover_image
+    old_topic_ids = set(post.topic_ids)
+
     post = update_partially(post, post_data)
 
     post.short_description = post_data.short_description
@@ -199,16 +436,31 @@ def update_post(user: User, post: Post, post_data: PostUpdate) -> Post:
         post.publish_at = None
 
     if post_data.topics:
-        topics = get_or_create_post_topics(post_data.topics, user)
+        topics = await get_or_create_post_topics(post_data.topics, user)
         post.topic_ids = [topic.id for topic in topics]
 
-    post.update()
+    await post.aupdate()
+    await update_media_references(old_cover_image, post.cover_image)
+    await update_total_post(list(old_topic_ids - set(post.topic_ids)), -1)
+    await update_total_post(list(set(post.topic_ids) - old_topic_ids), 1)
+
+    # Drafts are not part of the feed unless this update publishes them
+    if was_published or post.publish_at:
+        await post_feed_cache.invalidate()
+    await post_details_cache.delete({"slug": post.slug})
 
     return post
 
 
-def delete_post(post: Post) -> None:
-    Comment.delete_many({"post_id": post.id})
-    Reaction.delete_many({"post_id": post.id})
+async def delete_post(post: Post) -> None:
+    await Comment.adelete_many({"post_id": post.id})
+    await Reaction.adelete_many({"post_id": post.id})
+    await UserReaction.adelete_many({"post_id": post.id})
+
+    await post.adelete()
+    await update_media_references(post.cover_image, None)
+    await update_total_post(post.topic_ids, -1)
 
-    post.delete()
+    if post.publish_at:
+        await post_feed_cache.invalidate()
+    await post_details_cache.delete({"slug": post.slug})
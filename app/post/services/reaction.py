@@ -2,44 +2,98 @@ import logging
 from typing import Any
 
 from mongodb_odm import ODMObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
-from app.post.models import Post, Reaction
+from app.post.models import REACTION_BUCKET_SIZE, Reaction, UserReaction
+from app.post.services.counter import post_counter
 
 logger = logging.getLogger(__name__)
 
 
-def update_total_reaction(post_id: Any, val: int) -> None:
-    Post.update_one({"_id": ODMObjectId(post_id)}, {"$inc": {"total_reaction": val}})
+async def update_total_reaction(post_id: Any, val: int) -> None:
+    await post_counter.incr(ODMObjectId(post_id), "total_reaction", val)
 
 
-def create_reaction(post_id: ODMObjectId, user_id: ODMObjectId) -> bool:
-    update_result = Reaction.update_one(
-        {"post_id": post_id, "$where": "this.user_ids.length < 100"},
-        {"$addToSet": {"user_ids": user_id}},
+async def _add_to_bucket(post_id: ODMObjectId, user_id: ODMObjectId) -> ODMObjectId:
+    """Push the user to a bucket with free space, create a new one if all are full"""
+    bucket = await Reaction._async_get_collection().find_one_and_update(
+        {"post_id": post_id, "count": {"$lt": REACTION_BUCKET_SIZE}},
+        {"$push": {"user_ids": user_id}, "$inc": {"count": 1}},
+        projection={"_id": 1},
         upsert=True,
+        return_document=ReturnDocument.AFTER,
     )
 
-    if update_result.upserted_id is not None:
-        pass
-        # Insert new one
-        # update_result.matched_count and update_result.modified_count should be zero
-    if update_result.modified_count or update_result.upserted_id is not None:
-        # increase total comment for post
-        update_total_reaction(post_id, 1)
-        return True
+    return ODMObjectId(bucket["_id"])
+
+
+async def _remove_from_bucket(bucket_id: ODMObjectId, user_id: ODMObjectId) -> None:
+    """
+    Remove one occurrence of the user, $pull would remove them all. A create
+    undoing its bucket write can share the bucket with a newer reaction of
+    the same user.
+    """
+    index = {"$indexOfArray": ["$user_ids", user_id]}
+    user_ids = {
+        "$concatArrays": [
+            {"$slice": ["$user_ids", index]},
+            {"$slice": ["$user_ids", {"$add": [index, 1]}, REACTION_BUCKET_SIZE]},
+        ]
+    }
+    await Reaction.aupdate_one(
+        {"_id": bucket_id, "user_ids": user_id},
+        [{"$set": {"user_ids": user_ids, "count": {"$subtract": ["$count", 1]}}}],
+    )
+
+
+async def create_reaction(post_id: ODMObjectId, user_id: ODMObjectId) -> bool:
+    """
+    The user_reaction is inserted first without a bucket_id, which marks it as
+    pending. A delete running meanwhile removes only the pending document, the
+    bucket and the counter are left to this function: when the bucket_id can
+    no longer be set the user is pulled back from the bucket.
 
-    return False
+    A process dying between the writes leaves a pending user_reaction, see
+    `repair_reactions` in cli.management_command.reaction_migration.
+    """
+    try:
+        user_reaction = await UserReaction(post_id=post_id, user_id=user_id).acreate()
+    except DuplicateKeyError:
+        return False
 
+    try:
+        bucket_id = await _add_to_bucket(post_id, user_id)
+    except Exception:
+        await user_reaction.adelete()
+        raise
 
-def delete_reaction(post_id: ODMObjectId, user_id: ODMObjectId) -> bool:
-    update_result = Reaction.update_one(
-        {"post_id": post_id, "user_ids": user_id},
-        {"$pull": {"user_ids": user_id}},
+    result = await UserReaction.aupdate_one(
+        {"_id": user_reaction.id}, {"$set": {"bucket_id": bucket_id}}
     )
+    if result.matched_count == 0:
+        # Deleted while pending, undo the bucket write
+        await _remove_from_bucket(bucket_id, user_id)
+        return True
+
+    # increase total reaction for post
+    await update_total_reaction(post_id, 1)
+
+    return True
 
-    if update_result.modified_count:
-        # decrease total comment for post
-        update_total_reaction(post_id, -1)
+
+async def delete_reaction(post_id: ODMObjectId, user_id: ODMObjectId) -> bool:
+    user_reaction = await UserReaction._async_get_collection().find_one_and_delete(
+        {"post_id": post_id, "user_id": user_id}, projection={"bucket_id": 1}
+    )
+    if user_reaction is None:
+        return False
+    if not user_reaction.get("bucket_id"):
+        # Still pending, `create_reaction` undoes its own bucket write
         return True
 
-    return False
+    await _remove_from_bucket(user_reaction["bucket_id"], user_id)
+    # decrease total reaction for post
+    await update_total_reaction(post_id, -1)
+
+    return True
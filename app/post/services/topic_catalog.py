@@ -0,0 +1,140 @@
+import heapq
+from bisect import bisect_left, insort
+from typing import Any
+
+from mongodb_odm import ODMObjectId
+
+from app.base.config import TOPIC_CATALOG_REFRESH_INTERVAL
+from app.base.utils.catalog import CollectionCatalog
+from app.post.models import Topic
+from app.post.utils import normalize_topic_name
+
+
+def _get_prefix_entries(topic: Topic) -> list[tuple[str, ODMObjectId]]:
+    """One entry per word of the name, "web dev" is found by "web" and "dev" """
+    name = topic.normalized_name or normalize_topic_name(topic.name)
+    words = name.split(" ")
+
+    return [(" ".join(words[index:]), topic.id) for index in range(len(words))]
+
+
+class TopicIndex:
+    """
+    Topics by id, slug and normalized name. `prefixes` holds (word suffix of
+    the name, id) sorted, the names starting with a prefix are next to each
+    other and found with a binary search.
+    """
+
+    def __init__(self) -> None:
+        self.topics: dict[ODMObjectId, Topic] = {}
+        self.slug_to_id: dict[str, ODMObjectId] = {}
+        self.name_to_id: dict[str, ODMObjectId] = {}
+        self.prefixes: list[tuple[str, ODMObjectId]] = []
+        # A load appends the prefixes and sorts them once in on_load
+        self._is_sorted = False
+
+    def on_load(self) -> None:
+        self.prefixes.sort()
+        self._is_sorted = True
+
+    def put(self, document: dict[str, Any]) -> None:
+        topic = Topic(**document)
+
+        old_topic = self.topics.get(topic.id)
+        if old_topic is not None:
+            if (old_topic.name, old_topic.normalized_name, old_topic.slug) == (
+                topic.name,
+                topic.normalized_name,
+                topic.slug,
+            ):
+                # total_post changed, the lookups stay the same
+                self.topics[topic.id] = topic
+                return
+            self.remove(topic.id)
+
+        self.topics[topic.id] = topic
+        self.slug_to_id[topic.slug] = topic.id
+        # Topics not migrated yet are only found by id and slug
+        if topic.normalized_name:
+            self.name_to_id[topic.normalized_name] = topic.id
+
+        for entry in _get_prefix_entries(topic):
+            if self._is_sorted:
+                insort(self.prefixes, entry)
+            else:
+                self.prefixes.append(entry)
+
+    def remove(self, document_id: Any) -> None:
+        topic = self.topics.pop(document_id, None)
+        if topic is None:
+            return
+
+        if self.slug_to_id.get(topic.slug) == topic.id:
+            del self.slug_to_id[topic.slug]
+        if (
+            topic.normalized_name
+            and self.name_to_id.get(topic.normalized_name) == topic.id
+        ):
+            del self.name_to_id[topic.normalized_name]
+
+        for entry in _get_prefix_entries(topic):
+            index = bisect_left(self.prefixes, entry)
+            if index < len(self.prefixes) and self.prefixes[index] == entry:
+                del self.prefixes[index]
+
+    def suggest(self, prefix: str, limit: int) -> list[Topic]:
+        # Every string starting with `prefix` sorts between the two bounds
+        upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        start = bisect_left(self.prefixes, (prefix,))
+        end = bisect_left(self.prefixes, (upper_bound,), lo=start)
+        topic_ids = {topic_id for _, topic_id in self.prefixes[start:end]}
+
+        return heapq.nsmallest(
+            limit,
+            (self.topics[topic_id] for topic_id in topic_ids),
+            key=lambda topic: (-topic.total_post, topic.name),
+        )
+
+
+class TopicCatalog(CollectionCatalog[TopicIndex]):
+    """Every topic in memory. The topics are shared, never modify them."""
+
+    def __init__(self, refresh_interval: float) -> None:
+        super().__init__(
+            name="topic_catalog",
+            model=Topic,
+            index_factory=TopicIndex,
+            refresh_interval=refresh_interval,
+            version_field="total_post",
+        )
+
+    def add(self, topic: Topic) -> None:
+        """Topic created by this process, visible before the change is received"""
+        if self.is_loaded:
+            self.index.put({"_id": topic.id, **topic.to_mongo()})
+
+    def _lookup(self, topic_id: ODMObjectId | None) -> Topic | None:
+        topic = self.index.topics.get(topic_id) if topic_id else None  # type: ignore
+        if self.is_loaded:
+            self.record_lookup(topic is not None)
+        return topic
+
+    def get(self, topic_id: ODMObjectId) -> Topic | None:
+        return self._lookup(topic_id)
+
+    def get_by_slug(self, slug: str) -> Topic | None:
+        return self._lookup(self.index.slug_to_id.get(slug))
+
+    def get_by_normalized_name(self, normalized_name: str) -> Topic | None:
+        return self._lookup(self.index.name_to_id.get(normalized_name))
+
+    def suggest(self, q: str, limit: int) -> list[Topic]:
+        """Topics with a word starting with `q`, the most used first"""
+        prefix = normalize_topic_name(q)
+        if not prefix:
+            return []
+
+        return self.index.suggest(prefix, limit)
+
+
+topic_catalog = TopicCatalog(refresh_interval=TOPIC_CATALOG_REFRESH_INTERVAL)
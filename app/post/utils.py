@@ -9,3 +9,8 @@ def get_post_description_from_str(
             {"type": "paragraph", "children": [{"text": description_str}]},
         ]
     }
+
+
+def normalize_topic_name(name: str) -> str:
+    """Key of the unique topic index, case and extra spaces are ignored"""
+    return " ".join(name.split()).casefold()
@@ -1,22 +1,51 @@
-from fastapi import status
-from fastapi.testclient import TestClient
+import json
+import os
+import socket
+from datetime import datetime
+from io import BytesIO
+from typing import Any
 
-from app.main import app
-from app.tests.utils import get_header, get_test_file_path
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI, UploadFile, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from httpx import ASGITransport, AsyncClient
+from PIL import Image
+from prometheus_client import REGISTRY
+from starlette.datastructures import Headers
 
-client = TestClient(app)
+from app.base import middleware
+from app.base.config import MEDIA_MAX_UPLOAD_SIZE, MEDIA_ROOT, MEDIA_URL
+from app.base.exceptions import CustomException, ExType
+from app.base.metrics import MetricsServer
+from app.base.middleware import CatchExceptionsMiddleware, ProfilingMiddleware
+from app.base.models import MediaFile
+from app.base.utils import profiling
+from app.base.utils.cache import TTLCache
+from app.base.utils.file import save_file
+from app.base.utils.lifecycle import run_components
+from app.base.utils.process_pool import BoundedProcessPool
+from app.base.utils.profiling import profiled
+from app.base.utils.query import get_projection
+from app.base.utils.response_cache import MemoryCacheBackend, ResponseCache
+from app.base.utils.serializer import PageSerializer
+from app.base.utils.storage import S3Storage, set_storage
+from app.post.schemas.comments import COMMENT_PROJECTION, CommentOut
+from app.post.schemas.posts import PostListOut
+from app.tests.utils import client, get_header, get_test_file_path
 
 NEW_USERNAME = "username-exists"
 NEW_PASS = "new-pass"
 NEW_FULL_NAME = "Full Name"
 
 
-def test_file_upload_and_get() -> None:
+async def test_file_upload_and_get() -> None:
     image_path = f"{get_test_file_path()}/atom.jpg"
 
     with open(image_path, "rb") as f:
-        response = client.post(
-            "/api/v1/upload-image", files={"image": f}, headers=get_header()
+        response = await client.post(
+            "/api/v1/upload-image", files={"image": f}, headers=await get_header()
         )
     assert response.status_code == status.HTTP_201_CREATED
 
@@ -24,5 +53,376 @@ def test_file_upload_and_get() -> None:
 
     assert image_path is not None
 
-    response = client.get(image_path)
+    response = await client.get(image_path)
     assert response.status_code == status.HTTP_200_OK
+
+    # The smallest pre-rendered width covering 100px
+    response = await client.get(image_path, params={"w": 100, "fmt": "webp"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "image/webp"
+    with Image.open(BytesIO(response.content)) as image:
+        assert image.format == "WEBP"
+        assert image.size == (320, 320)
+
+    response = await client.get(image_path, params={"w": 400, "fmt": "png"})
+    assert response.headers["content-type"] == "image/png"
+    with Image.open(BytesIO(response.content)) as image:
+        assert image.size == (511, 511)
+
+    response = await client.get("/media/%2e%2e/pyproject.toml")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    # Another spelling of the same file is not served, nor rendered
+    folder, _, name = image_path.removeprefix(MEDIA_URL).partition("/")
+    alias = f"{MEDIA_URL}{folder}/%2e%2e/{folder}/{name}"
+    response = await client.get(alias, params={"w": 100})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_media_http_cache() -> None:
+    image_path = f"{get_test_file_path()}/atom.jpg"
+
+    with open(image_path, "rb") as f:
+        response = await client.post(
+            "/api/v1/upload-image", files={"image": f}, headers=await get_header()
+        )
+    image_path = response.json()["image_path"]
+
+    response = await client.get(image_path)
+    assert response.status_code == status.HTTP_200_OK
+    assert "immutable" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+    size = len(response.content)
+
+    response = await client.get(image_path, headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    response = await client.get(image_path, headers={"Range": "bytes=0-99"})
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert len(response.content) == 100
+    assert response.headers["content-range"] == f"bytes 0-99/{size}"
+
+
+async def test_file_upload_deduplication() -> None:
+    image_path = f"{get_test_file_path()}/atom.jpg"
+
+    image_paths = []
+    for _ in range(2):
+        with open(image_path, "rb") as f:
+            response = await client.post(
+                "/api/v1/upload-image", files={"image": f}, headers=await get_header()
+            )
+        assert response.status_code == status.HTTP_201_CREATED
+        image_paths.append(response.json()["image_path"])
+
+    assert image_paths[0] == image_paths[1]
+    media = await MediaFile.aget({"path": image_paths[0]})
+    assert image_paths[0].endswith(f"{media.sha256}.jpg")
+
+    # Setting it as the user image adds a reference
+    response = await client.patch(
+        "/api/v1/users/update",
+        json={"full_name": NEW_FULL_NAME, "image": image_paths[0]},
+        headers=await get_header(),
+    )
+    assert response.status_code == status.HTTP_200_OK
+    media = await MediaFile.aget({"path": image_paths[0]})
+    assert media.ref_count == 1
+
+
+async def test_file_upload_validation() -> None:
+    response = await client.post(
+        "/api/v1/upload-image",
+        files={"image": ("atom.jpg", b"not an image", "image/jpeg")},
+        headers=await get_header(),
+    )
+    assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+
+    image_path = f"{get_test_file_path()}/atom.jpg"
+    with open(image_path, "rb") as f:
+        image = UploadFile(f, headers=Headers({"content-type": "image/jpeg"}))
+
+        with pytest.raises(CustomException) as exc_info:
+            await save_file(image, max_size=1024)
+        assert exc_info.value.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    # Rejected from the Content-Length before the form is parsed, even the
+    # authentication is not checked
+    size = MEDIA_MAX_UPLOAD_SIZE + middleware.MULTIPART_OVERHEAD + 1
+    response = await client.post(
+        "/api/v1/upload-image",
+        files={"image": ("atom.jpg", b"0" * size, "image/jpeg")},
+    )
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+class FakeS3:
+    """
+    The part of a boto3 S3 client the storage uses, objects are kept in memory.
+    boto3 only takes keyword arguments.
+    """
+
+    def __init__(self) -> None:
+        self.objects: dict[str, bytes] = {}
+        self.uploads: dict[str, dict[int, bytes]] = {}
+
+    def list_objects_v2(self, **kwargs: Any) -> Any:
+        keys = sorted(key for key in self.objects if key.startswith(kwargs["Prefix"]))
+        return {"Contents": [{"Key": key} for key in keys[: kwargs["MaxKeys"]]]}
+
+    def put_object(self, **kwargs: Any) -> None:
+        self.objects[kwargs["Key"]] = kwargs["Body"].read()
+
+    def delete_object(self, **kwargs: Any) -> None:
+        self.objects.pop(kwargs["Key"], None)
+
+    def generate_presigned_url(self, client_method: str, **kwargs: Any) -> str:
+        params = kwargs["Params"]
+        return f"https://s3.test/{params['Bucket']}/{params['Key']}"
+
+    def create_multipart_upload(self, **kwargs: Any) -> Any:
+        upload_id = str(len(self.uploads))
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, **kwargs: Any) -> Any:
+        self.uploads[kwargs["UploadId"]][kwargs["PartNumber"]] = kwargs["Body"]
+        return {"ETag": f'"{kwargs["PartNumber"]}"'}
+
+    def complete_multipart_upload(self, **kwargs: Any) -> None:
+        parts = self.uploads.pop(kwargs["UploadId"])
+        numbers = [part["PartNumber"] for part in kwargs["MultipartUpload"]["Parts"]]
+        self.objects[kwargs["Key"]] = b"".join(parts[number] for number in numbers)
+
+    def abort_multipart_upload(self, **kwargs: Any) -> None:
+        self.uploads.pop(kwargs["UploadId"], None)
+
+
+async def test_s3_storage() -> None:
+    s3 = FakeS3()
+    set_storage(S3Storage(s3, "media", multipart_threshold=1024))
+    try:
+        image_path = f"{get_test_file_path()}/atom.jpg"
+        with open(image_path, "rb") as f:
+            content = f.read()
+            f.seek(0)
+            response = await client.post(
+                "/api/v1/upload-image", files={"image": f}, headers=await get_header()
+            )
+        assert response.status_code == status.HTTP_201_CREATED
+        image_path = response.json()["image_path"]
+        assert s3.objects[image_path.removeprefix("/media/")] == content
+
+        response = await client.get(image_path)
+        assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+        assert response.headers["location"].startswith("https://s3.test/media/")
+
+        # Larger than multipart_threshold, sent in parts
+        temp_location = f"{MEDIA_ROOT}/tmp/multipart.part"
+        os.makedirs(os.path.dirname(temp_location), exist_ok=True)
+        with open(temp_location, "wb") as f:
+            f.write(content)
+        storage = S3Storage(
+            s3, "media", multipart_threshold=1024, multipart_chunk_size=1000
+        )
+        storage.save("image/multipart.jpg", temp_location, "image/jpeg")
+        assert s3.objects["image/multipart.jpg"] == content
+        assert s3.uploads == {}
+        assert storage.exists("image/multipart.jpg")
+
+        storage.delete("image/multipart.jpg")
+        assert not storage.exists("image/multipart.jpg")
+    finally:
+        set_storage(None)
+
+
+async def test_catch_exceptions_middleware(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(middleware, "DEBUG", False)
+
+    test_app = FastAPI()
+    test_app.add_middleware(CatchExceptionsMiddleware)
+
+    @test_app.get("/error")
+    async def error() -> None:
+        raise ValueError("unhandled")
+
+    @test_app.get("/stream")
+    async def stream() -> StreamingResponse:
+        return StreamingResponse(iter([b"a", b"b"]))
+
+    transport = ASGITransport(app=test_app)
+    async with AsyncClient(transport=transport, base_url="http://test") as test_client:
+        response = await test_client.get("/error")
+        assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+        assert response.json()["code"] == ExType.INTERNAL_SERVER_ERROR
+
+        response = await test_client.get("/stream")
+        assert response.content == b"ab"
+
+
+async def test_metrics() -> None:
+    response = await client.get("/health")
+    assert response.status_code == status.HTTP_200_OK
+
+    # Served on METRICS_PORT only, not by the public API
+    response = await client.get("/metrics")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    async with run_components(MetricsServer(port)):
+        async with AsyncClient() as metrics_client:
+            response = await metrics_client.get(f"http://127.0.0.1:{port}/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert 'route="/health"' in response.text
+    assert 'command="ping"' in response.text
+
+
+async def test_request_profiling(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Any
+) -> None:
+    monkeypatch.setattr(profiling, "DEBUG", True)
+    monkeypatch.setattr(profiling, "PROFILING_DIR", str(tmp_path))
+
+    @profiled()
+    async def get_answer() -> int:
+        with profiled("block"):
+            return 42
+
+    assert get_answer.__name__ == "get_answer"
+
+    test_app = FastAPI()
+    test_app.add_middleware(ProfilingMiddleware)
+
+    @test_app.get("/answer")
+    async def answer() -> int:
+        return await get_answer()
+
+    transport = ASGITransport(app=test_app)
+    async with AsyncClient(transport=transport, base_url="http://test") as test_client:
+        response = await test_client.get("/answer")
+        assert response.json() == 42
+        assert os.listdir(tmp_path) == []
+
+        response = await test_client.get("/answer", headers={"X-Profile": "1"})
+        assert response.json() == 42
+        assert len(os.listdir(tmp_path)) == 1
+
+
+async def test_process_pool_back_pressure() -> None:
+    pool = BoundedProcessPool(name="test", max_workers=1, max_pending=0)
+
+    # Pool is not started, function should run inline
+    assert await pool.run(abs, -1) == 1
+
+    async with run_components(pool):
+        with pytest.raises(CustomException) as exc_info:
+            await pool.run(abs, -1)
+        assert exc_info.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert pool.rejected == 1
+
+
+async def test_process_pool_disabled() -> None:
+    pool = BoundedProcessPool(name="test", max_workers=0, max_pending=1)
+
+    async with run_components(pool):
+        # Disabled pool, the functions run in the thread pool
+        assert await pool.run(abs, -1) == 1
+        with pytest.raises(TypeError):
+            await pool.run(abs, "a")
+        assert (pool.completed, pool.failed) == (1, 1)
+
+
+def test_ttl_cache() -> None:
+    cache: TTLCache[str, int] = TTLCache(name="test", maxsize=2, ttl=60)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    # "b" is the least recently used entry
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+    assert cache.delete_matching(lambda key: key in {"a", "c"}) == 2
+    assert len(cache) == 0
+
+    # ttl=0 disables the cache
+    disabled_cache: TTLCache[str, int] = TTLCache(name="test", maxsize=2, ttl=0)
+    disabled_cache.set("a", 1)
+    assert disabled_cache.get("a") is None
+
+
+async def test_memory_cache_backend_metrics() -> None:
+    """ResponseCache records the lookups, the backend must not count them again"""
+    backend = MemoryCacheBackend(maxsize=2)
+    labels = {"cache": "response", "result": "miss"}
+    misses = REGISTRY.get_sample_value("cache_requests_total", labels)
+
+    assert await backend.get("missing") is None
+    assert REGISTRY.get_sample_value("cache_requests_total", labels) == misses
+
+
+async def test_response_cache_delete() -> None:
+    cache = ResponseCache("test", MemoryCacheBackend(maxsize=10), ttl=60)
+    params = {"slug": "a"}
+
+    # The data changes while the response is built from the old one
+    lookup = await cache.get(params)
+    await cache.delete(params)
+    await cache.set(lookup.key, b"old")
+    assert (await cache.get(params)).value is None
+
+    lookup = await cache.get(params)
+    await cache.set(lookup.key, b"new")
+    assert (await cache.get(params)).value == b"new"
+
+
+def test_page_serializer() -> None:
+    comment_id = ObjectId()
+    now = datetime.now()
+    raw_comment = {
+        "_id": comment_id,
+        "user_id": ObjectId(),
+        "description": "Comment",
+        "replies": [],
+        "created_at": now,
+        "updated_at": now,
+        "user": None,
+    }
+
+    content = PageSerializer(CommentOut).dump_json(None, [raw_comment])
+
+    comment = CommentOut(**{**raw_comment, "id": comment_id})
+    assert json.loads(content) == {
+        "after": None,
+        "results": [jsonable_encoder(comment.model_dump())],
+    }
+
+
+def test_get_projection() -> None:
+    assert COMMENT_PROJECTION == {
+        "_id": 1,
+        "user_id": 1,
+        "user_snapshot": 1,
+        "description": 1,
+        "replies.id": 1,
+        "replies.user_id": 1,
+        "replies.user_snapshot": 1,
+        "replies.description": 1,
+        "replies.created_at": 1,
+        "replies.updated_at": 1,
+        "created_at": 1,
+        "updated_at": 1,
+    }
+    assert get_projection(PostListOut, {"author": ["author_id"]}) == {
+        "author_id": 1,
+        **dict.fromkeys(list(PostListOut.model_fields)[1:], 1),
+    }
+    # Nested schemas are projected field by field
+    assert get_projection(PostListOut)["author.username"] == 1
@@ -1,23 +1,26 @@
 import logging
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager
 from typing import Any
 
 import pytest
-from fastapi.testclient import TestClient
-from mongodb_odm import connect, disconnect
+from mongodb_odm import adisconnect, connect, disconnect
 
 from app.base import config
-from app.main import app
+from app.base.query_recorder import QueryRecorder, record_queries
 from cli.management_command.data_population import clean_data, populate_dummy_data
 
 logger = logging.getLogger(__name__)
-client = TestClient(app)
 
 
 @pytest.fixture(scope="session", autouse=True)
-def onetime_setup() -> Any:
+async def onetime_setup() -> Any:
     """
     This fixture runs once per test session to set up the database connection
     and populate it with dummy data.
+
+    Data population runs on a sync connection, the tests and the application
+    share an async connection bound to the session event loop.
     """
 
     connect(config.TEST_MONGO_URL)
@@ -25,6 +28,32 @@ def onetime_setup() -> Any:
     clean_data()
     populate_dummy_data(total_user=10, total_post=10, is_unittest=True)
 
+    disconnect()
+
+    connect(config.TEST_MONGO_URL, async_is_enabled=True)
+
     yield None
 
-    disconnect()
+    await adisconnect()
+
+
+@pytest.fixture
+def max_queries() -> Callable[[int], AbstractContextManager[QueryRecorder]]:
+    """
+    Fail when the block sends more than `limit` MongoDB commands.
+
+        with max_queries(3):
+            await client.get(...)
+    """
+
+    @contextmanager
+    def assert_max_queries(limit: int) -> Iterator[QueryRecorder]:
+        with record_queries() as recorder:
+            yield recorder
+
+        assert recorder.count <= limit, (
+            f"Expected at most {limit} queries, got {recorder.summary()}: "
+            f"{[(query.command, query.collection) for query in recorder.queries]}"
+        )
+
+    return assert_max_queries
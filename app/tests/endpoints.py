@@ -17,6 +17,7 @@ class Endpoints:
 
     # Topics endpoints
     TOPICS = f"{V1_URL}/topics"
+    TOPICS_SUGGEST = f"{V1_URL}/topics/suggest"
 
     # Posts endpoints
     POSTS = f"{V1_URL}/posts"
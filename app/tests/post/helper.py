@@ -23,23 +23,25 @@ def get_post_description() -> dict[Any, Any]:
     return get_post_description_from_str(fake.text())
 
 
-def create_topic(name: str) -> Topic:
-    topic = Topic(
+async def create_topic(name: str) -> Topic:
+    topic = await Topic(
         name=name,
         slug=f"test-{uuid4()}",
         description=None,
-    ).create()
+    ).acreate()
 
     return topic
 
 
-def create_public_post(author_id: ODMObjectId, title: str = TEST_POST_TITLE) -> Post:
+async def create_public_post(
+    author_id: ODMObjectId, title: str = TEST_POST_TITLE
+) -> Post:
     description = "Description"
     short_description = "Short Description"
     description_obj = get_post_description_from_str(description)
     slug = f"{slugify(title)}-{ObjectId()}"
 
-    post = Post(
+    post = await Post(
         title=title,
         publish_at=datetime.now() - timedelta(hours=1),
         short_description=short_description,
@@ -47,22 +49,22 @@ def create_public_post(author_id: ODMObjectId, title: str = TEST_POST_TITLE) ->
         cover_image=None,
         slug=slug,
         author_id=author_id,
-    ).create()
+    ).acreate()
 
     return post
 
 
-def create_comment(user_id: ODMObjectId, post_id: ODMObjectId) -> Comment:
-    comment = Comment(
+async def create_comment(user_id: ODMObjectId, post_id: ODMObjectId) -> Comment:
+    comment = await Comment(
         user_id=user_id,
         post_id=post_id,
         description="Description",
-    ).create()
+    ).acreate()
 
     return comment
 
 
-def create_reply(
+async def create_reply(
     user_id: ODMObjectId, comment: Comment, description: str
 ) -> EmbeddedReply:
     reply = EmbeddedReply(
@@ -70,6 +72,6 @@ def create_reply(
         user_id=user_id,
         description=description,
     )
-    comment.update(raw={"$push": {"replies": reply.model_dump()}})
+    await comment.aupdate(raw={"$push": {"replies": reply.model_dump()}})
 
     return reply
@@ -1,55 +1,121 @@
+from time import monotonic
+from typing import Any
+
+from bson import ObjectId
 from faker import Faker
 from fastapi import status
-from fastapi.testclient import TestClient
 
-from app.main import app
+from app.base.utils.response_cache import RedisCacheBackend
 from app.post.models import Post, Topic
+from app.post.services.cache import post_details_cache, post_feed_cache
 from app.tests.endpoints import Endpoints
-from app.tests.post.helper import get_post_description, get_published_filter
-from app.tests.utils import get_header, get_user
+from app.tests.post.helper import (
+    create_public_post,
+    get_post_description,
+    get_published_filter,
+)
+from app.tests.utils import client, get_header, get_user
+from app.user.models import User
 
-client = TestClient(app)
 fake = Faker()
 
 
-def test_get_posts() -> None:
-    response = client.get(Endpoints.POSTS)
+async def test_get_posts() -> None:
+    response = await client.get(Endpoints.POSTS)
     assert response.status_code == status.HTTP_200_OK
 
     assert "results" in response.json()
 
     # Get posts with valid credentials
-    response = client.get(Endpoints.POSTS, headers=get_header())
+    response = await client.get(Endpoints.POSTS, headers=await get_header())
     assert response.status_code == status.HTTP_200_OK
 
-    user = get_user()
-    topic = Topic.get({})
-    response = client.get(
+    user = await get_user()
+    topic = await Topic.aget({})
+    response = await client.get(
         Endpoints.POSTS,
         params={"q": "abc", "topics": [str(topic.id)], "author_id": str(user.id)},
     )
     assert response.status_code == status.HTTP_200_OK
 
 
-def test_get_user_posts() -> None:
-    user = get_user()
-    response = client.get(f"{Endpoints.POSTS}?username={user.username}")
+class FakeRedis:
+    """The part of redis.asyncio.Redis the response cache uses."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, tuple[float, Any]] = {}
+
+    async def get(self, key: str) -> Any:
+        expire_at, value = self.data.get(key, (0, None))
+        return value if expire_at > monotonic() else None
+
+    async def set(self, key: str, value: Any, px: int) -> None:
+        self.data[key] = (monotonic() + px / 1000, value)
+
+    async def delete(self, key: str) -> None:
+        self.data.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        value = int(await self.get(key) or 0) + 1
+        self.data[key] = (float("inf"), str(value).encode())
+        return value
+
+
+async def test_post_feed_cache() -> None:
+    backend = post_feed_cache.backend
+    post_feed_cache.backend = RedisCacheBackend(FakeRedis())
+    try:
+        response = await client.get(Endpoints.POSTS, params={"limit": 5})
+        assert response.status_code == status.HTTP_200_OK
+
+        hits = post_feed_cache.hits
+        cached_response = await client.get(Endpoints.POSTS, params={"limit": "5"})
+        assert post_feed_cache.hits == hits + 1
+        assert cached_response.json() == response.json()
+
+        # Publishing a post drops the cached feed
+        payload = {
+            "title": fake.sentence(),
+            "publish_now": True,
+            "short_description": None,
+            "topics": [],
+        }
+        response = await client.post(
+            Endpoints.POSTS, json=payload, headers=await get_header()
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        slug = response.json()["slug"]
+
+        response = await client.get(Endpoints.POSTS, params={"limit": 5})
+        assert response.json()["results"][0]["slug"] == slug
+    finally:
+        post_feed_cache.backend = backend
+
+
+async def test_get_user_posts() -> None:
+    user = await get_user()
+    response = await client.get(f"{Endpoints.POSTS}?username={user.username}")
     assert response.status_code == status.HTTP_200_OK
 
     assert "results" in response.json()
 
 
-def test_get_user_own_posts() -> None:
-    user = get_user()
-    response = client.get(
-        f"{Endpoints.POSTS}?username={user.username}", headers=get_header()
+async def test_get_unknown_user_posts() -> None:
+    response = await client.get(f"{Endpoints.POSTS}?username=unknown-{ObjectId()}")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_get_user_own_posts() -> None:
+    user = await get_user()
+    response = await client.get(
+        f"{Endpoints.POSTS}?username={user.username}", headers=await get_header()
     )
     assert response.status_code == status.HTTP_200_OK
 
     assert "results" in response.json()
 
 
-def test_create_posts() -> None:
+async def test_create_posts() -> None:
     payload = {
         "title": fake.sentence(),
         "publish_now": True,
@@ -59,22 +125,62 @@ def test_create_posts() -> None:
         "topics": [],
     }
 
-    response = client.post(Endpoints.POSTS, json=payload)
+    response = await client.post(Endpoints.POSTS, json=payload)
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
-    response = client.post(Endpoints.POSTS, json=payload, headers=get_header())
+    response = await client.post(
+        Endpoints.POSTS, json=payload, headers=await get_header()
+    )
     assert response.status_code == status.HTTP_201_CREATED
 
 
-def test_get_post_details() -> None:
-    post = Post.get(get_published_filter())
-    response = client.get(Endpoints.POSTS_DETAIL.format(slug=post.slug))
+async def test_get_post_details(max_queries: Any) -> None:
+    post = await Post.aget(get_published_filter())
+    # Post, author and topics in one aggregation
+    with max_queries(1):
+        response = await client.get(Endpoints.POSTS_DETAIL.format(slug=post.slug))
     assert response.status_code == status.HTTP_200_OK
 
+    author = await User.aget({"_id": post.author_id})
+    assert response.json()["author"]["username"] == author.username
+    assert len(response.json()["topics"]) == len(post.topic_ids)
+
 
-def test_update_post() -> None:
-    user = get_user()
-    post = Post.get({"author_id": user.id})
+async def test_post_details_cache() -> None:
+    user = await get_user()
+    post = await create_public_post(user.id)
+    url = Endpoints.POSTS_DETAIL.format(slug=post.slug)
+
+    response = await client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+
+    hits = post_details_cache.hits
+    response = await client.get(url)
+    assert post_details_cache.hits == hits + 1
+    assert response.json()["total_reaction"] == 0
+
+    # Counter writes drop the cached details
+    response = await client.post(
+        Endpoints.REACTIONS.format(slug=post.slug), headers=await get_header()
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    response = await client.get(url)
+    assert response.json()["total_reaction"] == 1
+
+    title = fake.sentence()
+    response = await client.patch(
+        url,
+        json={"title": title, "short_description": None},
+        headers=await get_header(),
+    )
+    assert response.status_code == status.HTTP_200_OK
+    response = await client.get(url)
+    assert response.json()["title"] == title
+
+
+async def test_update_post() -> None:
+    user = await get_user()
+    post = await Post.aget({"author_id": user.id})
 
     payload = {
         "title": fake.sentence(),
@@ -82,35 +188,37 @@ def test_update_post() -> None:
         "short_description": None,
         "cover_image": None,
     }
-    response = client.patch(Endpoints.POSTS_DETAIL.format(slug=post.slug), json=payload)
+    response = await client.patch(
+        Endpoints.POSTS_DETAIL.format(slug=post.slug), json=payload
+    )
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
     # Try to update others post
-    post = Post.get({"author_id": {"$ne": user.id}})
-    response = client.patch(
+    post = await Post.aget({"author_id": {"$ne": user.id}})
+    response = await client.patch(
         Endpoints.POSTS_DETAIL.format(slug=post.slug),
         json={
             "title": fake.sentence(),
             "short_description": "",
             "publish_now": True,
         },
-        headers=get_header(),
+        headers=await get_header(),
     )
     assert response.status_code == status.HTTP_403_FORBIDDEN
 
 
-def test_delete_post() -> None:
-    user = get_user()
-    post = Post.get({"author_id": user.id})
-    response = client.delete(
-        Endpoints.POSTS_DETAIL.format(slug=post.slug), headers=get_header()
+async def test_delete_post() -> None:
+    user = await get_user()
+    post = await Post.aget({"author_id": user.id})
+    response = await client.delete(
+        Endpoints.POSTS_DETAIL.format(slug=post.slug), headers=await get_header()
     )
     assert response.status_code == status.HTTP_200_OK
 
     # Try to delete others post
-    post = Post.get({"author_id": {"$ne": user.id}})
-    response = client.delete(
-        Endpoints.POSTS_DETAIL.format(slug=post.slug), headers=get_header()
+    post = await Post.aget({"author_id": {"$ne": user.id}})
+    response = await client.delete(
+        Endpoints.POSTS_DETAIL.format(slug=post.slug), headers=await get_header()
     )
     assert response.status_code == status.HTTP_403_FORBIDDEN
-    assert Post.exists({"slug": post.slug}) is True, "Post was not deleted"
+    assert await Post.aexists({"slug": post.slug}) is True, "Post was not deleted"
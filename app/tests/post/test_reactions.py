@@ -1,41 +1,98 @@
+import pytest
 from faker import Faker
 from fastapi import status
-from fastapi.testclient import TestClient
+from mongodb_odm import ODMObjectId
 
-from app.main import app
-from app.post.models import Reaction
+from app.base.models import CounterWriter
+from app.base.utils.counter_buffer import CounterBuffer
+from app.base.utils.lifecycle import run_components
+from app.post.models import Post, Reaction, UserReaction
+from app.post.services import reaction as reaction_service
 from app.tests.endpoints import Endpoints
 from app.tests.post.helper import create_public_post
-from app.tests.utils import get_header, get_user
+from app.tests.utils import client, get_header, get_user
 
-client = TestClient(app)
 fake = Faker()
 
 
-def test_reactions() -> None:
-    user = get_user()
-    post = create_public_post(user.id)
+async def test_reactions() -> None:
+    user = await get_user()
+    post = await create_public_post(user.id)
 
-    response = client.post(
-        Endpoints.REACTIONS.format(slug=post.slug), headers=get_header()
+    response = await client.post(
+        Endpoints.REACTIONS.format(slug=post.slug), headers=await get_header()
     )
     assert response.status_code == status.HTTP_201_CREATED
-    assert Reaction.exists({"post_id": post.id, "user_ids": user.id}) is True
+    assert await Reaction.aexists({"post_id": post.id, "user_ids": user.id}) is True
+
+    # Reacting again should not add the user twice
+    response = await client.post(
+        Endpoints.REACTIONS.format(slug=post.slug), headers=await get_header()
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert await UserReaction.acount_documents({"post_id": post.id}) == 1
+    bucket = await Reaction.aget({"post_id": post.id})
+    assert bucket.count == 1 and bucket.user_ids == [user.id]
 
     # Delete reaction
-    response = client.delete(
-        Endpoints.REACTIONS.format(slug=post.slug), headers=get_header()
+    response = await client.delete(
+        Endpoints.REACTIONS.format(slug=post.slug), headers=await get_header()
     )
     assert response.status_code == status.HTTP_200_OK
-    assert Reaction.exists({"post_id": post.id, "user_ids": user.id}) is False
+    assert await Reaction.aexists({"post_id": post.id, "user_ids": user.id}) is False
+    assert await UserReaction.aexists({"post_id": post.id}) is False
+
+
+async def test_reaction_deleted_while_pending(monkeypatch: pytest.MonkeyPatch) -> None:
+    user = await get_user()
+    post = await create_public_post(user.id)
+    add_to_bucket = reaction_service._add_to_bucket
+
+    async def delete_then_add(
+        post_id: ODMObjectId, user_id: ODMObjectId
+    ) -> ODMObjectId:
+        # The delete finds the reaction before it is in a bucket
+        assert await reaction_service.delete_reaction(post_id, user_id) is True
+        return await add_to_bucket(post_id, user_id)
+
+    monkeypatch.setattr(reaction_service, "_add_to_bucket", delete_then_add)
+    assert await reaction_service.create_reaction(post.id, user.id) is True
 
+    # The create undid its bucket write
+    assert await UserReaction.aexists({"post_id": post.id}) is False
+    bucket = await Reaction.aget({"post_id": post.id})
+    assert bucket.count == 0 and bucket.user_ids == []
 
-def test_reactions_auth() -> None:
-    user = get_user()
-    post = create_public_post(user.id)
 
-    response = client.post(Endpoints.REACTIONS.format(slug=post.slug))
+async def test_reactions_auth() -> None:
+    user = await get_user()
+    post = await create_public_post(user.id)
+
+    response = await client.post(Endpoints.REACTIONS.format(slug=post.slug))
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
-    response = client.delete(Endpoints.REACTIONS.format(slug=post.slug))
+    response = await client.delete(Endpoints.REACTIONS.format(slug=post.slug))
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+async def test_post_counter_buffer() -> None:
+    user = await get_user()
+    post = await create_public_post(user.id)
+
+    counter = CounterBuffer(name="test", model=Post, flush_interval=60, max_size=100)
+    async with run_components(counter):
+        # Seen by reconcile-counters, which refuses to run
+        assert await CounterWriter.acount_documents({"name": "test"}) == 1
+
+        await counter.incr(post.id, "total_reaction", 1)
+        await counter.incr(post.id, "total_reaction", 1)
+        await counter.incr(post.id, "total_comment", 1)
+
+        # Nothing is written before the flush
+        assert (await Post.aget({"_id": post.id})).total_reaction == 0
+
+        assert await counter.flush() == 1
+        updated_post = await Post.aget({"_id": post.id})
+        assert updated_post.total_reaction == 2
+        assert updated_post.total_comment == 1
+    assert await CounterWriter.acount_documents({"name": "test"}) == 0
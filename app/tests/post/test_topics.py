@@ -1,46 +1,150 @@
+from uuid import uuid4
+
 from faker import Faker
 from fastapi import status
-from fastapi.testclient import TestClient
 
-from app.main import app
+from app.base.query_recorder import record_queries
+from app.base.utils.lifecycle import run_components
+from app.post.models import Topic
+from app.post.services.post import (
+    _insert_topics,
+    get_or_create_topic,
+    get_or_create_topics,
+    get_topic_ids_by_slug,
+    get_topic_slug,
+)
+from app.post.services.topic_catalog import topic_catalog
+from app.post.utils import normalize_topic_name
 from app.tests.endpoints import Endpoints
 from app.tests.post.helper import create_topic
-from app.tests.utils import get_header
+from app.tests.utils import client, get_header
 
-client = TestClient(app)
 fake = Faker()
 
 
-def test_get_topics() -> None:
-    response = client.get(Endpoints.TOPICS)
+async def test_get_topics() -> None:
+    response = await client.get(Endpoints.TOPICS)
     assert response.status_code == status.HTTP_200_OK
     assert "results" in response.json()
 
 
-def test_get_topics_search() -> None:
+async def test_get_topics_search() -> None:
     search_text = "something"
 
-    create_topic(search_text)
+    await create_topic(search_text)
 
-    response = client.get(Endpoints.TOPICS, params={"q": search_text})
+    response = await client.get(Endpoints.TOPICS, params={"q": search_text})
     assert response.status_code == status.HTTP_200_OK
 
 
-def test_create_topics() -> None:
+async def test_create_topics() -> None:
     payload = {"name": fake.word()}
 
-    response = client.post(Endpoints.TOPICS, json=payload)
+    response = await client.post(Endpoints.TOPICS, json=payload)
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
-    response = client.post(Endpoints.TOPICS, json=payload, headers=get_header())
+    response = await client.post(
+        Endpoints.TOPICS, json=payload, headers=await get_header()
+    )
     assert response.status_code == status.HTTP_201_CREATED
 
 
-def test_create_topics_multiple_time() -> None:
+async def test_create_topics_multiple_time() -> None:
     payload = {"name": fake.word()}
 
-    response = client.post(Endpoints.TOPICS, json=payload, headers=get_header())
+    response = await client.post(
+        Endpoints.TOPICS, json=payload, headers=await get_header()
+    )
     assert response.status_code == status.HTTP_201_CREATED
 
-    response = client.post(Endpoints.TOPICS, json=payload, headers=get_header())
+    response = await client.post(
+        Endpoints.TOPICS, json=payload, headers=await get_header()
+    )
     assert response.status_code == status.HTTP_201_CREATED
+
+
+async def test_get_or_create_topics() -> None:
+    name = f"Bulk Topic {uuid4()}"
+    existing = await get_or_create_topic(name)
+    assert existing is not None
+
+    new_name = f"New Topic {uuid4()}"
+    # One query for the existing topics, one insert for the new ones
+    with record_queries() as recorder:
+        topics = await get_or_create_topics(
+            [new_name, f"  {name.upper()} ", new_name.lower(), " "]
+        )
+    assert recorder.count == 2
+
+    assert [topic.name for topic in topics] == [new_name, name]
+    assert topics[1].id == existing.id
+    assert (
+        await Topic.acount_documents({"normalized_name": topics[0].normalized_name})
+        == 1
+    )
+
+
+async def test_get_or_create_topics_race() -> None:
+    name = f"Raced Topic {uuid4()}"
+    normalized_name = normalize_topic_name(name)
+    slug = get_topic_slug(name, normalized_name)
+
+    # Inserted by another request after the lookup, hits the unique index
+    topic = Topic(name=name, normalized_name=normalized_name, slug=slug)
+    assert await _insert_topics([topic]) == set()
+    raced = Topic(name=name, normalized_name=normalized_name, slug=slug)
+    assert await _insert_topics([raced]) == {0}
+
+    topics = await get_or_create_topics([name])
+    assert topics[0].id == topic.id
+
+
+async def test_topic_catalog() -> None:
+    topic = await get_or_create_topic(f"Catalog Topic {uuid4()}")
+    assert topic is not None
+
+    async with run_components(topic_catalog):
+        assert topic_catalog.get_by_slug(topic.slug) == topic
+
+        # Created by this process, found before the change is received
+        new_topic = await get_or_create_topic(f"Catalog Topic {uuid4()}")
+        assert new_topic is not None
+        assert topic_catalog.get(new_topic.id) == new_topic
+
+        with record_queries() as recorder:
+            topics = await get_or_create_topics([topic.name, new_topic.name])
+            topic_ids = await get_topic_ids_by_slug([topic.slug])
+        assert recorder.count == 0
+        assert [obj.id for obj in topics] == [topic.id, new_topic.id]
+        assert topic_ids == [topic.id]
+
+        topic_catalog._apply_change(
+            {"operationType": "delete", "documentKey": {"_id": new_topic.id}}
+        )
+        assert topic_catalog.get(new_topic.id) is None
+
+
+async def test_suggest_topics() -> None:
+    word = f"sg{uuid4().hex[:8]}"
+    names = [f"{word} Basics", f"Advanced {word}", f"{word}ing", f"Not {word[:-1]}"]
+    topics = await get_or_create_topics(names)
+    for topic, total_post in zip(topics, [1, 5, 1, 9], strict=True):
+        await Topic.aupdate_many(
+            {"_id": topic.id}, {"$set": {"total_post": total_post}}
+        )
+    expected = [f"Advanced {word}", f"{word} Basics", f"{word}ing"]
+
+    response = await client.get(Endpoints.TOPICS_SUGGEST, params={"q": word[0]})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    response = await client.get(Endpoints.TOPICS_SUGGEST, params={"q": word.upper()})
+    assert response.status_code == status.HTTP_200_OK
+    assert [obj["name"] for obj in response.json()["results"]] == expected
+
+    async with run_components(topic_catalog):
+        with record_queries() as recorder:
+            response = await client.get(
+                Endpoints.TOPICS_SUGGEST, params={"q": word, "limit": 2}
+            )
+        assert recorder.count == 0
+        assert [obj["name"] for obj in response.json()["results"]] == expected[:2]
@@ -1,42 +1,111 @@
+from uuid import uuid4
+
+from bson import ObjectId
 from fastapi import status
-from fastapi.testclient import TestClient
 
-from app.main import app
+from app.post.models import Comment, Post
 from app.tests.endpoints import Endpoints
-from app.tests.utils import get_header, get_user
+from app.tests.post.helper import create_public_post
+from app.tests.utils import client, get_header, get_user
+from app.user.models import User
 from cli.management_command.data_population import users
 
-client = TestClient(app)
-
 
-def test_get_me() -> None:
-    response = client.get(Endpoints.ME, headers=get_header())
+async def test_get_me() -> None:
+    response = await client.get(Endpoints.ME, headers=await get_header())
     assert response.status_code == status.HTTP_200_OK
     assert response.json()["username"] == users[0]["username"]
 
 
-def test_get_user_details() -> None:
-    user = get_user()
-    response = client.get(Endpoints.USER_PROFILE, headers=get_header())
+async def test_get_user_details() -> None:
+    user = await get_user()
+    response = await client.get(Endpoints.USER_PROFILE, headers=await get_header())
 
     assert response.status_code == status.HTTP_200_OK
     assert response.json()["username"] == user.username
 
 
-def test_update_user() -> None:
+async def test_update_user() -> None:
     new_full_name = "New Name"
-    response = client.patch(
-        Endpoints.USER_UPDATE, json={"full_name": new_full_name}, headers=get_header()
+    response = await client.patch(
+        Endpoints.USER_UPDATE,
+        json={"full_name": new_full_name},
+        headers=await get_header(),
     )
 
     assert response.status_code == status.HTTP_200_OK
     assert response.json()["full_name"] == new_full_name
     assert response.json()["username"] == users[0]["username"]
 
+    # Cached authenticated user should be invalidated by the update
+    response = await client.get(Endpoints.ME, headers=await get_header())
+    assert response.json()["full_name"] == new_full_name
 
-def test_user_public_profile() -> None:
-    user = get_user()
-    response = client.get(Endpoints.PUBLIC_PROFILE.format(username=user.username))
+
+async def test_user_public_profile() -> None:
+    user = await get_user()
+    response = await client.get(Endpoints.PUBLIC_PROFILE.format(username=user.username))
 
     assert response.status_code == status.HTTP_200_OK
     assert response.json()["username"] == user.username, "'username' does not match"
+
+
+async def test_update_user_author_snapshot() -> None:
+    user = await get_user()
+    # Written before the snapshots, the fan-out fills it in
+    post = await create_public_post(user.id)
+    response = await client.post(
+        Endpoints.COMMENTS.format(slug=post.slug),
+        json={"description": "Unittest"},
+        headers=await get_header(),
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    comment = await Comment.aget({"post_id": post.id})
+    response = await client.post(
+        Endpoints.REPLIES.format(slug=post.slug, comment_id=comment.id),
+        json={"description": "Unittest"},
+        headers=await get_header(),
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    new_full_name = f"Snapshot {uuid4()}"
+    response = await client.patch(
+        Endpoints.USER_UPDATE,
+        json={"full_name": new_full_name},
+        headers=await get_header(),
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    # The background task is done when the response is returned
+    post = await Post.aget({"_id": post.id})
+    comment = await Comment.aget({"_id": comment.id})
+    assert post.author_snapshot and post.author_snapshot.full_name == new_full_name
+    assert comment.user_snapshot and comment.user_snapshot.full_name == new_full_name
+    assert comment.replies[0].user_snapshot
+    assert comment.replies[0].user_snapshot.full_name == new_full_name
+
+    response = await client.get(Endpoints.COMMENTS.format(slug=post.slug))
+    assert response.json()["results"][0]["user"]["full_name"] == new_full_name
+
+
+async def test_author_snapshot_with_stale_cached_user() -> None:
+    user = await get_user()
+    post = await create_public_post(user.id)
+    # Warm the cached user, then update the profile as another worker would
+    await client.get(Endpoints.ME, headers=await get_header())
+    new_full_name = f"Snapshot {uuid4()}"
+    await User.aupdate_many(
+        {"_id": user.id},
+        {"$set": {"full_name": new_full_name}, "$inc": {"profile_version": 1}},
+    )
+
+    response = await client.post(
+        Endpoints.COMMENTS.format(slug=post.slug),
+        json={"description": "Unittest"},
+        headers=await get_header(),
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    comment = await Comment.aget({"_id": ObjectId(response.json()["id"])})
+    assert comment.user_snapshot
+    assert comment.user_snapshot.full_name == new_full_name
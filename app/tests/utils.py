@@ -1,9 +1,8 @@
 import logging
 import os
-from functools import cache
 from typing import Any
 
-from fastapi.testclient import TestClient
+from httpx import ASGITransport, AsyncClient
 
 from app.base import config
 from app.main import app
@@ -12,12 +11,11 @@ from app.user.services.token import TokenService
 from cli.management_command.data_population import users
 
 logger = logging.getLogger(__name__)
-client = TestClient(app)
+client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
 
 
-@cache
-def get_user() -> User:
-    return User.get({"username": users[0]["username"]})
+async def get_user() -> User:
+    return await User.aget({"username": users[0]["username"]})
 
 
 def get_auth_header(access_token: str) -> dict[str, Any]:
@@ -32,9 +30,8 @@ def get_header_by_user(user: User) -> dict[str, Any]:
     return get_auth_header(access_token)
 
 
-@cache
-def get_header() -> dict[str, Any]:
-    user = get_user()
+async def get_header() -> dict[str, Any]:
+    user = await get_user()
 
     return get_header_by_user(user)
 
@@ -43,5 +40,5 @@ def get_test_file_path() -> str:
     return os.path.join(config.BASE_DIR, "app/tests/files")
 
 
-def get_other_user(current_user: User) -> User:
-    return User.get_random_one({"_id": {"$ne": current_user.id}})
+async def get_other_user(current_user: User) -> User:
+    return await User.aget_random_one({"_id": {"$ne": current_user.id}})
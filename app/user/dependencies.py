@@ -2,7 +2,6 @@ from enum import Enum
 from typing import Any
 
 import jwt
-from bson import ObjectId
 from fastapi import Depends, status
 from fastapi.security import OAuth2PasswordBearer
 
@@ -10,6 +9,7 @@ from app.base.config import ALGORITHM, SECRET_KEY
 from app.base.exceptions import CustomException, ExType
 from app.user.models import User
 from app.user.schemas import TokenData
+from app.user.services.user_cache import get_user_from_token
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 oauth2_scheme_or_none = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
@@ -56,10 +56,7 @@ async def get_authenticated_token(token: str = Depends(oauth2_scheme)) -> TokenD
 async def get_authenticated_user(
     token_data: TokenData = Depends(get_authenticated_token),
 ) -> User:
-    user = User.find_one(
-        {"_id": ObjectId(token_data.id), "random_str": token_data.random_str},
-        projection={"user_links": False, "bio": False},
-    )
+    user = await get_user_from_token(token_data)
     if user is None:
         raise credentials_exception
     if user.is_active is False:
@@ -87,9 +84,7 @@ async def get_authenticated_user_or_none(
 ) -> User | None:
     if not token_data:
         return None
-    user = User.find_one(
-        {"_id": ObjectId(token_data.id), "random_str": token_data.random_str}
-    )
+    user = await get_user_from_token(token_data)
     if user and user.is_active:
         return user
     return None
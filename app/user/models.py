@@ -25,6 +25,19 @@ class EmbeddedUserLinks(BaseModel):
     is_public: bool = False
 
 
+class AuthorSnapshot(BaseModel):
+    """
+    Public fields of a user embedded in the posts, comments and replies they
+    wrote, lists are read without a query on the users. `version` is the
+    `profile_version` of the user the copy was taken from.
+    """
+
+    username: str
+    full_name: str
+    image: str | None = None
+    version: int = 0
+
+
 class User(Document):
     username: str = Field(...)
     email: str | None = Field(default=None)
@@ -42,12 +55,17 @@ class User(Document):
     address: str | None = Field(default=None)
     user_links: list[EmbeddedUserLinks] = Field(default_factory=list)
 
+    # Incremented when username, full_name or image change
+    profile_version: int = Field(default=0)
+
     updated_at: datetime = Field(default_factory=datetime.now)
 
     class ODMConfig(Document.ODMConfig):
         collection_name = "user"
         indexes = [
             IndexModel([("username", ASCENDING)], unique=True),
+            # Covers the username to id lookup of the author feed
+            IndexModel([("username", ASCENDING), ("_id", ASCENDING)]),
         ]
 
     @classmethod
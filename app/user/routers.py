@@ -1,12 +1,14 @@
 import logging
 from typing import Any
 
-from fastapi import APIRouter, Body, Depends, status
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, status
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app.base.exceptions import CustomException, ExType
+from app.base.services.media import update_media_references
 from app.base.utils import update_partially
 from app.base.utils.query import get_object_or_404
+from app.post.services.author import fan_out_author_snapshot, has_snapshot_changed
 from app.user.dependencies import get_authenticated_user, get_authenticated_user_or_none
 from app.user.models import User
 from app.user.schemas import (
@@ -23,6 +25,7 @@ from app.user.services import token as token_service
 from app.user.services import user as user_service
 from app.user.services.auth import AuthService
 from app.user.services.token import TokenService
+from app.user.services.user_cache import invalidate_user
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -32,7 +35,7 @@ logger = logging.getLogger(__name__)
     "/api/v1/registration", status_code=status.HTTP_201_CREATED, response_model=UserOut
 )
 async def registration(data: Registration) -> Any:
-    user = user_service.create_user(
+    user = await user_service.create_user(
         username=data.username,
         full_name=data.full_name,
         plain_password=data.password,
@@ -45,19 +48,19 @@ async def registration(data: Registration) -> Any:
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
 ) -> Any:
-    return token_service.token_response(form_data.username, form_data.password)
+    return await token_service.token_response(form_data.username, form_data.password)
 
 
 @router.post("/api/v1/token")
 async def login(data: LoginIn) -> Any:
-    return token_service.token_response(data.username, data.password)
+    return await token_service.token_response(data.username, data.password)
 
 
 @router.post("/api/v1/update-access-token")
 async def update_access_token(
     data: UpdateAccessTokenIn = Body(...),
 ) -> Any:
-    access_token = TokenService.create_access_token_from_refresh_token(
+    access_token = await TokenService.create_access_token_from_refresh_token(
         data.refresh_token
     )
     return {"access_token": access_token}
@@ -67,7 +70,7 @@ async def update_access_token(
 async def change_password(
     data: ChangePasswordIn, user: User = Depends(get_authenticated_user)
 ) -> Any:
-    if not user.password or not AuthService.verify_password(
+    if not user.password or not await AuthService.averify_password(
         data.current_password, user.password
     ):
         raise CustomException(
@@ -77,17 +80,18 @@ async def change_password(
             detail="Password did not match",
         )
 
-    hash_password = AuthService.get_password_hash(data.new_password)
+    hash_password = await AuthService.aget_password_hash(data.new_password)
 
-    user.update(raw={"$set": {"password": hash_password}})
+    await user.aupdate(raw={"$set": {"password": hash_password}})
+    invalidate_user(user.id)
 
     return {"message": "Password changed successfully."}
 
 
 @router.put("/api/v1/logout-from-all-device")
 async def logout_from_all_device(user: User = Depends(get_authenticated_user)) -> Any:
-    user.random_str = User.new_random_str()
-    user.update()
+    await user.aupdate(raw={"$set": {"random_str": User.new_random_str()}})
+    invalidate_user(user.id)
 
     return {"message": "Logged out."}
 
@@ -101,19 +105,31 @@ async def get_me(user: User = Depends(get_authenticated_user)) -> Any:
 async def get_user_details(
     user: User = Depends(get_authenticated_user),
 ) -> UserDetailsOut:
-    user_details = User.find_one({"_id": user.id})
+    user_details = await User.afind_one({"_id": user.id})
 
     return UserDetailsOut(**user_details.model_dump())  # type: ignore
 
 
 @router.patch("/api/v1/users/update", response_model=UserOut)
 async def update_user(
-    user_data: UserDetailsIn, user: User = Depends(get_authenticated_user)
+    user_data: UserDetailsIn,
+    background_tasks: BackgroundTasks,
+    user: User = Depends(get_authenticated_user),
 ) -> Any:
-    user_details = User.find_one({"_id": user.id})
+    user_details = await User.afind_one({"_id": user.id})
+    old_user = user_details.model_copy()  # type: ignore
 
     user_details = update_partially(user_details, user_data)
-    user_details.update()
+    snapshot_changed = has_snapshot_changed(old_user, user_details)
+    if snapshot_changed:
+        user_details.profile_version += 1
+    await user_details.aupdate()
+    invalidate_user(user.id)
+    await update_media_references(old_user.image, user_details.image)
+
+    if snapshot_changed:
+        # Posts and comments of the user embed their author, see services.author
+        background_tasks.add_task(fan_out_author_snapshot, user.id)
 
     return UserOut(**user_details.model_dump())
 
@@ -123,7 +139,7 @@ async def ger_user_public_profile(
     username: str,
     _: User | None = Depends(get_authenticated_user_or_none),
 ) -> Any:
-    public_user: User = get_object_or_404(User, filter={"username": username})
+    public_user: User = await get_object_or_404(User, filter={"username": username})
     user_dump = public_user.model_dump()
 
     return PublicUserProfile(**user_dump)
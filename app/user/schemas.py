@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 
+from app.base.utils.query import get_projection
 from app.user.models import EmbeddedUserLinks
 
 
@@ -62,6 +63,9 @@ class PublicUserListOut(BaseModel):
     image: str | None = Field(default=None)
 
 
+PUBLIC_USER_PROJECTION = get_projection(PublicUserListOut)
+
+
 class PublicUserProfile(BaseModel):
     username: str = Field(...)
     full_name: str = Field(...)
@@ -1,29 +1,55 @@
 from passlib.context import CryptContext
 
 from app.base.base_class import StaticBase
+from app.base.config import PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_WORKERS
+from app.base.utils.process_pool import BoundedProcessPool
 from app.user.models import User
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+password_hash_pool = BoundedProcessPool(
+    name="password_hash",
+    max_workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING,
+)
+
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
+
 
 class AuthService(StaticBase):
     @classmethod
     def verify_password(cls, plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+        return _verify_password(plain_password, hashed_password)
 
     @classmethod
     def get_password_hash(cls, password: str) -> str:
-        return pwd_context.hash(password)
+        return _get_password_hash(password)
+
+    @classmethod
+    async def averify_password(cls, plain_password: str, hashed_password: str) -> bool:
+        return await password_hash_pool.run(
+            _verify_password, plain_password, hashed_password
+        )
+
+    @classmethod
+    async def aget_password_hash(cls, password: str) -> str:
+        return await password_hash_pool.run(_get_password_hash, password)
 
     @classmethod
-    def authenticate_user(cls, username: str, password: str) -> User | None:
-        user = User.find_one({"username": username})
+    async def authenticate_user(cls, username: str, password: str) -> User | None:
+        user = await User.afind_one({"username": username})
 
         if not user:
             return None
         if not user.password:
             return None
-        if not cls.verify_password(password, user.password):
+        if not await cls.averify_password(password, user.password):
             return None
 
         return user
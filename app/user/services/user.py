@@ -10,8 +10,8 @@ from app.user.services.auth import AuthService
 logger = logging.getLogger(__name__)
 
 
-def create_user(username: str, full_name: str, plain_password: str) -> User:
-    if User.exists({"username": username}):
+async def create_user(username: str, full_name: str, plain_password: str) -> User:
+    if await User.aexists({"username": username}):
         raise CustomException(
             status_code=status.HTTP_400_BAD_REQUEST,
             code=ExType.USERNAME_EXISTS,
@@ -19,15 +19,16 @@ def create_user(username: str, full_name: str, plain_password: str) -> User:
             field="username",
         )
 
+    hash_password = await AuthService.aget_password_hash(plain_password)
+
     try:
-        hash_password = AuthService.get_password_hash(plain_password)
-        user = User(
+        user = await User(
             username=username,
             full_name=full_name,
             joining_date=datetime.now(),
             password=hash_password,
             random_str=User.new_random_str(),
-        ).create()
+        ).acreate()
     except Exception as ex:
         logger.warning(f"Raise error while creating user error:{ex}")
         raise CustomException(
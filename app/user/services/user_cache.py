@@ -0,0 +1,48 @@
+import logging
+from typing import Any
+
+from bson import ObjectId
+
+from app.base.config import USER_CACHE_MAX_SIZE, USER_CACHE_TTL
+from app.base.utils.cache import TTLCache
+from app.user.models import User
+from app.user.schemas import TokenData
+
+logger = logging.getLogger(__name__)
+
+# Handlers get a full User, only the profile fields no handler reads are left out
+AUTHENTICATED_USER_PROJECTION = {"user_links": False, "bio": False, "address": False}
+
+"""
+Authenticated users keyed by the token (id, random_str).
+A changed random_str never matches an old token, but the entries are still
+dropped explicitly on every user write so that the cached data stays fresh.
+"""
+user_cache: TTLCache[tuple[str, str], User] = TTLCache(
+    name="authenticated_user", maxsize=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL
+)
+
+
+async def get_user_from_token(token_data: TokenData) -> User | None:
+    key = (token_data.id, token_data.random_str)
+
+    user = user_cache.get(key)
+    if user is None:
+        user = await User.afind_one(
+            {"_id": ObjectId(token_data.id), "random_str": token_data.random_str},
+            projection=AUTHENTICATED_USER_PROJECTION,
+        )
+        if user is None:
+            return None
+
+        user_cache.set(key, user)
+
+    # Handlers are free to modify the user they get.
+    return user.model_copy()
+
+
+def invalidate_user(user_id: Any) -> None:
+    user_id = str(user_id)
+
+    deleted = user_cache.delete_matching(lambda key: key[0] == user_id)
+    logger.debug(f"Removed {deleted} cached entries for user={user_id}")
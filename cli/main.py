@@ -9,6 +9,131 @@ def create_indexes() -> None:
     apply_indexes()
 
 
+@app.command()
+def index_report() -> None:
+    """Diff declared and live indexes and report unused ones via $indexStats."""
+    from cli.management_command.index_report import print_index_report
+
+    if not print_index_report():
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def migrate_reactions() -> None:
+    """Add count and user_reaction documents to the old reaction buckets."""
+    from cli.management_command.reaction_migration import migrate_reactions
+
+    migrate_reactions()
+
+
+@app.command()
+def repair_reactions() -> None:
+    """Finish or remove the reactions left half written by a crashed worker."""
+    from cli.management_command.reaction_migration import repair_reactions
+
+    repair_reactions()
+
+
+@app.command()
+def migrate_topics() -> None:
+    """Set normalized_name on the old topics and merge the duplicates."""
+    from cli.management_command.topic_migration import migrate_topics
+
+    migrate_topics()
+
+
+@app.command()
+def reconcile_counters(
+    force: bool = typer.Option(False, help="Run even if the app is running"),
+) -> None:
+    """Recompute the post and topic counters from the source, app stopped."""
+    from cli.management_command.counter_reconciliation import reconcile_counters
+
+    if not reconcile_counters(force):
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def sync_author_snapshots() -> None:
+    """Backfill and repair the author snapshots of posts and comments."""
+    from cli.management_command.author_snapshot import sync_author_snapshots
+
+    sync_author_snapshots()
+
+
+@app.command()
+def migrate_media() -> None:
+    """Move uploaded files to content-addressed paths and update references."""
+    from cli.management_command.media import migrate_media
+
+    migrate_media()
+
+
+@app.command()
+def gc_media(grace_hours: int = typer.Option(24)) -> None:
+    """Delete media files that no post or user references anymore."""
+    from cli.management_command.media import collect_media_garbage
+
+    collect_media_garbage(grace_hours=grace_hours)
+
+
+@app.command()
+def upload_media() -> None:
+    """Copy the local media files to the configured storage (MEDIA_STORAGE=s3)."""
+    from cli.management_command.media import upload_media
+
+    upload_media()
+
+
+@app.command()
+def benchmark(
+    target: str = typer.Argument(
+        help="One of: post-details, serialization, middleware"
+    ),
+    iterations: int = typer.Option(1000),
+) -> None:
+    """Print p50/p95/p99 latency of the alternative implementations."""
+    from cli.management_command import benchmark as benchmarks
+
+    targets = {
+        "post-details": benchmarks.benchmark_post_details,
+        "serialization": benchmarks.benchmark_serialization,
+        "middleware": benchmarks.benchmark_middleware,
+    }
+    if target not in targets:
+        raise typer.BadParameter(f"Unknown target '{target}'")
+
+    targets[target](iterations)
+
+
+@app.command()
+def load_test(
+    base_url: str = typer.Option(None, help="Server to test, default is in process"),
+    duration: float = typer.Option(30, help="Seconds"),
+    concurrency: int = typer.Option(20),
+    seed: int = typer.Option(0, help="Same seed, same sequence of requests"),
+    seed_data: bool = typer.Option(False, help="Populate the database first"),
+    total_user: int = typer.Option(1000),
+    total_post: int = typer.Option(1000),
+    output: str = typer.Option("load-test.json"),
+    compare: str = typer.Option(None, help="Report of a previous run"),
+) -> None:
+    """Mixed load on the public API, p50/p95/p99 and req/s per endpoint to JSON."""
+    from cli.management_command import load_test as load_tests
+
+    if seed_data:
+        load_tests.seed_data(total_user=total_user, total_post=total_post)
+
+    load_tests.load_test(
+        base_url=base_url,
+        duration=duration,
+        concurrency=concurrency,
+        seed=seed,
+        output=output,
+        compare=compare,
+    )
+
+
 @app.command()
 def populate_data(
     total_user: int = typer.Option(100),
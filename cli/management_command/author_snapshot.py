@@ -0,0 +1,36 @@
+import logging
+
+from app.post.services.author import (
+    SNAPSHOT_USER_PROJECTION,
+    get_snapshot_from_raw,
+    get_snapshot_updates,
+)
+from app.user.models import User
+
+log = logging.getLogger(__name__)
+
+
+def sync_author_snapshots() -> None:
+    """
+    Write the current snapshot of every user to the posts, comments and replies
+    holding an older one or none. Backfills the data created before the
+    snapshots and repairs the writes that raced with a profile update.
+    """
+    total_users = 0
+    modified = 0
+    for user in User.find_raw(projection=SNAPSHOT_USER_PROJECTION):
+        updates = get_snapshot_updates(user["_id"], get_snapshot_from_raw(user))
+        for snapshot_update in updates:
+            kwargs = {}
+            if snapshot_update.array_filters:
+                kwargs["array_filters"] = snapshot_update.array_filters
+
+            result = snapshot_update.model.update_many(
+                snapshot_update.filter, snapshot_update.update, **kwargs
+            )
+            modified += result.modified_count
+        total_users += 1
+
+    log.info(
+        f"Author snapshots of {total_users} users checked, {modified} documents updated"
+    )
@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import statistics
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+from time import perf_counter
+from typing import Any
+
+import typer
+from bson import ObjectId
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from httpx import ASGITransport, AsyncClient
+from mongodb_odm import ObjectIdStr, adisconnect, connect, disconnect
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.base import config
+from app.base.exceptions import CustomException, ExType
+from app.base.middleware import CatchExceptionsMiddleware
+from app.base.utils.serializer import PageSerializer
+from app.post.models import Post, Topic
+from app.post.schemas.posts import PostListOut
+from app.post.services import post as post_service
+from app.user.models import User
+
+log = logging.getLogger(__name__)
+
+
+def get_percentiles(samples: list[float]) -> dict[str, float]:
+    """Latency summary in milliseconds."""
+    quantiles = statistics.quantiles(samples, n=100, method="inclusive")
+
+    return {
+        "p50": quantiles[49] * 1000,
+        "p95": quantiles[94] * 1000,
+        "p99": quantiles[98] * 1000,
+        "mean": statistics.fmean(samples) * 1000,
+    }
+
+
+async def measure(
+    func: Callable[[], Awaitable[Any]], iterations: int, warmup: int = 10
+) -> list[float]:
+    for _ in range(warmup):
+        await func()
+
+    samples = []
+    for _ in range(iterations):
+        start = perf_counter()
+        await func()
+        samples.append(perf_counter() - start)
+
+    return samples
+
+
+def measure_sync(
+    func: Callable[[], Any], iterations: int, warmup: int = 10
+) -> list[float]:
+    for _ in range(warmup):
+        func()
+
+    samples = []
+    for _ in range(iterations):
+        start = perf_counter()
+        func()
+        samples.append(perf_counter() - start)
+
+    return samples
+
+
+def print_percentiles(name: str, samples: list[float]) -> None:
+    result = get_percentiles(samples)
+    typer.echo(
+        f"{name:<32} p50={result['p50']:.2f}ms p95={result['p95']:.2f}ms "
+        f"p99={result['p99']:.2f}ms mean={result['mean']:.2f}ms"
+    )
+
+
+def run_async(main: Callable[[], Awaitable[None]]) -> None:
+    """The CLI holds a sync connection, swap it for an async one while running"""
+
+    async def _run() -> None:
+        connect(config.MONGO_URL, async_is_enabled=True)
+        try:
+            await main()
+        finally:
+            await adisconnect()
+
+    disconnect()
+    try:
+        asyncio.run(_run())
+    finally:
+        connect(config.MONGO_URL)
+
+
+async def _post_details_with_queries(slug: str) -> None:
+    post = await post_service.get_post_details_or_404(slug)
+    post.author = await User.afind_one({"_id": post.author_id})
+    post.topics = [
+        topic async for topic in Topic.afind({"_id": {"$in": post.topic_ids}})
+    ]
+
+
+async def _post_details_with_lookup(slug: str) -> None:
+    await post_service.get_post_details_document_or_404(slug)
+
+
+def benchmark_post_details(iterations: int) -> None:
+    """Post details as three queries against the single $lookup aggregation."""
+
+    async def main() -> None:
+        post = await Post.afind_one(
+            {"publish_at": {"$type": "date"}, "topic_ids.0": {"$exists": True}}
+        )
+        if post is None:
+            typer.echo("No published post with topics, run 'populate-data' first.")
+            return
+
+        for name, func in [
+            ("post details: 3 queries", _post_details_with_queries),
+            ("post details: $lookup", _post_details_with_lookup),
+        ]:
+            samples = await measure(lambda func=func: func(post.slug), iterations)
+            print_percentiles(name, samples)
+
+    run_async(main)
+
+
+def _get_raw_post_page(size: int) -> list[dict[str, Any]]:
+    """Documents as find_raw returns them, with the author already joined"""
+    now = datetime.now()
+    author = {
+        "_id": ObjectId(),
+        "username": "username",
+        "full_name": "Full Name",
+        "image": "/media/image.jpg",
+        "joining_date": now,
+    }
+
+    return [
+        {
+            "_id": ObjectId(),
+            "author_id": author["_id"],
+            "title": f"Post title {i}",
+            "slug": f"post-title-{i}",
+            "short_description": "Short description of the post " * 4,
+            "cover_image": "/media/cover.jpg",
+            "total_comment": i,
+            "total_reaction": i * 2,
+            "publish_at": now,
+            "topic_ids": [ObjectId() for _ in range(3)],
+            "created_at": now,
+            "updated_at": now,
+            "author": author,
+        }
+        for i in range(size)
+    ]
+
+
+def benchmark_serialization(iterations: int) -> None:
+    """
+    A page of 100 posts as the list routes used to encode it,
+    Document -> model_dump -> PostListOut -> model_dump -> jsonable_encoder,
+    against the raw documents encoded by PageSerializer.
+    """
+    posts = _get_raw_post_page(100)
+    serializer = PageSerializer(PostListOut)
+
+    def document_path() -> bytes:
+        results = []
+        for raw in posts:
+            post = Post(**{k: v for k, v in raw.items() if k != "author"})
+            post.author = User(**raw["author"])
+            results.append(PostListOut(**post.model_dump()).model_dump())
+
+        content = {"after": ObjectIdStr(posts[-1]["_id"]), "results": results}
+        return bytes(JSONResponse(jsonable_encoder(content)).body)
+
+    def raw_path() -> bytes:
+        return serializer.dump_json(ObjectIdStr(posts[-1]["_id"]), posts)
+
+    if document_path() != raw_path():
+        typer.echo("Warning: the two paths encode the page differently")
+
+    print_percentiles("100 posts: documents", measure_sync(document_path, iterations))
+    print_percentiles("100 posts: PageSerializer", measure_sync(raw_path, iterations))
+
+
+async def _legacy_catch_exceptions(request: Request, call_next: Any) -> Any:
+    """The BaseHTTPMiddleware dispatch CatchExceptionsMiddleware replaced"""
+    try:
+        return await call_next(request)
+    except Exception as e:
+        raise CustomException(
+            status_code=500,
+            code=ExType.INTERNAL_SERVER_ERROR,
+            detail="Internal server error. Try later.",
+        ) from e
+
+
+def _use_exception_middleware(app: Any, middleware: Middleware) -> None:
+    app.user_middleware = [
+        middleware if mw.cls in (CatchExceptionsMiddleware, BaseHTTPMiddleware) else mw
+        for mw in app.user_middleware
+    ]
+    # Starlette builds the stack again on the next request
+    app.middleware_stack = None
+
+
+async def measure_throughput(
+    client: AsyncClient, path: str, iterations: int, concurrency: int
+) -> float:
+    """Requests per second of `concurrency` clients sharing `iterations` requests"""
+    remaining = iterations
+
+    async def worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            response = await client.get(path)
+            response.raise_for_status()
+
+    start = perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return iterations / (perf_counter() - start)
+
+
+def benchmark_middleware(iterations: int, concurrency: int = 32) -> None:
+    """
+    Requests/sec of the app with the exception middleware mounted through
+    BaseHTTPMiddleware and as a plain ASGI middleware. The requests go through
+    the whole app in process, there is no network or server involved. The feed
+    cache is turned off, a cached feed would hide the cost of the stack behind
+    a cache hit.
+    """
+    from app.main import app
+    from app.post.services.cache import post_feed_cache
+
+    middlewares = [
+        (
+            "BaseHTTPMiddleware",
+            Middleware(BaseHTTPMiddleware, dispatch=_legacy_catch_exceptions),
+        ),
+        ("ASGI middleware", Middleware(CatchExceptionsMiddleware)),
+    ]
+
+    async def main() -> None:
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            for path in ["/health", "/api/v1/posts"]:
+                for name, middleware in middlewares:
+                    _use_exception_middleware(app, middleware)
+                    await measure_throughput(client, path, 100, concurrency)
+
+                    rps = await measure_throughput(
+                        client, path, iterations, concurrency
+                    )
+                    typer.echo(f"{path:<16} {name:<20} {rps:.0f} req/s")
+
+    # httpx logs every request
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    feed_cache_ttl, post_feed_cache.ttl = post_feed_cache.ttl, 0
+    try:
+        run_async(main)
+    finally:
+        post_feed_cache.ttl = feed_cache_ttl
+        _use_exception_middleware(app, Middleware(CatchExceptionsMiddleware))
@@ -0,0 +1,103 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Any
+
+from mongodb_odm import Document, UpdateOne
+
+from app.base.models import CounterWriter
+from app.base.utils.counter_buffer import WRITER_TIMEOUT
+from app.post.models import Comment, Post, Topic, UserReaction
+
+log = logging.getLogger(__name__)
+
+WRITE_OPS_LIMIT = 10000
+
+
+def _count_by_post(model: type[Document]) -> dict[Any, int]:
+    pipeline = [{"$group": {"_id": "$post_id", "total": {"$sum": 1}}}]
+
+    return {obj["_id"]: obj["total"] for obj in model.aggregate(pipeline, get_raw=True)}
+
+
+def get_running_writers() -> list[str]:
+    """host:pid of the counter buffers that are alive"""
+    cutoff = datetime.now() - timedelta(seconds=WRITER_TIMEOUT)
+    writers = CounterWriter.find_raw(
+        {"beat_at": {"$gte": cutoff}}, projection={"host": 1, "pid": 1}
+    )
+
+    return sorted({f"{writer['host']}:{writer['pid']}" for writer in writers})
+
+
+def reconcile_counters(force: bool = False) -> bool:
+    """
+    Recompute total_comment and total_reaction of every post from the
+    comment and user_reaction collections, only mismatched posts are written.
+    total_post of the topics is recomputed after.
+
+    The increments still buffered by a running app would be counted twice,
+    it refuses to run while a counter buffer is alive unless `force` is set.
+    """
+    running_writers = get_running_writers()
+    if running_writers and not force:
+        log.error(
+            f"Counter buffers are running in {', '.join(running_writers)}. "
+            "Stop the app first, their pending increments would be counted twice."
+        )
+        return False
+
+    total_comments = _count_by_post(Comment)
+    total_reactions = _count_by_post(UserReaction)
+
+    updated = 0
+    write_posts = []
+    projection = {"total_comment": 1, "total_reaction": 1}
+    for post in Post.find_raw(projection=projection):
+        counters = {
+            "total_comment": total_comments.get(post["_id"], 0),
+            "total_reaction": total_reactions.get(post["_id"], 0),
+        }
+        if all(post.get(field) == val for field, val in counters.items()):
+            continue
+
+        write_posts.append(UpdateOne({"_id": post["_id"]}, {"$set": counters}))
+        if len(write_posts) >= WRITE_OPS_LIMIT:
+            updated += Post.bulk_write(requests=write_posts).modified_count
+            write_posts = []
+    if write_posts:
+        updated += Post.bulk_write(requests=write_posts).modified_count
+
+    log.info(f"{updated} post counters fixed")
+
+    reconcile_topic_counters()
+
+    return True
+
+
+def reconcile_topic_counters() -> None:
+    """Recompute total_post of every topic from the posts"""
+    pipeline = [
+        {"$unwind": "$topic_ids"},
+        {"$group": {"_id": "$topic_ids", "total": {"$sum": 1}}},
+    ]
+    total_posts = {
+        obj["_id"]: obj["total"] for obj in Post.aggregate(pipeline, get_raw=True)
+    }
+
+    updated = 0
+    write_topics = []
+    for topic in Topic.find_raw(projection={"total_post": 1}):
+        total_post = total_posts.get(topic["_id"], 0)
+        if topic.get("total_post") == total_post:
+            continue
+
+        write_topics.append(
+            UpdateOne({"_id": topic["_id"]}, {"$set": {"total_post": total_post}})
+        )
+        if len(write_topics) >= WRITE_OPS_LIMIT:
+            updated += Topic.bulk_write(requests=write_topics).modified_count
+            write_topics = []
+    if write_topics:
+        updated += Topic.bulk_write(requests=write_topics).modified_count
+
+    log.info(f"{updated} topic counters fixed")
@@ -13,11 +13,20 @@ from mongodb_odm import InsertOne, apply_indexes
 from mongodb_odm.connection import db
 from slugify import slugify
 
-from app.base.utils.decorator import timing
-from app.post.models import Comment, EmbeddedReply, Post, Reaction, Topic
-from app.post.utils import get_post_description_from_str
+from app.base.utils.profiling import profiled
+from app.post.models import (
+    REACTION_BUCKET_SIZE,
+    Comment,
+    EmbeddedReply,
+    Post,
+    Reaction,
+    Topic,
+    UserReaction,
+)
+from app.post.utils import get_post_description_from_str, normalize_topic_name
 from app.user.models import User
 from app.user.services.auth import AuthService
+from cli.management_command.counter_reconciliation import reconcile_topic_counters
 
 fake = Faker()
 log = logging.getLogger(__name__)
@@ -103,7 +112,7 @@ def _create_users(total_user: Any) -> bool:
     return True
 
 
-@timing
+@profiled(log=True)
 def create_users(n: int) -> None:
     for user in users:
         if User.exists({"username": user["username"]}) is False:
@@ -131,7 +140,13 @@ def create_topics(n: int) -> None:
 
     write_topics = [
         InsertOne(
-            Topic.to_mongo(Topic(name=value, slug=f"{slugify(value)}-{ObjectId()}"))
+            Topic.to_mongo(
+                Topic(
+                    name=value,
+                    normalized_name=normalize_topic_name(value),
+                    slug=f"{slugify(value)}-{ObjectId()}",
+                )
+            )
         )
         for idx, value in enumerate(data_set)
     ]
@@ -185,7 +200,7 @@ def _create_posts(total_post: Any) -> bool:
     return True
 
 
-@timing
+@profiled(log=True)
 def create_posts(n: int) -> None:
     numbers = get_range(n)
     with multiprocessing.Pool(processes=PROCESSORS) as pool:
@@ -194,44 +209,53 @@ def create_posts(n: int) -> None:
     log.info(f"{n} post inserted")
 
 
-def _create_reactions(total_reaction: Any) -> None:
+def _create_reactions(post_ids: list[Any]) -> None:
     user_ids = get_user_ids()
-    post_ids = get_post_ids()
 
-    total_post, total_user = len(post_ids), len(user_ids)
-    random.shuffle(post_ids)
+    total_user = len(user_ids)
     random.shuffle(user_ids)
 
     write_reactions = []
-    for i in range(total_reaction):
+    write_user_reactions = []
+    for post_id in post_ids:
         lo, hi = get_random_range(total_user, 20, 100)
-        write_reactions.append(
-            InsertOne(
-                Reaction.to_mongo(
-                    Reaction(
-                        post_id=post_ids[i % total_post],
-                        user_ids=user_ids[lo:hi],
-                    )
-                )
+        reacted_user_ids = user_ids[lo:hi]
+
+        for i in range(0, len(reacted_user_ids), REACTION_BUCKET_SIZE):
+            bucket_user_ids = reacted_user_ids[i : i + REACTION_BUCKET_SIZE]
+            bucket_id = ObjectId()
+            bucket = Reaction(
+                post_id=post_id, user_ids=bucket_user_ids, count=len(bucket_user_ids)
             )
-        )
-        if len(write_reactions) >= WRITE_OPS_LIMIT:
+            write_reactions.append(InsertOne({"_id": bucket_id, **bucket.to_mongo()}))
+            write_user_reactions += [
+                InsertOne(
+                    UserReaction(
+                        post_id=post_id, user_id=user_id, bucket_id=bucket_id
+                    ).to_mongo()
+                )
+                for user_id in bucket_user_ids
+            ]
+
+        if len(write_user_reactions) >= WRITE_OPS_LIMIT:
             Reaction.bulk_write(requests=write_reactions)
-            write_reactions = []
+            UserReaction.bulk_write(requests=write_user_reactions)
+            write_reactions, write_user_reactions = [], []
     if write_reactions:
         Reaction.bulk_write(requests=write_reactions)
-        write_reactions = []
+        UserReaction.bulk_write(requests=write_user_reactions)
 
 
-@timing
+@profiled(log=True)
 def create_reactions() -> None:
-    n = Post.count_documents()
+    post_ids = get_post_ids()
 
-    numbers = get_range(n)
+    # Every post is handled by a single process so no user reacts twice
+    chunks = [post_ids[i::PROCESSORS] for i in range(PROCESSORS)]
     with multiprocessing.Pool(processes=PROCESSORS) as pool:
-        _ = pool.map(_create_reactions, numbers)
+        _ = pool.map(_create_reactions, chunks)
 
-    log.info(f"{n} reaction inserted")
+    log.info(f"Reactions inserted for {len(post_ids)} post")
 
 
 def _create_comments(total_comment: Any) -> None:
@@ -273,7 +297,7 @@ def _create_comments(total_comment: Any) -> None:
         Comment.bulk_write(requests=write_comments)
 
 
-@timing
+@profiled(log=True)
 def create_comments() -> None:
     total_post = Post.count_documents()
     n = total_post // 3
@@ -286,7 +310,7 @@ def create_comments() -> None:
     log.info(f"{n} comment inserted")
 
 
-@timing
+@profiled(log=True)
 def populate_dummy_data(
     total_user: int = 100, total_post: int = 100, is_unittest: bool = False
 ) -> None:
@@ -298,6 +322,7 @@ def populate_dummy_data(
     create_users(total_user)
     create_topics(min(max(total_post // 10, 10), 100000))
     create_posts(total_post)
+    reconcile_topic_counters()
     if not is_unittest:
         create_reactions()
         create_comments()
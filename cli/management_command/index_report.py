@@ -0,0 +1,106 @@
+import logging
+from collections.abc import Mapping
+from typing import Any
+
+import typer
+from mongodb_odm import TEXT, Document
+
+# Import every model so that they are registered as Document subclasses
+from app.base import models as _base_models  # noqa: F401
+from app.post import models as _post_models  # noqa: F401
+from app.user import models as _user_models  # noqa: F401
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INDEX_NAME = "_id_"
+
+
+def _index_key(index: Mapping[str, Any]) -> tuple[tuple[str, Any], ...]:
+    key = dict(index["key"])
+
+    if "_fts" in key:
+        # MongoDB stores text indexes as {_fts, _ftsx} and keeps fields in weights
+        return tuple(sorted((field, TEXT) for field in index["weights"]))
+    if TEXT in key.values():
+        return tuple(sorted((field, TEXT) for field in key))
+
+    return tuple(key.items())
+
+
+def _get_declared_indexes(model: type[Document]) -> dict[str, tuple[Any, ...]]:
+    indexes = getattr(model.ODMConfig, "indexes", [])
+
+    return {index.document["name"]: _index_key(index.document) for index in indexes}
+
+
+def _get_live_indexes(model: type[Document]) -> dict[str, tuple[Any, ...]]:
+    collection = model._get_collection()
+
+    return {
+        index["name"]: _index_key(index)
+        for index in collection.list_indexes()
+        if index["name"] != DEFAULT_INDEX_NAME
+    }
+
+
+def _get_index_usage(model: type[Document]) -> dict[str, dict[str, Any]]:
+    collection = model._get_collection()
+
+    return {
+        stat["name"]: stat["accesses"]
+        for stat in collection.aggregate([{"$indexStats": {}}])
+    }
+
+
+def get_index_report(model: type[Document]) -> dict[str, Any]:
+    """
+    Compare the indexes declared in ODMConfig with the indexes of the collection.
+    Usage comes from $indexStats, which is reset when the server restarts.
+    """
+    declared = _get_declared_indexes(model)
+    live = _get_live_indexes(model)
+    usage = _get_index_usage(model)
+
+    live_keys = set(live.values())
+    declared_keys = set(declared.values())
+
+    missing = [name for name, key in declared.items() if key not in live_keys]
+    extra = [name for name, key in live.items() if key not in declared_keys]
+    unused = [
+        {"name": name, "since": usage[name]["since"]}
+        for name in live
+        if name in usage and usage[name]["ops"] == 0
+    ]
+
+    return {
+        "collection": model._get_collection_name(),
+        "missing": [{"name": name, "key": declared[name]} for name in missing],
+        "extra": [{"name": name, "key": live[name]} for name in extra],
+        "unused": unused,
+    }
+
+
+def print_index_report() -> bool:
+    """Print the report of all models, return False if anything needs attention."""
+    is_clean = True
+
+    for model in Document.__subclasses__():
+        report = get_index_report(model)
+
+        if not (report["missing"] or report["extra"] or report["unused"]):
+            typer.echo(f"{report['collection']}: OK")
+            continue
+
+        is_clean = False
+        typer.echo(f"{report['collection']}:")
+        for index in report["missing"]:
+            typer.echo(f"  missing: {index['name']} {index['key']}")
+        for index in report["extra"]:
+            typer.echo(f"  not declared: {index['name']} {index['key']}")
+        for index in report["unused"]:
+            typer.echo(f"  unused since {index['since']}: {index['name']}")
+
+    if not is_clean:
+        typer.echo("Run 'create-indexes' to apply the declared indexes.")
+
+    return is_clean
@@ -0,0 +1,267 @@
+"""
+Load test of the public API with a mix of reads, reaction toggles and logins.
+
+The requests are sent by `concurrency` virtual users over httpx, to a running
+server or in process to `app.main:app`, started by its lifespan. Every virtual
+user has its own random generator derived from `seed`, the same options replay
+the same sequence of requests. The result has p50/p95/p99 latency and
+throughput per endpoint and is written to JSON so runs can be compared.
+"""
+
+import asyncio
+import json
+import logging
+import random
+from contextlib import AbstractAsyncContextManager, nullcontext
+from datetime import datetime
+from time import perf_counter
+from typing import Any
+
+import typer
+from httpx import ASGITransport, AsyncClient
+from mongodb_odm import connect, disconnect
+
+from app.base import config
+from app.post.models import Post
+from cli.management_command.benchmark import get_percentiles
+from cli.management_command.data_population import populate_dummy_data, users
+
+log = logging.getLogger(__name__)
+
+V1_URL = "/api/v1"
+
+# Share of each scenario in the mix
+SCENARIOS: dict[str, int] = {
+    "feed": 35,
+    "feed_next_page": 10,
+    "post_details": 30,
+    "comments": 15,
+    "reaction_toggle": 7,
+    "login": 3,
+}
+MAX_SLUGS = 1000
+
+
+class LoadTestRun:
+    def __init__(self, client: AsyncClient, slugs: list[str], seed: int) -> None:
+        self.client = client
+        self.slugs = slugs
+        self.seed = seed
+
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.tokens: list[str] = []
+
+    async def request(self, name: str, method: str, url: str, **kwargs: Any) -> Any:
+        start = perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            is_error = response.status_code >= 400
+        except Exception as e:
+            log.warning(f"{method} {url} failed: {e}")
+            response, is_error = None, True
+
+        self.samples.setdefault(name, []).append(perf_counter() - start)
+        if is_error:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+    async def login(self, user: dict[str, str]) -> str | None:
+        response = await self.request(
+            "login",
+            "POST",
+            f"{V1_URL}/token",
+            json={"username": user["username"], "password": user["password"]},
+        )
+        if response is None or response.status_code != 200:
+            return None
+        return str(response.json()["access_token"])
+
+    async def run_scenario(self, name: str, rng: random.Random) -> None:
+        slug = rng.choice(self.slugs)
+        headers = {"Authorization": f"Bearer {rng.choice(self.tokens)}"}
+
+        if name == "feed":
+            await self.request(name, "GET", f"{V1_URL}/posts", params={"limit": 20})
+        elif name == "feed_next_page":
+            response = await self.request(
+                "feed", "GET", f"{V1_URL}/posts", params={"limit": 20}
+            )
+            after = response.json().get("after") if response is not None else None
+            if after and after != "None":
+                await self.request(
+                    name,
+                    "GET",
+                    f"{V1_URL}/posts",
+                    params={"limit": 20, "after": after},
+                )
+        elif name == "post_details":
+            await self.request(name, "GET", f"{V1_URL}/posts/{slug}")
+        elif name == "comments":
+            await self.request(name, "GET", f"{V1_URL}/posts/{slug}/comments")
+        elif name == "reaction_toggle":
+            url = f"{V1_URL}/posts/{slug}/reactions"
+            await self.request("reaction_add", "POST", url, headers=headers)
+            await self.request("reaction_remove", "DELETE", url, headers=headers)
+        elif name == "login":
+            await self.login(rng.choice(users))
+
+    async def virtual_user(self, index: int, deadline: float) -> None:
+        rng = random.Random(self.seed + index)
+        names, weights = list(SCENARIOS), list(SCENARIOS.values())
+
+        while perf_counter() < deadline:
+            await self.run_scenario(rng.choices(names, weights)[0], rng)
+
+
+def _summarize(samples: list[float], errors: int, duration: float) -> dict[str, Any]:
+    if not samples:
+        # Nothing finished in time
+        latency = {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    else:
+        # quantiles() needs two samples at least
+        latency = get_percentiles(samples if len(samples) > 1 else samples * 2)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "rps": len(samples) / duration,
+        **{key: round(value, 3) for key, value in latency.items()},
+    }
+
+
+def _print_report(report: dict[str, Any], previous: dict[str, Any] | None) -> None:
+    typer.echo(
+        f"{'endpoint':<18} {'requests':>9} {'errors':>7} {'req/s':>9} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    )
+    rows = {**report["endpoints"], "total": report["total"]}
+    previous_rows = {}
+    if previous:
+        previous_rows = {**previous["endpoints"], "total": previous["total"]}
+
+    for name, result in rows.items():
+        line = (
+            f"{name:<18} {result['requests']:>9} {result['errors']:>7} "
+            f"{result['rps']:>9.1f} {result['p50']:>9.2f} {result['p95']:>9.2f} "
+            f"{result['p99']:>9.2f}"
+        )
+        old = previous_rows.get(name)
+        if old:
+            line += (
+                f"  p95 {result['p95'] - old['p95']:+.2f}ms"
+                f" req/s {result['rps'] - old['rps']:+.1f}"
+            )
+        typer.echo(line)
+
+
+def seed_data(total_user: int, total_post: int) -> None:
+    """Populate the database unless it already has the posts"""
+    if Post.count_documents() >= total_post:
+        log.info("Database is already populated")
+        return
+
+    populate_dummy_data(total_user=total_user, total_post=total_post)
+
+
+def get_published_slugs() -> list[str]:
+    post_filter = {"publish_at": {"$ne": None, "$lte": datetime.now()}}
+    return [
+        post["slug"]
+        for post in Post.find_raw(post_filter, projection={"slug": 1}, limit=MAX_SLUGS)
+    ]
+
+
+def load_test(
+    base_url: str | None,
+    duration: float,
+    concurrency: int,
+    seed: int,
+    output: str,
+    compare: str | None = None,
+) -> None:
+    """Without `base_url` the requests go to app.main:app in this process"""
+    slugs = get_published_slugs()
+    if not slugs:
+        typer.echo("No published post, run with --seed-data first.")
+        raise typer.Exit(code=1)
+
+    previous = None
+    if compare:
+        with open(compare) as file_object:
+            previous = json.load(file_object)
+
+    report: dict[str, Any] = {}
+
+    async def main() -> None:
+        lifespan: AbstractAsyncContextManager[Any] = nullcontext()
+        if base_url:
+            client = AsyncClient(base_url=base_url, timeout=30)
+        else:
+            from app.main import app
+
+            # ASGITransport does not run the lifespan, without it the pools,
+            # counter buffers and catalogs the app relies on are not started
+            lifespan = app.router.lifespan_context(app)
+            client = AsyncClient(
+                transport=ASGITransport(app=app), base_url="http://test", timeout=30
+            )
+
+        async with lifespan, client:
+            run = LoadTestRun(client, slugs, seed)
+            for user in users:
+                token = await run.login(user)
+                if token:
+                    run.tokens.append(token)
+            if not run.tokens:
+                typer.echo("Login failed, the seeded users are missing.")
+                raise typer.Exit(code=1)
+            # The logins above are setup, not load
+            run.samples.clear()
+            run.errors.clear()
+
+            start = perf_counter()
+            await asyncio.gather(
+                *[
+                    run.virtual_user(index, start + duration)
+                    for index in range(concurrency)
+                ]
+            )
+            elapsed = perf_counter() - start
+
+        all_samples = [sample for samples in run.samples.values() for sample in samples]
+        report.update(
+            {
+                "started_at": datetime.now().isoformat(),
+                "options": {
+                    "base_url": base_url or "in-process",
+                    "duration": duration,
+                    "concurrency": concurrency,
+                    "seed": seed,
+                    "scenarios": SCENARIOS,
+                },
+                "duration": elapsed,
+                "endpoints": {
+                    name: _summarize(samples, run.errors.get(name, 0), elapsed)
+                    for name, samples in sorted(run.samples.items())
+                },
+                "total": _summarize(all_samples, sum(run.errors.values()), elapsed),
+            }
+        )
+
+    # httpx logs every request
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if base_url:
+        asyncio.run(main())
+    else:
+        # The lifespan opens its own async connection
+        disconnect()
+        try:
+            asyncio.run(main())
+        finally:
+            connect(config.MONGO_URL)
+
+    with open(output, "w") as file_object:
+        json.dump(report, file_object, indent=2)
+
+    _print_report(report, previous)
+    typer.echo(f"Report written to {output}")
@@ -0,0 +1,256 @@
+import hashlib
+import logging
+import os
+import shutil
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any
+from uuid import uuid4
+
+from mongodb_odm import Document, UpdateOne
+from pymongo import ReturnDocument
+
+from app.base.config import MEDIA_ROOT
+from app.base.models import MediaFile
+from app.base.services.image import DERIVATIVE_FOLDER
+from app.base.services.media import (
+    MEDIA_URL,
+    TEMP_FOLDER,
+    get_content_path,
+    is_content_addressed,
+)
+from app.base.utils.file import IMAGE_TYPES, get_image_content_type
+from app.base.utils.storage import LocalStorage, get_storage
+from app.post.models import Post
+from app.user.models import User
+
+log = logging.getLogger(__name__)
+
+WRITE_OPS_LIMIT = 10000
+CHUNK_SIZE = 1024 * 1024
+
+# Fields that hold a media path
+MEDIA_REFERENCES: list[tuple[type[Document], str]] = [
+    (Post, "cover_image"),
+    (User, "image"),
+]
+
+
+def _iter_media_files() -> Any:
+    """Paths relative to MEDIA_ROOT"""
+    for root, _, file_names in os.walk(MEDIA_ROOT):
+        for file_name in file_names:
+            yield os.path.relpath(os.path.join(root, file_name), MEDIA_ROOT)
+
+
+def _hash_file(file_location: str) -> tuple[str, int, bytes]:
+    digest = hashlib.sha256()
+    size = 0
+    header = b""
+
+    with open(file_location, "rb") as file_object:
+        while chunk := file_object.read(CHUNK_SIZE):
+            if not header:
+                header = chunk[:16]
+            size += len(chunk)
+            digest.update(chunk)
+
+    return digest.hexdigest(), size, header
+
+
+def _migrate_file(file_path: str) -> str | None:
+    """Move a file to its content path, return the new url"""
+    file_location = f"{MEDIA_ROOT}/{file_path}"
+    sha256, size, header = _hash_file(file_location)
+
+    content_type = get_image_content_type(header)
+    if content_type is None:
+        log.warning(f"Skipped {file_path}, not a supported image")
+        return None
+
+    ext, _ = IMAGE_TYPES[content_type]
+    root_folder = file_path.split("/")[0]
+    media = MediaFile(
+        sha256=sha256,
+        path=MEDIA_URL + get_content_path(root_folder, sha256, ext),
+        size=size,
+        content_type=content_type,
+    )
+    media_dict = MediaFile._get_collection().find_one_and_update(
+        {"sha256": sha256},
+        {"$setOnInsert": media.to_mongo()},
+        projection={"path": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+
+    new_location = f"{MEDIA_ROOT}/{media_dict['path'].removeprefix(MEDIA_URL)}"
+    if os.path.exists(new_location):
+        os.remove(file_location)
+    else:
+        os.makedirs(os.path.dirname(new_location), exist_ok=True)
+        os.replace(file_location, new_location)
+
+    return str(media_dict["path"])
+
+
+def migrate_media() -> None:
+    """
+    Move the files saved with random names to their content path, the same
+    content is kept once. Post.cover_image and User.image are rewritten to
+    the new paths and the reference counts are recomputed.
+    """
+    migrated = 0
+    for file_path in list(_iter_media_files()):
+        if file_path.startswith((f"{TEMP_FOLDER}/", f"{DERIVATIVE_FOLDER}/")):
+            continue
+        if is_content_addressed(file_path):
+            continue
+
+        new_path = _migrate_file(file_path)
+        if new_path is None:
+            continue
+
+        old_path = MEDIA_URL + file_path
+        for model, field in MEDIA_REFERENCES:
+            model.update_many({field: old_path}, {"$set": {field: new_path}})
+        # Rendered again under the new path when they are requested
+        _remove_derivatives(file_path)
+        migrated += 1
+
+    log.info(f"{migrated} media file migrated")
+
+    count_media_references()
+
+
+def upload_media() -> None:
+    """
+    Copy the files under MEDIA_ROOT to the configured storage, the local files
+    are kept. Run it once after switching MEDIA_STORAGE to s3.
+    """
+    storage = get_storage()
+    if isinstance(storage, LocalStorage):
+        log.info("MEDIA_STORAGE is local, nothing to upload")
+        return
+
+    uploaded = 0
+    for file_path in list(_iter_media_files()):
+        if file_path.startswith((f"{TEMP_FOLDER}/", f"{DERIVATIVE_FOLDER}/")):
+            continue
+        if storage.exists(file_path):
+            continue
+
+        file_location = f"{MEDIA_ROOT}/{file_path}"
+        with open(file_location, "rb") as file_object:
+            content_type = get_image_content_type(file_object.read(16))
+
+        # save() moves the file, upload a copy
+        temp_location = f"{MEDIA_ROOT}/{TEMP_FOLDER}/{uuid4().hex}.part"
+        os.makedirs(os.path.dirname(temp_location), exist_ok=True)
+        shutil.copyfile(file_location, temp_location)
+        storage.save(
+            file_path, temp_location, content_type or "application/octet-stream"
+        )
+        uploaded += 1
+
+    log.info(f"{uploaded} media file uploaded")
+
+
+def count_media_references() -> None:
+    """Recompute MediaFile.ref_count, only mismatched files are written"""
+    references: Counter[str] = Counter()
+    for model, field in MEDIA_REFERENCES:
+        pipeline = [
+            {"$match": {field: {"$type": "string"}}},
+            {"$group": {"_id": f"${field}", "total": {"$sum": 1}}},
+        ]
+        for obj in model.aggregate(pipeline, get_raw=True):
+            references[obj["_id"]] += obj["total"]
+
+    updated = 0
+    write_media = []
+    for media in MediaFile.find_raw(projection={"path": 1, "ref_count": 1}):
+        ref_count = references.get(media["path"], 0)
+        if media.get("ref_count") == ref_count:
+            continue
+
+        write_media.append(
+            UpdateOne({"_id": media["_id"]}, {"$set": {"ref_count": ref_count}})
+        )
+        if len(write_media) >= WRITE_OPS_LIMIT:
+            updated += MediaFile.bulk_write(requests=write_media).modified_count
+            write_media = []
+    if write_media:
+        updated += MediaFile.bulk_write(requests=write_media).modified_count
+
+    log.info(f"{updated} media reference count fixed")
+
+
+def _remove_derivatives(file_path: str) -> None:
+    shutil.rmtree(f"{MEDIA_ROOT}/{DERIVATIVE_FOLDER}/{file_path}", ignore_errors=True)
+
+
+def _is_orphan_derivative(file_path: str) -> bool:
+    """Derivative of an original that no longer exists"""
+    if not file_path.startswith(f"{DERIVATIVE_FOLDER}/"):
+        return False
+
+    source_path = file_path.removeprefix(f"{DERIVATIVE_FOLDER}/").rpartition("/")[0]
+    return not os.path.exists(f"{MEDIA_ROOT}/{source_path}")
+
+
+def _remove_if_older(file_location: str, cutoff: datetime) -> bool:
+    if datetime.fromtimestamp(os.path.getmtime(file_location)) >= cutoff:
+        return False
+
+    os.remove(file_location)
+    return True
+
+
+def collect_media_garbage(grace_hours: int) -> None:
+    """
+    Delete the media files that no post or user references, with their
+    derivatives. Files touched in the last `grace_hours` are kept, they may be
+    uploads not yet attached.
+    """
+    count_media_references()
+
+    cutoff = datetime.now() - timedelta(hours=grace_hours)
+    orphan_filter = {"ref_count": {"$lte": 0}, "updated_at": {"$lt": cutoff}}
+
+    deleted = 0
+    for media in MediaFile.find_raw(orphan_filter, projection={"path": 1}):
+        # An upload of the same content in the meantime touches updated_at
+        result = MediaFile._get_collection().delete_one(
+            {"_id": media["_id"], **orphan_filter}
+        )
+        if result.deleted_count == 0:
+            continue
+
+        file_path = media["path"].removeprefix(MEDIA_URL)
+        get_storage().delete(file_path)
+        _remove_derivatives(file_path)
+        deleted += 1
+
+    # Files without a MediaFile, leftovers of failed uploads and derivatives
+    # of the files deleted before
+    known_paths = {
+        media["path"] for media in MediaFile.find_raw(projection={"path": 1})
+    }
+    for file_path in list(_iter_media_files()):
+        is_temp = file_path.startswith(f"{TEMP_FOLDER}/")
+        is_unknown = (
+            is_content_addressed(file_path) and MEDIA_URL + file_path not in known_paths
+        )
+        if (is_temp or is_unknown) and _remove_if_older(
+            f"{MEDIA_ROOT}/{file_path}", cutoff
+        ):
+            _remove_derivatives(file_path)
+            deleted += 1
+        elif _is_orphan_derivative(file_path):
+            # Already gone when its original was deleted above
+            if os.path.exists(f"{MEDIA_ROOT}/{file_path}"):
+                os.remove(f"{MEDIA_ROOT}/{file_path}")
+                deleted += 1
+
+    log.info(f"{deleted} media file deleted")
@@ -0,0 +1,92 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Any
+
+from mongodb_odm import InsertOne
+from pymongo.errors import BulkWriteError
+
+from app.post.models import Reaction, UserReaction
+
+log = logging.getLogger(__name__)
+
+WRITE_OPS_LIMIT = 10000
+# A create still running has a pending user_reaction for a moment only
+PENDING_TIMEOUT = timedelta(minutes=5)
+
+
+def _insert_user_reactions(write_user_reactions: list[Any]) -> int:
+    try:
+        result = UserReaction.bulk_write(requests=write_user_reactions, ordered=False)
+        return result.inserted_count
+    except BulkWriteError as e:
+        # Duplicates are expected when a user ended up in more than one bucket
+        return e.details["nInserted"]
+
+
+def migrate_reactions() -> None:
+    """
+    Add `count` and the user_reaction documents to the reaction buckets
+    that were created before they existed. Safe to run more than once.
+    """
+    legacy_filter = {"count": {"$exists": False}}
+
+    inserted = 0
+    write_user_reactions = []
+    for bucket in Reaction.find_raw(
+        legacy_filter, projection={"post_id": 1, "user_ids": 1}
+    ):
+        for user_id in bucket.get("user_ids", []):
+            write_user_reactions.append(
+                InsertOne(
+                    UserReaction(
+                        post_id=bucket["post_id"],
+                        user_id=user_id,
+                        bucket_id=bucket["_id"],
+                    ).to_mongo()
+                )
+            )
+        if len(write_user_reactions) >= WRITE_OPS_LIMIT:
+            inserted += _insert_user_reactions(write_user_reactions)
+            write_user_reactions = []
+    if write_user_reactions:
+        inserted += _insert_user_reactions(write_user_reactions)
+
+    result = Reaction.update_many(
+        legacy_filter,
+        [{"$set": {"count": {"$size": "$user_ids"}}}],  # type: ignore
+    )
+
+    log.info(f"{inserted} user reaction created")
+    log.info(f"{result.modified_count} reaction bucket updated")
+
+
+def repair_reactions() -> None:
+    """
+    Finish or remove the user_reaction documents left without a bucket_id by
+    a process that died while creating them. A user already in a bucket
+    keeps the reaction, otherwise the document is removed. Run
+    reconcile-counters after to fix total_reaction.
+    """
+    cutoff = datetime.now() - PENDING_TIMEOUT
+
+    completed = deleted = 0
+    for user_reaction in UserReaction.find_raw(
+        {"bucket_id": None, "created_at": {"$lt": cutoff}},
+        projection={"post_id": 1, "user_id": 1},
+    ):
+        buckets = Reaction.find_raw(
+            {"post_id": user_reaction["post_id"], "user_ids": user_reaction["user_id"]},
+            projection={"_id": 1},
+            limit=1,
+        )
+        bucket = next(buckets, None)
+        if bucket is None:
+            UserReaction.delete_one({"_id": user_reaction["_id"]})
+            deleted += 1
+        else:
+            UserReaction.update_one(
+                {"_id": user_reaction["_id"]}, {"$set": {"bucket_id": bucket["_id"]}}
+            )
+            completed += 1
+
+    log.info(f"{completed} user reaction completed, {deleted} deleted")
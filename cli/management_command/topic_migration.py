@@ -0,0 +1,70 @@
+import logging
+from typing import Any
+
+from mongodb_odm import UpdateOne
+
+from app.post.models import Post, Topic
+from app.post.utils import normalize_topic_name
+from cli.management_command.counter_reconciliation import reconcile_topic_counters
+
+log = logging.getLogger(__name__)
+
+WRITE_OPS_LIMIT = 10000
+
+
+def _merge_topics(keeper_id: Any, duplicate_ids: list[Any]) -> int:
+    """Move the posts of the duplicates to `keeper_id` and delete the duplicates"""
+    Post.update_many(
+        {"topic_ids": {"$in": duplicate_ids}},
+        {"$addToSet": {"topic_ids": keeper_id}},
+    )
+    Post.update_many(
+        {"topic_ids": {"$in": duplicate_ids}},
+        {"$pull": {"topic_ids": {"$in": duplicate_ids}}},
+    )
+
+    return Topic.delete_many({"_id": {"$in": duplicate_ids}}).deleted_count
+
+
+def migrate_topics() -> None:
+    """
+    Set normalized_name on the topics created before it existed. Topics whose
+    names only differ by case or spaces are merged into one, the one already
+    migrated or else the oldest. total_post of the topics is recomputed
+    after a merge. Safe to run more than once.
+    """
+    groups: dict[str, list[dict[str, Any]]] = {}
+    projection = {"name": 1, "normalized_name": 1}
+    for topic in Topic.find_raw(projection=projection, sort=[("_id", 1)]):
+        groups.setdefault(normalize_topic_name(topic["name"]), []).append(topic)
+
+    merged = 0
+    updated = 0
+    write_topics = []
+    for normalized_name, topics in groups.items():
+        keeper = next(
+            (topic for topic in topics if topic.get("normalized_name")), topics[0]
+        )
+        duplicate_ids = [topic["_id"] for topic in topics if topic is not keeper]
+        if duplicate_ids:
+            merged += _merge_topics(keeper["_id"], duplicate_ids)
+
+        if keeper.get("normalized_name") != normalized_name:
+            write_topics.append(
+                UpdateOne(
+                    {"_id": keeper["_id"]},
+                    {"$set": {"normalized_name": normalized_name}},
+                )
+            )
+        if len(write_topics) >= WRITE_OPS_LIMIT:
+            updated += Topic.bulk_write(requests=write_topics).modified_count
+            write_topics = []
+    if write_topics:
+        updated += Topic.bulk_write(requests=write_topics).modified_count
+
+    log.info(f"{merged} duplicate topic merged")
+    log.info(f"{updated} topic migrated")
+
+    # The posts of the duplicates are counted by the kept topic now
+    if merged:
+        reconcile_topic_counters()